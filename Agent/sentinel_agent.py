@@ -1,22 +1,29 @@
+import time
+STARTUP_START = time.perf_counter() # v3.3: Measured against sentinel_lazy.IMPORT_BUDGET_MS
 import sys
 import os
 import json
-import re
-import time
-from PIL import Image, ImageGrab
-from llama_cpp import Llama
-import pyautogui
-import pyperclip
+import argparse
+import sentinel_lazy
 import sentinel_memory
-import pygetwindow as gw
-import psutil
 
-try:
-    import win32process
-    import win32gui
-    PYWIN32_INSTALLED = True
-except ImportError:
-    PYWIN32_INSTALLED = False
+# v3.3: Heavy modules are executed on first use, not at startup
+pyautogui = sentinel_lazy.lazy_import('pyautogui')
+pyperclip = sentinel_lazy.lazy_import('pyperclip')
+sentinel_inference = sentinel_lazy.lazy_import('sentinel_inference')
+sentinel_locator = sentinel_lazy.lazy_import('sentinel_locator')
+sentinel_crops = sentinel_lazy.lazy_import('sentinel_crops')
+sentinel_capture = sentinel_lazy.lazy_import('sentinel_capture')
+sentinel_runtime = sentinel_lazy.lazy_import('sentinel_runtime')
+sentinel_tasks = sentinel_lazy.lazy_import('sentinel_tasks')
+asyncio = sentinel_lazy.lazy_import('asyncio')
+gw = sentinel_lazy.lazy_import('pygetwindow')
+psutil = sentinel_lazy.lazy_import('psutil')
+
+PYWIN32_INSTALLED = sentinel_lazy.is_installed('win32process')
+if PYWIN32_INSTALLED:
+    win32process = sentinel_lazy.lazy_import('win32process')
+    win32gui = sentinel_lazy.lazy_import('win32gui')
 
 # --- 1. CONFIGURATION (Loaded from JSON) ---
 try:
@@ -26,9 +33,16 @@ try:
     MODEL_PATH = config['model_path']
     DB_PATH = config['db_path']
     SCREENSHOT_FILE = config['screenshot_file']
+    # v2.8: Screenshots stay in memory; files are written only for debugging.
+    DEBUG_SCREENSHOTS = config.get('debug_screenshots', False)
+    debug_writer = None # v3.3: Created by start_runtime()
+    # v3.0: 'window' (default), 'monitor' or 'desktop'
+    CAPTURE_SCOPE = config.get('capture_scope', 'window')
     
-    memory = sentinel_memory.Memory(DB_PATH)
-    llm = None # v2.3: AI model will be loaded in main()
+    # v3.2: "numpy" (built-in index) or "chroma"
+    memory = sentinel_memory.Memory(DB_PATH, vector_backend=config.get('vector_backend', 'chroma'))
+    locate_cache = None # v3.1: Skip the model for unchanged screens (see start_runtime())
+    eyes = None # v2.6: Inference daemon client (or in-process engine), set in main()
     
 except FileNotFoundError:
     print("ERROR: sentinel_config.json not found.")
@@ -37,44 +51,46 @@ except KeyError as e:
     print(f"ERROR: Config file is missing a key: {e}")
     sys.exit(1)
 
-# --- 2. PROMPTS (v2.5 - Escaped Braces Fix) ---
-VISION_PROMPT_FIND = (
-    "USER: [Image]Look at this screenshot of a computer screen. "
-    "I am looking for the <{target_description}>. "
-    "What are its absolute center (x, y) coordinates? "
-    "Respond ONLY with JSON: {{\"x\": <center_x>, \"y\": <center_y>}}"
-)
-
-VISION_PROMPT_GET_EMBEDDING = (
-    "USER: [Image]Look at this small, cropped image of a user interface element. "
-    "Generate a vector embedding for this image."
-)
-
 # -------------------------------------------
 
+def start_runtime():
+    """v3.3: Creates the capture-side helpers the first time they are needed."""
+    global debug_writer, locate_cache
+    if debug_writer is None:
+        debug_writer = sentinel_capture.DebugWriter(enabled=DEBUG_SCREENSHOTS)
+    if locate_cache is None:
+        locate_cache = sentinel_capture.LocateCache()
+
 def get_full_screenshot_path():
     return os.path.join(DB_PATH, SCREENSHOT_FILE)
 
 def take_screenshot(bbox=None):
-    """Takes a screenshot. If bbox is provided, crops to that region."""
-    full_path = get_full_screenshot_path()
-    print(f"Taking screenshot... saving to {full_path}")
+    """
+    Takes a screenshot. If bbox is provided, crops to that region.
+    v2.8: Returns an in-memory sentinel_capture.Frame (all screens).
+    """
+    print("Taking screenshot...")
+    start_runtime()
     try:
-        img = ImageGrab.grab(bbox=bbox, all_screens=True) # v2.1: Grab all screens
-        img.save(full_path)
-        return full_path
+        frame = sentinel_capture.grab(bbox)
+        debug_writer.submit(get_full_screenshot_path(), frame)
+        return frame
     except Exception as e:
         print(f"[EYES] Error: Could not take screenshot: {e}")
         return None
 
 def perceive_environment():
-    """Determines the currently active application and window."""
+    """
+    Determines the currently active application and window.
+    Returns (app_name, title, window_rect), window_rect being the
+    window's (left, top, right, bottom) in absolute screen coords.
+    """
     print("[PERCEIVE] Analyzing active window...")
     try:
         active_window = gw.getActiveWindow()
         if not active_window:
             print("[PERCEIVE] No active window found.")
-            return None, None
+            return None, None, None
         title = active_window.title
         pid = None
         if os.name == 'nt' and PYWIN32_INSTALLED:
@@ -85,140 +101,231 @@ def perceive_environment():
         
         if not pid:
              print(f"[PERCEIVE] Could not determine Process ID for window.")
-             return None, None
+             return None, None, None
         process = psutil.Process(pid)
         app_name = process.name()
+        window_rect = (active_window.left, active_window.top,
+                       active_window.right, active_window.bottom)
         print(f"[PERCEIVE] App: {app_name}, Title: {title}")
-        return app_name, title
+        return app_name, title, window_rect
     except Exception as e:
         print(f"[PERCEIVE] Error: Could not get active window: {e}")
-        return None, None
+        return None, None, None
+
+# --- v3.6: "HANDS" ---
+
+def click_at(x, y):
+    """Clicks at absolute screen coordinates. No easing: the UI sets the pace."""
+    pyautogui.click(x, y)
 
 # --- v2.3: "EYES" FUNCTIONS ---
 
 def load_ai_model():
-    """Loads the Llama model into memory."""
-    global llm
-    if llm:
-        return # Already loaded
-        
-    print(f"[EYES] Loading model... (This may take a moment)")
-    try:
-        llm = Llama(
-            model_path=MODEL_PATH,
-            n_ctx=2048,
-            n_batch=512,
-            logits_all=True,    # Needed for get_visual_embedding
-            embedding=True,     # Needed for get_visual_embedding
-            verbose=False
-        )
-        print("[EYES] Model loaded successfully.")
-    except Exception as e:
-        print(f"[EYES] CRITICAL ERROR: Failed to load model: {e}")
+    """
+    v2.6: Connects to the shared inference daemon (sentinel_inference.py).
+    Falls back to loading the model in-process if the daemon is not running.
+    """
+    global eyes
+    if eyes:
+        return # Already connected
+
+    eyes = sentinel_inference.connect(config, tag="[EYES]")
+    if eyes is None:
+        print("[EYES] CRITICAL ERROR: No inference daemon and model failed to load.")
         sys.exit(1)
 
-def find_target_on_screen(target_label, target_description):
+def find_target_on_screen(target_label, target_description, frame=None):
     """
     Takes a full-screen screenshot, asks the AI to find the target,
     and returns the (x, y) coordinates.
     """
     print(f"[EYES] Scanning for target: '{target_label}'...")
-    screenshot_path = take_screenshot() # Full screen
-    if not screenshot_path:
+    if frame is None:
+        frame = take_screenshot() # Full screen
+    if frame is None:
         return None, None
-        
-    prompt = VISION_PROMPT_FIND.format(target_description=target_description)
-    
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that responds in JSON."},
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"file://{screenshot_path}"}}
-            ]
-        }
-    ]
-    
-    try:
-        response = llm.create_chat_completion(messages=messages, max_tokens=100)
-        response_text = response['choices'][0]['message']['content'].strip()
-        print(f"[EYES] AI Response: {response_text}")
-        
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not json_match:
-            print("[EYES] Error: AI did not respond with valid JSON.")
-            return None, None
-            
-        coords = json.loads(json_match.group(0))
-        x, y = int(coords['x']), int(coords['y'])
-        
-        if x <= 0 or y <= 0:
-            raise ValueError(f"Invalid coordinates: ({x}, {y})")
-            
-        print(f"[EYES] Found '{target_label}' at ({x}, {y}).")
-        return x, y
-        
-    except Exception as e:
-        print(f"[EYES] Error during screen analysis: {e}")
+
+    # v3.1: Same label, same pixels around the last answer -> same answer
+    start_runtime()
+    cached = locate_cache.lookup(target_label, frame)
+    if cached:
+        print(f"[EYES] Screen unchanged around '{target_label}'. Reusing {cached}.")
+        return cached
+
+    # v2.9: Coarse-to-fine, mapped back to absolute screen coordinates
+    x, y = sentinel_inference.locate_coarse_to_fine(eyes, frame, target_description)
+    if x is None or y is None:
         return None, None
+    locate_cache.store(target_label, frame, x, y)
+
+    print(f"[EYES] Found '{target_label}' at ({x}, {y}).")
+    return x, y
 
-def get_visual_embedding(x, y):
+def get_visual_embedding(x, y, frame=None):
     """
     Takes a small, focused screenshot of a *known* target
-    and returns its vector embedding to be stored in memory.
+    and returns (embedding, crop_pixels) to be stored in memory.
+    v2.8: Pass the frame the target was found in to reuse its pixels.
     """
     print(f"[EYES] Learning target at ({x}, {y})...")
-    # Take a small 64x64 screenshot centered on the target
+    # A small 64x64 crop centered on the target
     crop_box = (x - 32, y - 32, x + 32, y + 32)
-    screenshot_path = take_screenshot(bbox=crop_box)
-    if not screenshot_path:
-        return None
-        
-    prompt = VISION_PROMPT_GET_EMBEDDING # No .format needed
-    
-    messages = [
-        {"role": "user",
-         "content": [
-            {"type": "text", "text": prompt},
-            {"type": "image_url", "image_url": {"url": f"file://{screenshot_path}"}}
-         ]}
-    ]
-    
-    try:
-        # v2.5 FIX: Change max_tokens=1 to 100
-        response = llm.create_chat_completion(messages=messages, max_tokens=100)
-        
-        # v2.5 DEBUG: Print the whole response
-        print(f"[EYES] Full Embedding Response: {response}")
-        
-        # Check for the embedding on the response object
-        if 'embedding' in response and response['embedding']:
-            embedding = response['embedding']
-            print(f"[EYES] Successfully generated embedding for target.")
-            return embedding
+    if frame is None:
+        frame = take_screenshot(bbox=crop_box)
+    if frame is None:
+        return None, None
+
+    crop = frame.crop_rgb(crop_box)
+    embedding = eyes.embed_crop(frame.encode_png(crop_box))
+    if embedding:
+        print(f"[EYES] Successfully generated embedding for target.")
+    return embedding, crop
+
+def learn_target(label, description, app_name, window_title, window_rect=None):
+    """Full-screen scan, embed and store. The slow path."""
+    print(f"Initiating full-screen scan to find and learn target...")
+
+    # v2.8: One grab for both the scan and the crop.
+    # v3.0: Scoped to the active window (see CAPTURE_SCOPE).
+    frame = take_screenshot(bbox=sentinel_capture.scope_bbox(window_rect, CAPTURE_SCOPE))
+    x, y = find_target_on_screen(label, description, frame=frame)
+
+    if x and y:
+        # 5. STORE
+        print(f"[BRAIN] Target found! Now learning what it looks like...")
+        embedding, crop = get_visual_embedding(x, y, frame=frame)
+
+        if embedding:
+            print(f"[BRAIN] Learning complete. Storing in memory...")
+            memory.store_visual_memory(
+                label=label,
+                embedding=embedding,
+                app_name=app_name,
+                window_title=window_title,
+                x=x,
+                y=y,
+                notes=f"First time learning {label}",
+                crop=crop,
+                window_rect=window_rect
+            )
         else:
-            print("[EYES] Error: Model response did not contain an embedding.")
-            return None
-            
-    except Exception as e:
-        print(f"[EYES] Error generating embedding: {e}")
-        return None
+            print("[BRAIN] Could not learn target (failed to get embedding).")
+    else:
+        print("[BRAIN] Full-screen scan failed. Could not find target.")
+
+def learn_scene(targets, app_name, window_title, window_rect=None):
+    """
+    v3.4: Learns many elements from ONE screenshot and ONE inference.
+    `targets` maps label -> description; None learns every interactable
+    element the model reports. Crops are embedded in one batch and stored
+    in one Memory transaction. The locate cache is seeded too, so later
+    find_target_on_screen() calls on this screen state skip the model.
+    Returns {label: (x, y)} for what was stored.
+    """
+    print(f"[BRAIN] Parsing the scene for {len(targets) if targets else 'all'} element(s)...")
+    frame = take_screenshot(bbox=sentinel_capture.scope_bbox(window_rect, CAPTURE_SCOPE))
+    if frame is None:
+        return {}
+
+    located = sentinel_inference.parse_scene_on_frame(eyes, frame, targets)
+    if not located:
+        print("[BRAIN] Scene parse found nothing.")
+        return {}
+
+    labels = list(located)
+    crop_boxes = [(x - 32, y - 32, x + 32, y + 32) for x, y in located.values()]
+    embeddings = eyes.embed_crops([frame.encode_png(box) for box in crop_boxes])
+
+    batch = []
+    for label, crop_box, embedding in zip(labels, crop_boxes, embeddings):
+        x, y = located[label]
+        locate_cache.store(label, frame, x, y)
+        if not embedding:
+            print(f"[BRAIN] Could not embed '{label}'. Skipping it.")
+            continue
+        batch.append({
+            'label': label,
+            'embedding': embedding,
+            'app_name': app_name,
+            'window_title': window_title,
+            'x': x,
+            'y': y,
+            'notes': "Learned by scene parse",
+            'crop': frame.crop_rgb(crop_box),
+            'window_rect': window_rect
+        })
+
+    memory.store_visual_memories(batch)
+    return {item['label']: (item['x'], item['y']) for item in batch}
 
 # -------------------------------------------
 
-def main():
-    print("--- Sentinel Agent v2.5 (Brain + Memory + Learning) ---")
-    
-    if not os.path.exists(MODEL_PATH):
-        print(f"ERROR: Model file not found at '{MODEL_PATH}'")
-        sys.exit(1)
+def lookup_fact(label, app_name):
+    """
+    v3.3: Prints what memory knows about one element. SQLite only: no
+    model, no screen capture, no vector store.
+    """
+    sentinel_lazy.check_import_budget(STARTUP_START, "[STARTUP]",
+                                      config.get('import_budget_ms', sentinel_lazy.IMPORT_BUDGET_MS))
+    start = time.perf_counter()
+    memory.init_db(open_vectors=False)
+    fact = memory.retrieve_fact_memory(label, app_name)
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+
+    if not fact:
+        print(f"[BRAIN] No memory for '{label}' in '{app_name}' ({elapsed_ms}ms).")
+        return False
+    print(f"[BRAIN] '{label}' in '{app_name}' ({elapsed_ms}ms):")
+    print(f"  > Last Known Coords: ({fact.last_known_x}, {fact.last_known_y})")
+    if fact.window_x is not None:
+        print(f"  > Window-Relative Coords: ({fact.window_x}, {fact.window_y})")
+    if fact.notes:
+        print(f"  > Notes: {fact.notes}")
+    return True
 
+def run_scene(target_args):
+    """v3.4: `scene` command. target_args are 'label=description' strings."""
+    targets = None
+    if target_args:
+        bad = [arg for arg in target_args if "=" not in arg]
+        if bad:
+            print(f"ERROR: Targets must look like label=description, got: {', '.join(bad)}")
+            sys.exit(1)
+        targets = dict(arg.split("=", 1) for arg in target_args)
+
+    memory.init_db()
+    load_ai_model()
+    print("You have 3 seconds to switch to the target window...")
+    time.sleep(3)
+    app_name, window_title, window_rect = perceive_environment()
+    if not app_name:
+        print("[BRAIN] Perception failed. Cannot continue.")
+        return
+
+    learned = learn_scene(targets, app_name, window_title, window_rect)
+    for label, (x, y) in learned.items():
+        print(f"  > {label}: ({x}, {y})")
+    debug_writer.flush()
+
+def build_runtime():
+    """v3.5: The asyncio runtime, wired to this agent's stages."""
+    return sentinel_runtime.AgentRuntime(
+        memory,
+        perceive=perceive_environment,
+        capture=take_screenshot,
+        locate=find_target_on_screen,
+        embed=get_visual_embedding,
+        scope=CAPTURE_SCOPE
+    )
+
+def run_agent():
+    print("--- Sentinel Agent v3.6 (Brain + Memory + Learning) ---")
+    
     print(f"Initializing memory at: {DB_PATH}")
     memory.init_db()
-    load_ai_model() # v2.3: Load the AI model on start
+    load_ai_model() # v2.6: Connect to the daemon (or load the model) on start
     
-    print("[BRAIN] Sentinel Agent v2.5 initialized.")
+    print("[BRAIN] Sentinel Agent v3.6 initialized.")
     print("This agent will now attempt to find and learn a target.")
     
     # --- v2.3: THE NEW AGENT LOOP ---
@@ -230,56 +337,87 @@ def main():
     
     print(f"\n--- GOAL: Find '{TARGET_LABEL}' in '{TARGET_APP}' ---")
     
-    # 2. Perceive environment
     print("You have 3 seconds to switch to the target window (Google Gemini)...")
     time.sleep(3)
-    app_name, window_title = perceive_environment()
-    
-    if not app_name:
-        print("[BRAIN] Perception failed. Cannot continue.")
-        return
-        
-    if app_name != TARGET_APP:
-        print(f"[BRAIN] Active app is '{app_name}', not '{TARGET_APP}'. Aborting test.")
-        return
-        
-    # 3. Retrieve Memory
-    print(f"\n--- RETRIEVING MEMORY for '{TARGET_LABEL}' ---")
-    fact = memory.retrieve_fact_memory(TARGET_LABEL, app_name)
-    
-    if fact:
-        print(f"SUCCESS: Found memory for '{TARGET_LABEL}'!")
-        print(f"  > Last Known Coords: ({fact.last_known_x}, {fact.last_known_y})")
-        # TODO: Add verification logic here.
-        # "Go to (x,y), take a small picture, and verify it matches
-        # the vector in ChromaDB with id=fact.chroma_id"
+
+    # v3.5: Perceive -> recall -> pixels -> model -> learn, as overlapping
+    # asyncio stages (see sentinel_runtime.py)
+    run_steps([(TARGET_LABEL, TARGET_DESC)], expected_app=TARGET_APP)
+
+def run_steps(steps, expected_app=None):
+    """v3.5: Runs (label, description) steps on the asyncio runtime."""
+    runtime = build_runtime()
+    try:
+        return asyncio.run(runtime.run_steps(steps, expected_app=expected_app))
+    finally:
+        runtime.shutdown()
+        if debug_writer is not None:
+            debug_writer.flush()
+
+def run_find(target_args):
+    """v3.5: `find` command. target_args are 'label=description' strings."""
+    bad = [arg for arg in target_args if "=" not in arg]
+    if bad:
+        print(f"ERROR: Targets must look like label=description, got: {', '.join(bad)}")
+        sys.exit(1)
+    memory.init_db()
+    load_ai_model()
+    print("You have 3 seconds to switch to the target window...")
+    time.sleep(3)
+    results = run_steps([tuple(arg.split("=", 1)) for arg in target_args])
+    if not results or not all(result["source"] for result in results):
+        sys.exit(1)
+
+def run_task(plan_path):
+    """v3.6: `task` command. Runs a JSON/YAML plan (see sentinel_tasks.py)."""
+    plan = sentinel_tasks.load_plan(plan_path)
+    if plan is None:
+        sys.exit(1)
+    memory.init_db()
+    load_ai_model()
+    print(f"--- TASK: {plan.get('name', plan_path)} ({len(plan['steps'])} steps) ---")
+    print("You have 3 seconds to switch to the target window...")
+    time.sleep(3)
+
+    runtime = build_runtime()
+    runner = sentinel_tasks.TaskRunner(runtime, click=click_at, paste=pyperclip.paste)
+    try:
+        state = asyncio.run(runner.run(plan))
+    finally:
+        runtime.shutdown()
+        if debug_writer is not None:
+            debug_writer.flush()
+    if state is None:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentinel Agent")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="Find (and if needed learn) the test target. The default.")
+    lookup_parser = commands.add_parser("lookup", help="Print a stored fact without loading the model.")
+    lookup_parser.add_argument("label", help="Element label, e.g. 'gemini_copy_button'")
+    lookup_parser.add_argument("--app", default="chrome.exe", help="Process name (default: chrome.exe)")
+    find_parser = commands.add_parser("find", help="Find several elements in turn, pixels first.")
+    find_parser.add_argument("targets", nargs="+", metavar="LABEL=DESCRIPTION",
+                             help="Elements to find, in order.")
+    task_parser = commands.add_parser("task", help="Run a multi-step plan (e.g. tasks/gemini_copy_code.json).")
+    task_parser.add_argument("plan", help="Path to a .json (or .yaml) plan")
+    scene_parser = commands.add_parser("scene", help="Learn many elements from one screenshot.")
+    scene_parser.add_argument("targets", nargs="*", metavar="LABEL=DESCRIPTION",
+                              help="Elements to find. None = every interactable element.")
+    args = parser.parse_args()
+
+    if args.command == "lookup":
+        if not lookup_fact(args.label, args.app):
+            sys.exit(1)
+    elif args.command == "scene":
+        run_scene(args.targets)
+    elif args.command == "find":
+        run_find(args.targets)
+    elif args.command == "task":
+        run_task(args.plan)
     else:
-        # 4. LEARN (The "Troubleshoot" Step)
-        print(f"[BRAIN] No memory found for '{TARGET_LABEL}'.")
-        print(f"Initiating full-screen scan to find and learn target...")
-        
-        x, y = find_target_on_screen(TARGET_LABEL, TARGET_DESC)
-        
-        if x and y:
-            # 5. STORE
-            print(f"[BRAIN] Target found! Now learning what it looks like...")
-            embedding = get_visual_embedding(x, y)
-            
-            if embedding:
-                print(f"[BRAIN] Learning complete. Storing in memory...")
-                memory.store_visual_memory(
-                    label=TARGET_LABEL,
-                    embedding=embedding,
-                    app_name=app_name,
-                    window_title=window_title,
-                    x=x,
-                    y=y,
-                    notes=f"First time learning {TARGET_LABEL}"
-                )
-            else:
-                print("[BRAIN] Could not learn target (failed to get embedding).")
-        else:
-            print("[BRAIN] Full-screen scan failed. Could not find target.")
+        run_agent()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
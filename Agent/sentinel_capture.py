@@ -0,0 +1,312 @@
+import io
+import math
+import queue
+import threading
+import collections
+import numpy as np
+from PIL import Image
+
+# --- Sentinel Capture (v1.2) ---
+# One mss grab, held as ONE buffer. Frame wraps the raw BGRA bytes mss
+# hands back in a NumPy view; crops are views into it, and nothing is
+# PNG-encoded until a consumer (the model, a pop-up, a debug file)
+# actually asks for bytes. Debug files are written on a background
+# thread so they never sit on the teaching/lookup path.
+
+PNG_COMPRESS_LEVEL = 1 # Frames go to the model, not to an archive: favor speed
+
+# v1.2: Change detection
+TILE_SIZE = 32           # Side of one hashed screen tile, in pixels
+LOCATE_ROI_RADIUS = 96   # Half-size of the region that must be unchanged for a cache hit
+LOCATE_CACHE_ENTRIES = 256
+
+# Fixed odd multipliers, one per pixel position in a tile: a position-
+# sensitive multiply-add hash (mod 2**64) that NumPy can do in one pass.
+_TILE_WEIGHTS = (np.random.default_rng(0x5E47).integers(1, 2**62, size=(TILE_SIZE, TILE_SIZE),
+                                                       dtype=np.uint64) | np.uint64(1))
+
+# -------------------------------------------
+
+def scaled_size(size, max_side):
+    """(w, h) shrunk so the longer side is at most max_side (never enlarged)."""
+    width, height = size
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    ratio = max_side / max(width, height)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+class Frame:
+    """
+    A captured screen region. `left`/`top` are the absolute virtual-screen
+    coordinates of pixel (0, 0), so absolute <-> frame coords is one subtraction.
+    """
+    def __init__(self, bgra, left, top):
+        self.bgra = bgra # HxWx4 uint8, usually a view over mss's buffer
+        self.left = left
+        self.top = top
+
+    @classmethod
+    def from_mss(cls, sct_img):
+        # mss keeps the pixels in a bytearray; frombuffer shares it, no copy.
+        bgra = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+        return cls(bgra, sct_img.left, sct_img.top)
+
+    @property
+    def width(self):
+        return self.bgra.shape[1]
+
+    @property
+    def height(self):
+        return self.bgra.shape[0]
+
+    @property
+    def bbox(self):
+        return (self.left, self.top, self.left + self.width, self.top + self.height)
+
+    def region(self, bbox):
+        """BGRA view of an absolute (left, top, right, bottom) box, clipped to the frame."""
+        left, top, right, bottom = bbox
+        x0 = max(left - self.left, 0)
+        y0 = max(top - self.top, 0)
+        x1 = min(right - self.left, self.width)
+        y1 = min(bottom - self.top, self.height)
+        return self.bgra[y0:max(y0, y1), x0:max(x0, x1)]
+
+    def sub_frame(self, bbox):
+        """A Frame sharing this frame's buffer, clipped to `bbox`."""
+        left = max(bbox[0], self.left)
+        top = max(bbox[1], self.top)
+        return Frame(self.region(bbox), left, top)
+
+    def rgb(self, bbox=None):
+        """RGB view (channel-reversed, no copy) of the frame or a box of it."""
+        bgra = self.bgra if bbox is None else self.region(bbox)
+        return bgra[..., 2::-1]
+
+    def crop_rgb(self, bbox):
+        """
+        An owned HxWx3 copy of a box, zero-padded where the box leaves the
+        frame. Use for pixels that must outlive (or not see) later drawing.
+        """
+        left, top, right, bottom = bbox
+        out = np.zeros((bottom - top, right - left, 3), dtype=np.uint8)
+        view = self.rgb(bbox)
+        oy = max(self.top - top, 0)
+        ox = max(self.left - left, 0)
+        out[oy:oy + view.shape[0], ox:ox + view.shape[1]] = view
+        return out
+
+    def to_image(self, bbox=None):
+        """PIL RGB image of the frame or a box of it (decoded straight from BGRA)."""
+        bgra = np.ascontiguousarray(self.bgra if bbox is None else self.region(bbox))
+        size = (bgra.shape[1], bgra.shape[0])
+        return Image.frombuffer("RGB", size, bgra, "raw", "BGRX", 0, 1)
+
+    def encode_png(self, bbox=None, max_side=None):
+        """
+        PNG bytes, for consumers that really need an encoded image.
+        `max_side` downscales first (see scaled_size) for coarse passes.
+        """
+        img = self.to_image(bbox)
+        target = scaled_size(img.size, max_side)
+        if target != img.size:
+            img = img.resize(target, Image.BILINEAR, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+
+def grab(bbox=None):
+    """
+    Captures the whole virtual screen (bbox=None) or an absolute
+    (left, top, right, bottom) box of it into a Frame.
+    """
+    import mss
+    with mss.mss() as sct:
+        if bbox is None:
+            monitor = sct.monitors[0]
+        else:
+            left, top, right, bottom = bbox
+            monitor = {"left": left, "top": top, "width": right - left, "height": bottom - top}
+        return Frame.from_mss(sct.grab(monitor))
+
+def virtual_screen_bbox():
+    import mss
+    with mss.mss() as sct:
+        screen = sct.monitors[0]
+    return (screen["left"], screen["top"],
+            screen["left"] + screen["width"], screen["top"] + screen["height"])
+
+def monitor_bbox_for(rect):
+    """The bbox of the monitor holding the center of `rect` (or the whole desktop)."""
+    import mss
+    cx = (rect[0] + rect[2]) // 2
+    cy = (rect[1] + rect[3]) // 2
+    with mss.mss() as sct:
+        for mon in sct.monitors[1:]:
+            if mon["left"] <= cx < mon["left"] + mon["width"] and mon["top"] <= cy < mon["top"] + mon["height"]:
+                return (mon["left"], mon["top"], mon["left"] + mon["width"], mon["top"] + mon["height"])
+    return virtual_screen_bbox()
+
+def scope_bbox(window_rect, scope="window"):
+    """
+    v1.1: What to capture for a given active window.
+      'window'  -> the window's rectangle, clipped to the screen
+      'monitor' -> the monitor the window is on
+      'desktop' -> every monitor (None, the old behavior)
+    Falls back to the whole desktop when the window rect is unknown.
+    """
+    if window_rect is None or scope == "desktop":
+        return None
+    if scope == "monitor":
+        return monitor_bbox_for(window_rect)
+    screen = virtual_screen_bbox()
+    clipped = (max(window_rect[0], screen[0]), max(window_rect[1], screen[1]),
+               min(window_rect[2], screen[2]), min(window_rect[3], screen[3]))
+    if clipped[2] <= clipped[0] or clipped[3] <= clipped[1]:
+        return None # Minimized / off-screen window
+    return clipped
+
+def grab_region(bbox):
+    """
+    RGB array of exactly bbox's size, zero-padded where the box leaves
+    the virtual screen. This is the `grab` callback TieredLocator expects.
+    """
+    screen_bbox = virtual_screen_bbox()
+    clipped = (max(bbox[0], screen_bbox[0]), max(bbox[1], screen_bbox[1]),
+               min(bbox[2], screen_bbox[2]), min(bbox[3], screen_bbox[3]))
+    if clipped[2] <= clipped[0] or clipped[3] <= clipped[1]:
+        return np.zeros((bbox[3] - bbox[1], bbox[2] - bbox[0], 3), dtype=np.uint8)
+    return grab(clipped).crop_rgb(bbox)
+
+def draw_x_marker(frame, x, y, size=30, color=(255, 0, 0), stroke_width=5):
+    """Draws a red 'X' centered on absolute (x, y), in place, vectorized."""
+    cx, cy = x - frame.left, y - frame.top
+    reach = size + stroke_width
+    y0, y1 = max(cy - reach, 0), min(cy + reach + 1, frame.height)
+    x0, x1 = max(cx - reach, 0), min(cx + reach + 1, frame.width)
+    if y1 <= y0 or x1 <= x0:
+        return
+
+    yy, xx = np.ogrid[y0 - cy:y1 - cy, x0 - cx:x1 - cx]
+    half_width = stroke_width / math.sqrt(2) # Perpendicular distance -> axis distance
+    on_x = (((np.abs(xx - yy) <= half_width) | (np.abs(xx + yy) <= half_width))
+            & (np.abs(xx) <= size) & (np.abs(yy) <= size))
+    r, g, b = color
+    frame.bgra[y0:y1, x0:x1][on_x] = (b, g, r, 255)
+
+
+def tile_hashes(frame, bbox=None):
+    """
+    v1.2: 64-bit hash of every TILE_SIZE x TILE_SIZE tile of the frame (or
+    of an absolute box of it), as a (rows, cols) uint64 grid. Tiles are
+    aligned to the box's top-left; the alpha channel is ignored.
+    """
+    region = frame.bgra if bbox is None else frame.region(bbox)
+    height, width = region.shape[:2]
+    pixels = np.ascontiguousarray(region).view(np.uint32)[..., 0] & np.uint32(0x00FFFFFF)
+    pad_h, pad_w = -height % TILE_SIZE, -width % TILE_SIZE
+    if pad_h or pad_w:
+        pixels = np.pad(pixels, ((0, pad_h), (0, pad_w)))
+    rows, cols = pixels.shape[0] // TILE_SIZE, pixels.shape[1] // TILE_SIZE
+    blocks = pixels.reshape(rows, TILE_SIZE, cols, TILE_SIZE).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (blocks * _TILE_WEIGHTS[None, :, None, :]).sum(axis=(1, 3), dtype=np.uint64)
+
+def changed_tiles(before, after):
+    """Boolean grid of tiles that differ between two tile_hashes() grids."""
+    if before.shape != after.shape:
+        return np.ones(after.shape, dtype=bool)
+    return before != after
+
+
+class LocateCache:
+    """
+    v1.2: Remembers where a target was found, together with the hashes of
+    the screen tiles around it. If those tiles are unchanged in a later
+    frame, the previous answer is returned without running the model.
+    """
+    def __init__(self, roi_radius=LOCATE_ROI_RADIUS, max_entries=LOCATE_CACHE_ENTRIES):
+        self.roi_radius = roi_radius
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # label -> (roi_box, hashes, x, y)
+        self.hits = 0
+        self.misses = 0
+
+    def _roi_box(self, frame, x, y):
+        r = self.roi_radius
+        left, top, right, bottom = frame.bbox
+        return (max(x - r, left), max(y - r, top), min(x + r, right), min(y + r, bottom))
+
+    def lookup(self, label, frame):
+        """Returns the cached (x, y) for `label` if its region is unchanged, else None."""
+        entry = self._entries.get(label)
+        if entry is not None:
+            roi_box, hashes, x, y = entry
+            inside = (roi_box[0] >= frame.left and roi_box[1] >= frame.top and
+                      roi_box[2] <= frame.bbox[2] and roi_box[3] <= frame.bbox[3])
+            if inside and np.array_equal(tile_hashes(frame, roi_box), hashes):
+                self._entries.move_to_end(label)
+                self.hits += 1
+                return x, y
+        self.misses += 1
+        return None
+
+    def store(self, label, frame, x, y):
+        roi_box = self._roi_box(frame, x, y)
+        if roi_box[2] <= roi_box[0] or roi_box[3] <= roi_box[1]:
+            return # Target outside the frame, nothing to anchor on
+        self._entries[label] = (roi_box, tile_hashes(frame, roi_box), x, y)
+        self._entries.move_to_end(label)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, label=None):
+        if label is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(label, None)
+
+
+class DebugWriter:
+    """
+    Writes debug screenshots on a background thread. Callers hand over a
+    Frame, an RGB array or ready PNG bytes and must not modify it afterwards.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, path, image):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sentinel-debug-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((path, image))
+
+    def flush(self):
+        """Blocks until every submitted file is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            path, image = self._queue.get()
+            try:
+                if isinstance(image, Frame):
+                    data = image.encode_png()
+                elif isinstance(image, np.ndarray):
+                    buffer = io.BytesIO()
+                    Image.fromarray(image).save(buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+                    data = buffer.getvalue()
+                else:
+                    data = image
+                with open(path, "wb") as f:
+                    f.write(data)
+                print(f"[CAPTURE] Debug screenshot saved to: {path}")
+            except Exception as e:
+                print(f"[CAPTURE] Warning: Could not write debug screenshot {path}: {e}")
+            finally:
+                self._queue.task_done()
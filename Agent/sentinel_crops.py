@@ -0,0 +1,85 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+import sentinel_locator
+import sentinel_filelock
+
+# --- Sentinel Crop Pack (v1.0) ---
+# Raw uint8 pixels of every reference crop we have learned, appended to
+# ONE pack file and read back through a memory map. Blobs are
+# content-addressed (sha1 of shape + pixels), so re-teaching the same
+# element does not grow the pack. The index (digest -> offset, shape,
+# dhash, pyramid) lives in SQLite, see sentinel_memory.CropBlob.
+
+PACK_FILE_NAME = 'sentinel_crops.pack'
+PACK_LOCK_FILE_NAME = 'sentinel_crops.lock' # Held while a process appends to the pack
+PYRAMID_MIN_SIDE = 8 # Stop halving once a level would be smaller than this
+
+# -------------------------------------------
+
+def crop_digest(pixels):
+    """Content address of an HxWxC uint8 array."""
+    h = hashlib.sha1()
+    h.update(np.asarray(pixels.shape, dtype=np.int32).tobytes())
+    h.update(np.ascontiguousarray(pixels).tobytes())
+    return h.hexdigest()
+
+def crop_dhash(pixels):
+    """Precomputed 64-bit dHash of a crop, as 16 hex chars."""
+    bits = sentinel_locator.dhash(sentinel_locator.to_gray(pixels))
+    return np.packbits(bits).tobytes().hex()
+
+def dhash_from_hex(hex_hash):
+    """Inverse of crop_dhash(): hex -> bool array for hash_distance()."""
+    return np.unpackbits(np.frombuffer(bytes.fromhex(hex_hash), dtype=np.uint8)).astype(bool)
+
+def build_pyramid(pixels):
+    """Returns [level1, level2, ...], each half the size of the last."""
+    levels = []
+    img = Image.fromarray(pixels)
+    while min(img.width, img.height) // 2 >= PYRAMID_MIN_SIDE:
+        img = img.resize((img.width // 2, img.height // 2), Image.BOX)
+        levels.append(np.asarray(img))
+    return levels
+
+def as_rgb_array(img):
+    """PIL image or array -> contiguous HxWx3 uint8 array."""
+    if isinstance(img, Image.Image):
+        img = img.convert("RGB")
+    arr = np.asarray(img, dtype=np.uint8)
+    if arr.ndim == 2:
+        arr = np.stack([arr] * 3, axis=-1)
+    return np.ascontiguousarray(arr[..., :3])
+
+
+class CropPack:
+    """
+    Append-only pixel pack with memory-mapped reads. The agent and the
+    school append to the same pack, so appends hold a file lock too.
+    """
+    def __init__(self, db_path):
+        self.path = os.path.join(db_path, PACK_FILE_NAME)
+        self._lock = threading.Lock()
+        self._file_lock = sentinel_filelock.FileLock(os.path.join(db_path, PACK_LOCK_FILE_NAME))
+        self._map = None
+        self._map_size = 0
+
+    def append(self, pixels):
+        """Writes an array to the end of the pack. Returns its byte offset."""
+        data = np.ascontiguousarray(pixels, dtype=np.uint8).tobytes()
+        with self._lock, self._file_lock:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                return f.tell() - len(data) # Where this write landed, not where the file ended when opened
+
+    def read(self, offset, shape):
+        """Returns a read-only view of an array stored at `offset`."""
+        size = int(np.prod(shape))
+        with self._lock:
+            if self._map is None or offset + size > self._map_size:
+                # The pack grew since we mapped it (or never mapped): remap.
+                self._map_size = os.path.getsize(self.path)
+                self._map = np.memmap(self.path, dtype=np.uint8, mode='r', shape=(self._map_size,))
+            return self._map[offset:offset + size].reshape(shape)
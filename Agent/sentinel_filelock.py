@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+
+try:
+    import msvcrt # Windows
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# --- Sentinel File Lock (v1.0) ---
+# The agent and the school are separate processes writing the same memory
+# files (the numpy vector store, the crop pack). FileLock is an exclusive
+# lock on a small side file that every process opens by the same path:
+#
+#   lock = sentinel_filelock.FileLock(os.path.join(db_path, 'x.lock'))
+#   with lock:
+#       ...  # no other process (or thread) holding that path runs this
+#
+# It blocks until the holder lets go. The OS releases it if the holder
+# crashes, so a stale lock file is harmless.
+
+POLL_SECONDS = 0.01 # Windows: how often to retry a held lock
+
+# -------------------------------------------
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock() # The OS lock does not order this process's own threads
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+            if msvcrt is not None:
+                # LK_LOCK gives up after 10 seconds, so poll the non-blocking form instead
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(POLL_SECONDS)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if msvcrt is not None:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._thread_lock.release()
@@ -0,0 +1,903 @@
+import sys
+import os
+import json
+import re
+import base64
+import threading
+import queue
+import time
+import hashlib
+import collections
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Sentinel Inference Daemon (v1.6) ---
+# Owns ONE loaded Gemma 3 model and serves it to sentinel_agent and
+# sentinel_school over localhost HTTP, so neither tool pays the model
+# load on every run.
+#
+#   python sentinel_inference.py          (run in a dedicated terminal)
+#
+# Both entry points call connect(), which returns a thin client when the
+# daemon is up and falls back to an in-process InferenceEngine when not.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CLIENT_TIMEOUT_SECONDS = 120
+
+# v1.1: Request scheduler limits
+MAX_QUEUE_DEPTH = 64        # Pending requests before the daemon answers 503 "busy"
+MAX_BATCH_SIZE = 16         # Requests drained per scheduler pass
+DEFAULT_DEADLINE_SECONDS = 60
+BUSY_RETRIES = 3
+
+# v1.3: Coarse-to-fine locate. The fine tile matches Gemma 3's 896x896
+# vision input, so the projector sees it at native resolution.
+COARSE_MAX_SIDE = 1024
+FINE_TILE_SIZE = 896
+
+# v1.4: Scene parse. One image, many targets: reply tokens scale with
+# the number of elements, so the budget does too.
+# v1.6.1: Per target it is the label's own token count plus the entry
+# around it: Gemma spends a token per digit, so ': {"x": 1234, "y": 567}, '
+# alone is ~24 tokens. A reply cut off anyway keeps its complete entries
+# (see salvage_scene_entries).
+PARSE_ENTRY_TOKENS = 32
+PARSE_BASE_TOKENS = 16
+PARSE_ALL_MAX_TOKENS = 1024
+
+# v1.5: Projector outputs kept per image (see ImageEmbedCache)
+IMAGE_CACHE_MB = 512
+
+# v1.6: Token caps. Replies are grammar-constrained (see the schemas
+# below), so these only need to cover the exact JSON shape.
+LOCATE_MAX_TOKENS = 32
+VERIFY_MAX_TOKENS = 160
+VERIFY_REASON_MAX_CHARS = 240
+
+# --- PROMPTS (shared by every Sentinel entry point) ---
+VISION_PROMPT_FIND = (
+    "USER: [Image]Look at this screenshot of a computer screen. "
+    "I am looking for the <{target_description}>. "
+    "What are the (x, y) pixel coordinates of its center in this image? "
+    "Respond ONLY with JSON: {{\"x\": <center_x>, \"y\": <center_y>}}"
+)
+
+# v1.4: Scene parse, with a known target list or "everything clickable"
+VISION_PROMPT_PARSE_TARGETS = (
+    "USER: [Image]Look at this screenshot of a computer screen. "
+    "Find each of these elements:\n{target_list}\n"
+    "What are the (x, y) pixel coordinates of each element's center in this image? "
+    "Use null for an element that is not visible. "
+    "Respond ONLY with JSON mapping each label to its center: "
+    "{{\"<label>\": {{\"x\": <center_x>, \"y\": <center_y>}}, ...}}"
+)
+
+VISION_PROMPT_PARSE_ALL = (
+    "USER: [Image]Look at this screenshot of a computer screen. "
+    "List every interactable element (buttons, links, text fields, menus, tabs). "
+    "Give each a short, unique snake_case label such as 'copy_button'. "
+    "What are the (x, y) pixel coordinates of each element's center in this image? "
+    "Respond ONLY with JSON mapping each label to its center: "
+    "{{\"<label>\": {{\"x\": <center_x>, \"y\": <center_y>}}, ...}}"
+)
+
+# --- v1.6: RESPONSE SCHEMAS ---
+# Passed as response_format, which llama.cpp compiles to a GBNF grammar:
+# the model can only emit this exact object, and generation ends at its
+# closing brace.
+COORDS_SCHEMA = {
+    "type": "object",
+    "properties": {"x": {"type": "integer"}, "y": {"type": "integer"}},
+    "required": ["x", "y"]
+}
+
+VERIFY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "marker_x": {"type": "integer"},
+        "marker_y": {"type": "integer"},
+        "app_x": {"type": "integer"},
+        "app_y": {"type": "integer"},
+        "match": {"type": "boolean"},
+        "reason": {"type": "string", "maxLength": VERIFY_REASON_MAX_CHARS}
+    },
+    "required": ["marker_x", "marker_y", "app_x", "app_y", "match", "reason"]
+}
+
+def scene_schema(targets=None):
+    """v1.6: One (nullable) COORDS_SCHEMA per target label, or any labels at all."""
+    if targets:
+        return {
+            "type": "object",
+            "properties": {label: {"anyOf": [COORDS_SCHEMA, {"type": "null"}]} for label in targets},
+            "required": list(targets)
+        }
+    return {"type": "object", "additionalProperties": COORDS_SCHEMA}
+
+VISION_PROMPT_VERIFY_COORDS = (
+    "USER: [Image]Look at this screenshot of a user's entire desktop. "
+    "A large, red 'X' has been drawn to mark the user's mouse position. "
+    "Your goal is to verify this position. The user is also running a coordinate app. "
+    "1. Find the center of the large red 'X' marker. What are its (x, y) coordinates? "
+    "2. Find the coordinate application window (it has text like 'Physical', 'Scaled'). "
+    "3. Read the 'Physical' X and Y coordinates from that app. "
+    "4. The system reports the marker is at ({x}, {y}). Do the 'X' position and the app's 'Physical' coordinates BOTH closely match this system coordinate? "
+    "Respond ONLY with JSON: "
+    "{{\"marker_x\": <found_marker_x>, \"marker_y\": <found_marker_y>, \"app_x\": <read_app_x>, \"app_y\": <read_app_y>, \"match\": <true_or_false>, \"reason\": \"<your_analysis>\"}}"
+)
+
+# -------------------------------------------
+
+def image_uri(img_bytes):
+    """Wraps PNG bytes in a data URI for the chat handler."""
+    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+    return f"data:image/png;base64,{img_base64}"
+
+def extract_json(response_text):
+    """Pulls the first {...} block out of a model reply, or None."""
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        return None
+    return json.loads(json_match.group(0))
+
+
+# v1.6.1: One complete '"label": {"x": N, "y": N}' entry of a scene reply
+SCENE_ENTRY_PATTERN = re.compile(
+    r'"((?:[^"\\]|\\.)*)"\s*:\s*\{\s*"x"\s*:\s*(-?\d+)\s*,\s*"y"\s*:\s*(-?\d+)\s*\}')
+
+def salvage_scene_entries(response_text):
+    """
+    v1.6.1: The complete entries of a scene reply that was cut off
+    mid-JSON (e.g. at max_tokens), as {label: {"x": .., "y": ..}}.
+    """
+    data = {}
+    for label, x, y in SCENE_ENTRY_PATTERN.findall(response_text):
+        data[json.loads(f'"{label}"')] = {"x": int(x), "y": int(y)}
+    return data
+
+def parse_scene_reply(data, targets=None, tag="[EYES]"):
+    """
+    v1.4: {label: {"x": .., "y": ..}} from the model -> {label: (x, y)}.
+    Drops nulls, malformed entries, non-positive coordinates and (when
+    `targets` is given) labels that were not asked for.
+    """
+    elements = {}
+    for label, coords in data.items():
+        if targets and label not in targets:
+            continue
+        try:
+            x, y = int(coords['x']), int(coords['y'])
+        except (TypeError, KeyError, ValueError):
+            continue
+        if x > 0 and y > 0:
+            elements[label] = (x, y)
+    missing = [label for label in (targets or {}) if label not in elements]
+    if missing:
+        print(f"{tag} Scene parse could not place: {', '.join(missing)}")
+    return elements
+
+
+class ImageEmbedCache:
+    """
+    v1.5: LRU of projector outputs (llava_image_embed pointers), keyed by
+    the sha1 of the encoded image. Frames are PNG-encoded deterministically,
+    so same pixels -> same key. Bounded by the size of the image tokens
+    (n_image_pos * dim float32s); evicted embeds are freed. The newest
+    entry is never evicted, so a pointer just handed out stays valid
+    until the next encode.
+    """
+    def __init__(self, llava, dim, max_bytes=IMAGE_CACHE_MB * 1024 * 1024):
+        self._llava = llava
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict() # digest -> (embed, nbytes)
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, clip_ctx, img_bytes, n_threads):
+        """Returns the (cached) llava_image_embed for img_bytes. Do not free it."""
+        import ctypes
+
+        key = hashlib.sha1(img_bytes).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+            data = (ctypes.c_ubyte * len(img_bytes)).from_buffer_copy(img_bytes)
+            image_embed = self._llava.llava_image_embed_make_with_bytes(
+                clip_ctx, n_threads, data, len(img_bytes)
+            )
+            if not image_embed:
+                raise RuntimeError("Projector could not encode image.")
+            nbytes = image_embed.contents.n_image_pos * self.dim * 4
+            self._entries[key] = (image_embed, nbytes)
+            self.bytes_used += nbytes
+
+            while self.bytes_used > self.max_bytes and len(self._entries) > 1:
+                _, (old_embed, old_bytes) = self._entries.popitem(last=False)
+                self._llava.llava_image_embed_free(old_embed)
+                self.bytes_used -= old_bytes
+            return image_embed
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "mb_used": round(self.bytes_used / (1024 * 1024), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0
+            }
+
+
+def cached_chat_handler(mmproj_path):
+    """
+    v1.5: A llama-cpp-python multimodal chat handler whose image encodes
+    go through InferenceEngine's ImageEmbedCache (set as .image_cache
+    after the model loads), so asking several questions about one frame,
+    or retrying one, runs the projector once. Uses Gemma3ChatHandler when
+    this llama-cpp-python has it, else Llava15ChatHandler.
+    """
+    try:
+        from llama_cpp.llama_chat_format import Gemma3ChatHandler as BaseHandler
+    except ImportError:
+        from llama_cpp.llama_chat_format import Llava15ChatHandler as BaseHandler
+
+    class CachedChatHandler(BaseHandler):
+        image_cache = None
+
+        def _embed_image_bytes(self, image_bytes, n_threads_batch=1):
+            if self.image_cache is None:
+                return super()._embed_image_bytes(image_bytes, n_threads_batch)
+            return self.image_cache.encode(self.clip_ctx, image_bytes, n_threads_batch)
+
+    return CachedChatHandler(clip_model_path=mmproj_path, verbose=False)
+
+
+class ImageEmbedder:
+    """
+    v1.2: Encodes a crop through the mmproj (CLIP) projector ONLY.
+    No prompt, no text generation: the image tokens the projector
+    produces are mean-pooled and L2-normalized into one fixed-size
+    float32 vector. Same pixels in, same vector out.
+    v1.5: Pass the chat handler's `clip_ctx` and `image_cache` to share
+    one projector (and its cached outputs) with the chat path.
+    """
+    def __init__(self, mmproj_path, dim, n_threads=None, tag="[EYES]", clip_ctx=None, image_cache=None):
+        self.mmproj_path = mmproj_path
+        self.dim = dim # Projector output width == the LLM's n_embd
+        self.n_threads = n_threads or max(1, (os.cpu_count() or 2) // 2)
+        self.tag = tag
+        self.clip_ctx = clip_ctx
+        self.image_cache = image_cache
+        self._llava = None
+
+    def load(self):
+        if self.clip_ctx:
+            from llama_cpp import llava_cpp
+            self._llava = llava_cpp
+            return True
+        try:
+            from llama_cpp import llava_cpp
+            self._llava = llava_cpp
+            self.clip_ctx = llava_cpp.clip_model_load(self.mmproj_path.encode('utf-8'), 0)
+            if not self.clip_ctx:
+                raise RuntimeError("clip_model_load returned NULL")
+            return True
+        except Exception as e:
+            print(f"{self.tag} CRITICAL ERROR: Failed to load image projector: {e}")
+            return False
+
+    def embed(self, img_bytes):
+        """Returns a unit-length float32 numpy vector of length self.dim."""
+        import ctypes
+        import numpy as np
+
+        if self.image_cache is not None:
+            image_embed = self.image_cache.encode(self.clip_ctx, img_bytes, self.n_threads)
+        else:
+            data = (ctypes.c_ubyte * len(img_bytes)).from_buffer_copy(img_bytes)
+            image_embed = self._llava.llava_image_embed_make_with_bytes(
+                self.clip_ctx, self.n_threads, data, len(img_bytes)
+            )
+            if not image_embed:
+                raise RuntimeError("Projector could not encode image.")
+        try:
+            n_pos = image_embed.contents.n_image_pos
+            tokens = np.ctypeslib.as_array(image_embed.contents.embed, shape=(n_pos * self.dim,))
+            vector = tokens.reshape(n_pos, self.dim).mean(axis=0, dtype=np.float32)
+        finally:
+            if self.image_cache is None: # Cached embeds are owned by the cache
+                self._llava.llava_image_embed_free(image_embed)
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class InferenceEngine:
+    """
+    The in-process "Eyes": one Llama instance plus the three calls
+    the agent and the school need. All calls are serialized on a lock
+    because a single llama.cpp context is not thread-safe.
+    """
+    def __init__(self, model_path, mmproj_path=None, tag="[EYES]", image_cache_mb=IMAGE_CACHE_MB):
+        self.model_path = model_path
+        self.mmproj_path = mmproj_path
+        self.tag = tag
+        self.image_cache_mb = image_cache_mb
+        self.llm = None
+        self.embedder = None
+        self.image_cache = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads the Llama model into memory. Returns True on success."""
+        if self.llm:
+            return True
+
+        if not os.path.exists(self.model_path):
+            print(f"ERROR: 'model_path' not found: {self.model_path}")
+            return False
+        if self.mmproj_path and not os.path.exists(self.mmproj_path):
+            print(f"ERROR: 'mmproj_path' not found: {self.mmproj_path}")
+            print("This file is the 'Eyes' of the model and is required for vision.")
+            return False
+
+        print(f"{self.tag} Loading Gemma 3 model... (This may take a moment)")
+        try:
+            from llama_cpp import Llama
+            # v1.5: The projector is loaded once, by the chat handler
+            chat_handler = cached_chat_handler(self.mmproj_path) if self.mmproj_path else None
+            # v1.2: No logits_all / embedding mode. Embeddings come from
+            # the projector (ImageEmbedder), not from the text model.
+            self.llm = Llama(
+                model_path=self.model_path,
+                chat_handler=chat_handler,
+                n_ctx=2048,
+                n_batch=512,
+                verbose=False
+            )
+            print(f"{self.tag} Model loaded successfully.")
+        except Exception as e:
+            print(f"{self.tag} CRITICAL ERROR: Failed to load model: {e}")
+            return False
+
+        if self.mmproj_path:
+            clip_ctx = getattr(chat_handler, 'clip_ctx', None)
+            if clip_ctx and hasattr(chat_handler, '_embed_image_bytes'):
+                from llama_cpp import llava_cpp
+                self.image_cache = ImageEmbedCache(llava_cpp, self.llm.n_embd(),
+                                                   max_bytes=self.image_cache_mb * 1024 * 1024)
+                chat_handler.image_cache = self.image_cache
+            else:
+                print(f"{self.tag} WARNING: This llama-cpp-python encodes chat images internally. "
+                      f"Image encodes will not be cached.")
+            self.embedder = ImageEmbedder(self.mmproj_path, self.llm.n_embd(), tag=self.tag,
+                                          clip_ctx=clip_ctx, image_cache=self.image_cache)
+            if not self.embedder.load():
+                self.embedder = None
+        else:
+            print(f"{self.tag} WARNING: No 'mmproj_path' configured. Embeddings are unavailable.")
+        return True
+
+    def _chat(self, prompt, img_bytes, max_tokens, system=None, schema=None):
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image_uri(img_bytes)}}
+            ]
+        })
+        with self._lock:
+            # v1.6: A schema constrains decoding to exactly that JSON shape
+            response_format = {"type": "json_object", "schema": schema} if schema else None
+            return self.llm.create_chat_completion(messages=messages, max_tokens=max_tokens,
+                                                   response_format=response_format)
+
+    def locate_target(self, img_bytes, target_description):
+        """Asks the AI for the center of a target. Returns (x, y) or (None, None)."""
+        prompt = VISION_PROMPT_FIND.format(target_description=target_description)
+        try:
+            response = self._chat(prompt, img_bytes, max_tokens=LOCATE_MAX_TOKENS,
+                                  system="You are a helpful assistant that responds in JSON.",
+                                  schema=COORDS_SCHEMA)
+            response_text = response['choices'][0]['message']['content'].strip()
+            print(f"{self.tag} AI Response: {response_text}")
+
+            coords = extract_json(response_text)
+            if coords is None:
+                print(f"{self.tag} Error: AI did not respond with valid JSON.")
+                return None, None
+
+            x, y = int(coords['x']), int(coords['y'])
+            if x <= 0 or y <= 0:
+                raise ValueError(f"Invalid coordinates: ({x}, {y})")
+            return x, y
+
+        except Exception as e:
+            print(f"{self.tag} Error during screen analysis: {e}")
+            return None, None
+
+    def verify_coordinates(self, img_bytes, x, y):
+        """Asks the AI to confirm the red 'X' is at (x, y). Returns (bool, reason)."""
+        prompt = VISION_PROMPT_VERIFY_COORDS.format(x=x, y=y)
+        try:
+            response = self._chat(prompt, img_bytes, max_tokens=VERIFY_MAX_TOKENS, schema=VERIFY_SCHEMA)
+            response_text = response['choices'][0]['message']['content'].strip()
+            print(f"{self.tag} AI Verification Response Text: {response_text}")
+
+            data = extract_json(response_text)
+            if data is None:
+                return False, "AI did not return valid JSON."
+
+            print(f"{self.tag} AI Verification Data: {data}")
+            return data.get("match") == True, data.get("reason", "No reason provided.")
+
+        except Exception as e:
+            print(f"{self.tag} Error during AI verification: {e}")
+            return False, str(e)
+
+    def parse_scene(self, img_bytes, targets=None):
+        """
+        v1.4: Locates many elements in ONE inference. `targets` maps
+        label -> description; None asks for every interactable element.
+        Returns {label: (x, y)} in image pixels, leaving out anything the
+        model could not place. Returns {} on failure.
+        """
+        if targets:
+            target_list = "\n".join(f"- {label}: {description}" for label, description in targets.items())
+            prompt = VISION_PROMPT_PARSE_TARGETS.format(target_list=target_list)
+            max_tokens = PARSE_BASE_TOKENS + sum(
+                len(self.llm.tokenize(json.dumps(label).encode('utf-8'), add_bos=False)) + PARSE_ENTRY_TOKENS
+                for label in targets)
+        else:
+            prompt = VISION_PROMPT_PARSE_ALL.format()
+            max_tokens = PARSE_ALL_MAX_TOKENS
+        try:
+            response = self._chat(prompt, img_bytes, max_tokens=max_tokens,
+                                  system="You are a helpful assistant that responds in JSON.",
+                                  schema=scene_schema(targets))
+            response_text = response['choices'][0]['message']['content'].strip()
+            print(f"{self.tag} AI Scene Response: {response_text}")
+
+            try:
+                data = extract_json(response_text)
+            except ValueError:
+                data = None
+            if data is None:
+                # v1.6.1: Truncated reply: keep every entry that did finish
+                data = salvage_scene_entries(response_text)
+                if not data:
+                    print(f"{self.tag} Error: AI did not respond with valid JSON.")
+                    return {}
+                print(f"{self.tag} Reply was cut off. Salvaged {len(data)} complete entries.")
+            return parse_scene_reply(data, targets, tag=self.tag)
+
+        except Exception as e:
+            print(f"{self.tag} Error during scene parse: {e}")
+            return {}
+
+    def embed_crop(self, img_bytes):
+        """Returns the normalized embedding of a cropped UI element (list of floats), or None."""
+        return self.embed_crops([img_bytes])[0]
+
+    def embed_crops(self, crops):
+        """
+        v1.1: Embeds a batch of crops. Identical crops (common when
+        re-teaching an app) are only run through the projector once.
+        Returns a list aligned with `crops` (None for failures).
+        """
+        if self.embedder is None:
+            print(f"{self.tag} Error: Image projector is not loaded. Cannot embed.")
+            return [None] * len(crops)
+
+        unique = {}
+        with self._lock:
+            for img_bytes in crops:
+                if img_bytes in unique:
+                    continue
+                try:
+                    unique[img_bytes] = self.embedder.embed(img_bytes).tolist()
+                except Exception as e:
+                    print(f"{self.tag} Error generating embedding: {e}")
+                    unique[img_bytes] = None
+        return [unique[img_bytes] for img_bytes in crops]
+
+
+# -------------------------------------------
+# --- v1.1: REQUEST SCHEDULER ---
+# -------------------------------------------
+
+class SchedulerBusy(Exception):
+    """The request queue is full. Callers should back off and retry."""
+
+class RequestExpired(Exception):
+    """The request's deadline passed before the model got to it."""
+
+
+class InferenceRequest:
+    def __init__(self, kind, args, deadline):
+        self.kind = kind # 'locate', 'verify', 'parse', 'embed' or 'embed_batch' (a list of crops)
+        self.args = args
+        self.deadline = deadline
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class RequestScheduler:
+    """
+    Sits in front of an InferenceEngine. Requests go into a bounded
+    queue (backpressure: submit() raises SchedulerBusy when full) and a
+    single worker drains them in batches. Expired requests are dropped
+    before they reach the model, and all pending 'embed' requests in a
+    batch are handed to engine.embed_crops() in one call.
+    v1.6.1: An 'embed_batch' request carries a whole list of crops, so
+    a batch takes one queue slot and succeeds or fails as a unit.
+    """
+    def __init__(self, engine, max_queue=MAX_QUEUE_DEPTH, max_batch=MAX_BATCH_SIZE):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = threading.Thread(target=self._run, name="sentinel-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, kind, *args, deadline_seconds=DEFAULT_DEADLINE_SECONDS):
+        """Queues a request and blocks until it is answered or expires."""
+        request = InferenceRequest(kind, args, time.monotonic() + deadline_seconds)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            raise SchedulerBusy(f"Inference queue is full ({self._queue.maxsize} pending).")
+
+        if not request.done.wait(timeout=deadline_seconds):
+            # The worker will see the deadline and drop it.
+            raise RequestExpired(f"'{kind}' request missed its {deadline_seconds}s deadline.")
+        if request.error:
+            raise request.error
+        return request.result
+
+    def _next_batch(self):
+        batch = [self._queue.get()] # Block for the first one
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                if request.deadline < now:
+                    request.finish(error=RequestExpired(f"'{request.kind}' request expired in queue."))
+                else:
+                    live.append(request)
+
+            embeds = [r for r in live if r.kind in ('embed', 'embed_batch')]
+            if embeds:
+                crops = []
+                for request in embeds:
+                    crops.extend(request.args[0] if request.kind == 'embed_batch' else [request.args[0]])
+                try:
+                    results = self.engine.embed_crops(crops)
+                    offset = 0
+                    for request in embeds:
+                        if request.kind == 'embed_batch':
+                            count = len(request.args[0])
+                            request.finish(result=results[offset:offset + count])
+                        else:
+                            count = 1
+                            request.finish(result=results[offset])
+                        offset += count
+                except Exception as e:
+                    for request in embeds:
+                        request.finish(error=e)
+
+            for request in live:
+                if request.kind in ('embed', 'embed_batch'):
+                    continue
+                try:
+                    if request.kind == 'locate':
+                        request.finish(result=self.engine.locate_target(*request.args))
+                    elif request.kind == 'verify':
+                        request.finish(result=self.engine.verify_coordinates(*request.args))
+                    elif request.kind == 'parse':
+                        request.finish(result=self.engine.parse_scene(*request.args))
+                    else:
+                        request.finish(error=ValueError(f"Unknown request kind: {request.kind}"))
+                except Exception as e:
+                    request.finish(error=e)
+
+
+class InferenceClient:
+    """
+    Thin client for a running daemon. Same call signatures as
+    InferenceEngine, so callers never care which one they hold.
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, tag="[EYES]"):
+        self.base_url = f"http://{host}:{port}"
+        self.tag = tag
+
+    def _post(self, route, payload):
+        request = urllib.request.Request(
+            self.base_url + route,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={"Content-Type": "application/json"}
+        )
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=CLIENT_TIMEOUT_SECONDS) as response:
+                    return json.loads(response.read().decode('utf-8'))
+            except urllib.error.HTTPError as e:
+                # v1.1: 503 means the daemon's queue is full. Back off and retry.
+                if e.code != 503 or attempt == BUSY_RETRIES:
+                    raise
+                delay = float(e.headers.get("Retry-After", 1))
+                print(f"{self.tag} Inference daemon busy. Retrying in {delay}s...")
+                time.sleep(delay)
+
+    def ping(self, timeout=0.5):
+        """True if the daemon answers its health check."""
+        try:
+            with urllib.request.urlopen(self.base_url + "/health", timeout=timeout) as response:
+                return json.loads(response.read().decode('utf-8')).get("ok", False)
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+    def locate_target(self, img_bytes, target_description):
+        try:
+            data = self._post("/locate", {
+                "image": base64.b64encode(img_bytes).decode('utf-8'),
+                "target_description": target_description
+            })
+            return data.get("x"), data.get("y")
+        except Exception as e:
+            print(f"{self.tag} Error talking to inference daemon: {e}")
+            return None, None
+
+    def verify_coordinates(self, img_bytes, x, y):
+        try:
+            data = self._post("/verify", {
+                "image": base64.b64encode(img_bytes).decode('utf-8'),
+                "x": x, "y": y
+            })
+            return data.get("match", False), data.get("reason", "No reason provided.")
+        except Exception as e:
+            print(f"{self.tag} Error talking to inference daemon: {e}")
+            return False, str(e)
+
+    def parse_scene(self, img_bytes, targets=None):
+        try:
+            data = self._post("/parse", {
+                "image": base64.b64encode(img_bytes).decode('utf-8'),
+                "targets": targets
+            })
+            return {label: tuple(coords) for label, coords in data.get("elements", {}).items()}
+        except Exception as e:
+            print(f"{self.tag} Error talking to inference daemon: {e}")
+            return {}
+
+    def embed_crop(self, img_bytes):
+        try:
+            data = self._post("/embed", {"image": base64.b64encode(img_bytes).decode('utf-8')})
+            return data.get("embedding")
+        except Exception as e:
+            print(f"{self.tag} Error talking to inference daemon: {e}")
+            return None
+
+    def embed_crops(self, crops):
+        try:
+            data = self._post("/embed_batch", {
+                "images": [base64.b64encode(img_bytes).decode('utf-8') for img_bytes in crops]
+            })
+            return data.get("embeddings")
+        except Exception as e:
+            print(f"{self.tag} Error talking to inference daemon: {e}")
+            return [None] * len(crops)
+
+
+def locate_coarse_to_fine(eyes, frame, target_description, tag="[EYES]"):
+    """
+    v1.3: Two-pass locate on a sentinel_capture.Frame.
+      1. Coarse: the whole frame, downscaled to COARSE_MAX_SIDE, picks a region.
+      2. Fine: a native-resolution FINE_TILE_SIZE tile around that region
+         pins the exact center.
+    Model answers are in image pixels; they are mapped back through the
+    downscale, the tile origin and the frame's virtual-screen offset
+    (frame.left/top, i.e. the monitor offset). Returns absolute (x, y)
+    or (None, None). `eyes` is an InferenceEngine or InferenceClient.
+    """
+    from sentinel_capture import scaled_size
+
+    coarse_w, coarse_h = scaled_size((frame.width, frame.height), COARSE_MAX_SIDE)
+    x, y = eyes.locate_target(frame.encode_png(max_side=COARSE_MAX_SIDE), target_description)
+    if x is None or y is None or x >= coarse_w or y >= coarse_h:
+        print(f"{tag} Coarse pass found nothing usable.")
+        return None, None
+
+    abs_x = frame.left + int(x * frame.width / coarse_w)
+    abs_y = frame.top + int(y * frame.height / coarse_h)
+    if (coarse_w, coarse_h) == (frame.width, frame.height):
+        return abs_x, abs_y # Small frame: the coarse pass was already native
+    print(f"{tag} Coarse pass: ~({abs_x}, {abs_y}). Refining on a native tile...")
+
+    # Tile centered on the coarse hit, slid back inside the frame at the edges
+    tile_w = min(FINE_TILE_SIZE, frame.width)
+    tile_h = min(FINE_TILE_SIZE, frame.height)
+    left = min(max(abs_x - tile_w // 2, frame.left), frame.left + frame.width - tile_w)
+    top = min(max(abs_y - tile_h // 2, frame.top), frame.top + frame.height - tile_h)
+    tile_box = (left, top, left + tile_w, top + tile_h)
+
+    fine_x, fine_y = eyes.locate_target(frame.encode_png(tile_box), target_description)
+    if fine_x is None or fine_y is None or fine_x >= tile_w or fine_y >= tile_h:
+        print(f"{tag} Fine pass failed. Using the coarse estimate.")
+        return abs_x, abs_y
+    return left + fine_x, top + fine_y
+
+
+def parse_scene_on_frame(eyes, frame, targets=None, tag="[EYES]"):
+    """
+    v1.4: Scene parse on a sentinel_capture.Frame. The frame is encoded
+    ONCE (downscaled to COARSE_MAX_SIDE) and every element is mapped back
+    to absolute screen coordinates. There is no per-target fine pass:
+    that would cost one encode per element, which is what this avoids.
+    Returns {label: (x, y)}.
+    """
+    from sentinel_capture import scaled_size
+
+    image_w, image_h = scaled_size((frame.width, frame.height), COARSE_MAX_SIDE)
+    elements = eyes.parse_scene(frame.encode_png(max_side=COARSE_MAX_SIDE), targets)
+
+    located = {}
+    for label, (x, y) in elements.items():
+        if x >= image_w or y >= image_h:
+            print(f"{tag} Dropping '{label}': ({x}, {y}) is outside the image.")
+            continue
+        located[label] = (frame.left + int(x * frame.width / image_w),
+                          frame.top + int(y * frame.height / image_h))
+    print(f"{tag} Scene parse placed {len(located)} element(s) in one pass.")
+    return located
+
+
+def connect(config, tag="[EYES]"):
+    """
+    Returns the "Eyes" for an entry point: a daemon client if one is
+    listening, otherwise a freshly loaded in-process engine.
+    Returns None if neither is available.
+    """
+    host = config.get('inference_host', DEFAULT_HOST)
+    port = config.get('inference_port', DEFAULT_PORT)
+
+    client = InferenceClient(host, port, tag=tag)
+    if client.ping():
+        print(f"{tag} Connected to inference daemon at {client.base_url}.")
+        return client
+
+    print(f"{tag} No inference daemon at {client.base_url}. Loading model in-process...")
+    engine = InferenceEngine(config['model_path'], config.get('mmproj_path'), tag=tag,
+                             image_cache_mb=config.get('image_cache_mb', IMAGE_CACHE_MB))
+    if not engine.load():
+        return None
+    return engine
+
+# -------------------------------------------
+# --- DAEMON ---
+# -------------------------------------------
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    engine = None    # Set by serve()
+    scheduler = None # v1.1: All model calls go through the scheduler
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            image_cache = self.engine.image_cache
+            self._reply(200, {"ok": True, "model": os.path.basename(self.engine.model_path),
+                              "image_cache": image_cache.stats() if image_cache else None})
+        else:
+            self._reply(404, {"error": f"Unknown route: {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            deadline = float(payload.get("deadline_seconds", DEFAULT_DEADLINE_SECONDS))
+            submit = lambda kind, *args: self.scheduler.submit(kind, *args, deadline_seconds=deadline)
+
+            if self.path == "/locate":
+                x, y = submit('locate', base64.b64decode(payload["image"]), payload["target_description"])
+                self._reply(200, {"x": x, "y": y})
+            elif self.path == "/verify":
+                match, reason = submit('verify', base64.b64decode(payload["image"]), payload["x"], payload["y"])
+                self._reply(200, {"match": match, "reason": reason})
+            elif self.path == "/parse":
+                elements = submit('parse', base64.b64decode(payload["image"]), payload.get("targets"))
+                self._reply(200, {"elements": {label: list(xy) for label, xy in elements.items()}})
+            elif self.path == "/embed":
+                self._reply(200, {"embedding": submit('embed', base64.b64decode(payload["image"]))})
+            elif self.path == "/embed_batch":
+                # v1.6.1: One queued request for the whole batch. A full queue
+                # answers 503 for all of it, never a partial list of Nones.
+                crops = [base64.b64decode(image) for image in payload["images"]]
+                self._reply(200, {"embeddings": submit('embed_batch', crops)})
+            else:
+                self._reply(404, {"error": f"Unknown route: {self.path}"})
+        except SchedulerBusy as e:
+            self._reply(503, {"error": str(e)}, headers={"Retry-After": "1"})
+        except RequestExpired as e:
+            self._reply(504, {"error": str(e)})
+        except (KeyError, ValueError) as e:
+            self._reply(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            print(f"[DAEMON] Error handling {self.path}: {e}")
+            self._reply(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        print(f"[DAEMON] {self.address_string()} {format % args}", flush=True)
+
+
+def serve(config):
+    engine = InferenceEngine(config['model_path'], config.get('mmproj_path'), tag="[DAEMON]",
+                             image_cache_mb=config.get('image_cache_mb', IMAGE_CACHE_MB))
+    if not engine.load():
+        sys.exit(1)
+
+    host = config.get('inference_host', DEFAULT_HOST)
+    port = config.get('inference_port', DEFAULT_PORT)
+    InferenceRequestHandler.engine = engine
+    InferenceRequestHandler.scheduler = RequestScheduler(engine)
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+
+    print("==================================================")
+    print("✅ Sentinel Inference Daemon Started (v1.6)")
+    print(f"Listening on http://{host}:{port}")
+    print("Press CTRL+C to stop the daemon.")
+    print("==================================================")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[DAEMON] Service stopped by user.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        with open('sentinel_config.json', 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        print("ERROR: sentinel_config.json not found.")
+        sys.exit(1)
+    serve(config)
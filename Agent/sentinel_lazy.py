@@ -0,0 +1,52 @@
+import sys
+import time
+import importlib.util
+
+# --- Sentinel Lazy Imports (v1.0) ---
+# The entry points pull in llama_cpp, numpy, PIL, mss, pyautogui,
+# pygetwindow, psutil and tkinter, most of which a given command never
+# touches. lazy_import() hands back the module object right away but
+# only executes it on first attribute access, so e.g.
+#
+#   gw = sentinel_lazy.lazy_import('pygetwindow')
+#
+# costs a path lookup at startup and the real import the first time
+# gw.getActiveWindow() runs. A missing package still fails at startup.
+
+IMPORT_BUDGET_MS = 300 # What a SQLite-only command may spend importing
+
+# -------------------------------------------
+
+def lazy_import(name):
+    """
+    Returns `name` as a module that is executed on first use.
+    Use top-level names only: find_spec() imports the parents of a
+    dotted name for real.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def is_installed(name):
+    """True if `name` can be imported, without importing it."""
+    return name in sys.modules or importlib.util.find_spec(name) is not None
+
+def check_import_budget(start, tag, budget_ms=IMPORT_BUDGET_MS):
+    """
+    Prints how long startup took since `start` (a time.perf_counter()
+    value) and warns when it went over `budget_ms`. Returns the ms.
+    """
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    if elapsed_ms > budget_ms:
+        print(f"{tag} WARNING: Startup took {elapsed_ms}ms, over the {budget_ms}ms budget.")
+    else:
+        print(f"{tag} Startup took {elapsed_ms}ms (budget {budget_ms}ms).")
+    return elapsed_ms
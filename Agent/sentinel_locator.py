@@ -0,0 +1,146 @@
+import time
+import numpy as np
+from PIL import Image
+
+# --- Sentinel Locator (v1.0) ---
+# Model-free "is it still there?" checks for elements we have already
+# learned. Given the reference crop of an element and its last known
+# position, the locator tries cheap pixel comparisons first and only
+# reports a miss when the caller really needs the vision model:
+#
+#   Tier 1: crop at the last known (x, y) and compare directly.
+#   Tier 2: search widening windows around it with template matching.
+#   Tier 3: give up -> caller escalates to a full-screen LLM scan.
+
+NCC_MATCH_THRESHOLD = 0.90   # Normalized cross-correlation, 1.0 = identical
+DHASH_MAX_DISTANCE = 10      # Hamming distance out of 64 bits
+SEARCH_RADII = (96, 256)     # Tier 2 window half-sizes, in pixels
+
+# -------------------------------------------
+
+def to_gray(img):
+    """PIL image or HxW[xC] uint8 array -> float32 grayscale array."""
+    if isinstance(img, Image.Image):
+        return np.asarray(img.convert("L"), dtype=np.float32)
+    arr = np.asarray(img)
+    if arr.ndim == 3:
+        # ITU-R 601 luma, same weights PIL uses for convert("L")
+        arr = arr[..., 0] * 0.299 + arr[..., 1] * 0.587 + arr[..., 2] * 0.114
+    return arr.astype(np.float32, copy=False)
+
+def dhash(gray, hash_size=8):
+    """64-bit difference hash of a grayscale array, as a bool array."""
+    small = Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8)).resize(
+        (hash_size + 1, hash_size), Image.BILINEAR
+    )
+    pixels = np.asarray(small, dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+def hash_distance(hash_a, hash_b):
+    return int(np.count_nonzero(hash_a != hash_b))
+
+def ncc_score(a, b):
+    """Normalized cross-correlation of two same-sized grayscale arrays."""
+    a = a - a.mean()
+    b = b - b.mean()
+    denom = np.sqrt((a * a).sum() * (b * b).sum())
+    if denom < 1e-6:
+        # Flat patches: identical only if both are flat at the same level
+        return 1.0 if np.allclose(a, b) else 0.0
+    return float((a * b).sum() / denom)
+
+def match_template(image, template):
+    """
+    Vectorized NCC of `template` at every valid position in `image`.
+    Uses an FFT for the correlation and integral images for the
+    per-window statistics, so a 512x512 search is a few milliseconds.
+    Returns a (H-h+1, W-w+1) score map.
+    """
+    ih, iw = image.shape
+    th, tw = template.shape
+    if th > ih or tw > iw:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    t = template - template.mean()
+    t_norm = np.sqrt((t * t).sum())
+    n = th * tw
+
+    # Correlation of the image with the zero-mean template
+    spectrum = np.fft.rfft2(image) * np.conj(np.fft.rfft2(t, s=image.shape))
+    corr = np.fft.irfft2(spectrum, s=image.shape)[:ih - th + 1, :iw - tw + 1]
+
+    # Per-window sum and sum of squares via integral images
+    def window_sums(arr):
+        ii = np.pad(arr, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+        return ii[th:, tw:] - ii[:-th, tw:] - ii[th:, :-tw] + ii[:-th, :-tw]
+
+    image64 = image.astype(np.float64)
+    win_sum = window_sums(image64)
+    win_sq = window_sums(image64 * image64)
+    win_var = np.maximum(win_sq - win_sum * win_sum / n, 0.0)
+
+    denom = np.sqrt(win_var) * t_norm
+    scores = np.zeros_like(corr, dtype=np.float32)
+    valid = denom > 1e-6
+    scores[valid] = corr[valid] / denom[valid]
+    return scores
+
+
+class TieredLocator:
+    """
+    Finds a previously learned element without the vision model.
+    `grab(bbox)` must return the screen region (left, top, right, bottom)
+    in absolute virtual-screen coordinates as a PIL image or array.
+    """
+    def __init__(self, grab, ncc_threshold=NCC_MATCH_THRESHOLD,
+                 hash_distance_max=DHASH_MAX_DISTANCE, search_radii=SEARCH_RADII):
+        self.grab = grab
+        self.ncc_threshold = ncc_threshold
+        self.hash_distance_max = hash_distance_max
+        self.search_radii = search_radii
+
+    def locate(self, reference, x, y, reference_hash=None):
+        """
+        Returns (x, y, tier) for the element's center, or (None, None, None)
+        if the pixels no longer match anywhere near its last known position.
+        `reference_hash` is the crop's precomputed dHash (bool array), if any.
+        """
+        ref = to_gray(reference)
+        if reference_hash is None:
+            reference_hash = dhash(ref)
+        h, w = ref.shape
+        start = time.perf_counter()
+
+        # --- Tier 1: same place as last time ---
+        left, top = x - w // 2, y - h // 2
+        patch = to_gray(self.grab((left, top, left + w, top + h)))
+        if patch.shape == ref.shape:
+            score = ncc_score(patch, ref)
+            distance = hash_distance(dhash(patch), reference_hash)
+            if score >= self.ncc_threshold and distance <= self.hash_distance_max:
+                print(f"[LOCATOR] Tier 1 hit at ({x}, {y}) "
+                      f"(ncc={score:.3f}, dhash={distance}, {self._ms(start)}ms).")
+                return x, y, 1
+
+        # --- Tier 2: widening search windows ---
+        for radius in self.search_radii:
+            bbox = (x - radius, y - radius, x + radius, y + radius)
+            window = to_gray(self.grab(bbox))
+            scores = match_template(window, ref)
+            if scores.size == 0:
+                continue
+            row, col = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            best = float(scores[row, col])
+            if best >= self.ncc_threshold:
+                found_x = bbox[0] + int(col) + w // 2
+                found_y = bbox[1] + int(row) + h // 2
+                print(f"[LOCATOR] Tier 2 hit at ({found_x}, {found_y}) within {radius}px "
+                      f"(ncc={best:.3f}, {self._ms(start)}ms).")
+                return found_x, found_y, 2
+
+        print(f"[LOCATOR] No pixel match near ({x}, {y}) ({self._ms(start)}ms). Escalating.")
+        return None, None, None
+
+    @staticmethod
+    def _ms(start):
+        return int((time.perf_counter() - start) * 1000)
@@ -1,13 +1,29 @@
 import sqlite3
-import chromadb
 import json
 import os
+import time
+import threading
+import collections
+import sentinel_lazy
 from peewee import (Model, SqliteDatabase, CharField, IntegerField, 
-                    TextField, ForeignKeyField, DoesNotExist)
+                    TextField, ForeignKeyField, DoesNotExist, Tuple, chunked, fn)
+from playhouse.migrate import SqliteMigrator, migrate
 
-# This will hold our ChromaDB and SQLite DB
+# v2.8: numpy, PIL and the vector store load on first use (see sentinel_lazy.py)
+sentinel_crops = sentinel_lazy.lazy_import('sentinel_crops')
+sentinel_vectors = sentinel_lazy.lazy_import('sentinel_vectors')
+
+# This will hold our SQLite DB (vectors live in a sentinel_vectors backend)
 db = SqliteDatabase(None) # v2.2: Initialize as a proxy
-client = None
+
+# v2.9: Applied on every connection. WAL lets lookups run while the school
+# writes; NORMAL sync is safe under WAL and skips an fsync per commit.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 1,            # NORMAL
+    'mmap_size': 64 * 1024 * 1024,
+    'cache_size': -16000,        # Negative = KiB, so ~16MB of page cache
+}
 
 # --- 1. SQL DATABASE (The "Facts" / "Where") ---
 # Defines the structure for our Factual (SQL) memory.
@@ -20,6 +36,11 @@ class AppContext(BaseModel):
     """e.g., 'chrome.exe', 'Google Chrome'"""
     app_name = CharField(unique=True)
     window_title = CharField() # Can be a regex later
+    # v2.4: Last seen window rectangle (absolute screen coords)
+    window_left = IntegerField(null=True)
+    window_top = IntegerField(null=True)
+    window_width = IntegerField(null=True)
+    window_height = IntegerField(null=True)
 
 class VisualFact(BaseModel):
     """
@@ -33,55 +54,280 @@ class VisualFact(BaseModel):
     last_known_x = IntegerField()
     last_known_y = IntegerField()
     notes = TextField(null=True)
+    # v2.4: Position relative to the app window's top-left corner.
+    # Survives the window being moved; last_known_x/y stay absolute.
+    window_x = IntegerField(null=True)
+    window_y = IntegerField(null=True)
+
+    class Meta:
+        # v2.9: Every lookup filters on exactly this pair (and it must be unique)
+        indexes = ((('app_context', 'label'), True),)
+
+    def position_in(self, window_rect):
+        """
+        Absolute (x, y) of this element for a window currently at
+        window_rect (left, top, right, bottom). Falls back to the last
+        known absolute position for facts stored before v2.4.
+        """
+        if window_rect is None or self.window_x is None:
+            return self.last_known_x, self.last_known_y
+        return window_rect[0] + self.window_x, window_rect[1] + self.window_y
+
+class CropBlob(BaseModel):
+    """
+    v2.3: One stored crop in the pixel pack (sentinel_crops.pack),
+    addressed by the sha1 of its pixels.
+    """
+    digest = CharField(unique=True)
+    offset = IntegerField()
+    height = IntegerField()
+    width = IntegerField()
+    channels = IntegerField()
+    dhash = CharField() # 64-bit difference hash, hex
+    pyramid = TextField() # JSON: [[offset, height, width], ...] for each halved level
+
+class ReferenceCrop(BaseModel):
+    """v2.3: Which pixels a vector in ChromaDB was learned from."""
+    chroma_id = CharField(unique=True)
+    blob = ForeignKeyField(CropBlob, backref='references')
 
 # --- 2. VECTOR DATABASE (The "Looks" / "What") ---
-# Manages the ChromaDB connection for visual memory.
+# v2.7: Manages the vector backend for visual memory ("numpy" or
+# "chroma", see sentinel_vectors.py).
+
+DEFAULT_VECTOR_BACKEND = "chroma" # Pass "numpy" for the built-in index
+
+# --- v2.9: SCHEMA MIGRATIONS ---
+# The facts database records its schema version in PRAGMA user_version.
+# MIGRATIONS[i] upgrades version i to i + 1; init_db() runs whatever a
+# database is missing, oldest first, each in its own transaction. To
+# change the schema: update the models AND append a migration here.
+
+def _migrate_window_columns():
+    """v2.4: Window rect on AppContext, window-relative position on VisualFact."""
+    migrator = SqliteMigrator(db)
+    operations = []
+    for model, columns in ((AppContext, ('window_left', 'window_top', 'window_width', 'window_height')),
+                           (VisualFact, ('window_x', 'window_y'))):
+        table = model._meta.table_name
+        existing = {column.name for column in db.get_columns(table)}
+        for name in columns:
+            if name not in existing:
+                operations.append(migrator.add_column(table, name, model._meta.fields[name]))
+    if operations:
+        migrate(*operations)
+
+def _migrate_fact_index():
+    """v2.9: UNIQUE (app_context, label) on VisualFact. Keeps the newest duplicate."""
+    newest = (VisualFact
+              .select(fn.MAX(VisualFact.id))
+              .group_by(VisualFact.app_context, VisualFact.label))
+    removed = VisualFact.delete().where(VisualFact.id.not_in(newest)).execute()
+    if removed:
+        print(f"[Memory] Removed {removed} duplicate fact(s) before indexing.")
+    VisualFact._schema.create_indexes(safe=True)
+
+MIGRATIONS = [
+    _migrate_window_columns,  # 0 -> 1
+    _migrate_fact_index,      # 1 -> 2
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate_schema():
+    """Brings an existing facts database up to SCHEMA_VERSION."""
+    version = db.pragma('user_version')
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        with db.atomic():
+            MIGRATIONS[target - 1]()
+            db.pragma('user_version', target)
+        print(f"[Memory] Migrated the facts database to schema v{target}.")
+
+# -------------------------------------------
+
+# v2.5: In-process lookup cache defaults
+CACHE_TTL_SECONDS = 300
+CACHE_MISS_TTL_SECONDS = 2 # v2.10: "Not found" is only trusted briefly; another process may store it
+CACHE_MAX_ENTRIES = 512
+_MISSING = object() # get() result for absent or expired keys
+
+class TTLCache:
+    """
+    v2.5: A small LRU cache whose entries also expire after `ttl` seconds.
+    Keys are (app_name, label) tuples. Counts hits and misses.
+    """
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value, or _MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key, value, ttl=None):
+        """`ttl` overrides the cache's default for this entry."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0
+            }
 
 class Memory:
-    def __init__(self, db_path):
+    def __init__(self, db_path, cache_ttl=CACHE_TTL_SECONDS, cache_size=CACHE_MAX_ENTRIES,
+                 vector_backend=DEFAULT_VECTOR_BACKEND):
         self.db_path = db_path
         self.sqlite_file = os.path.join(db_path, 'sentinel_facts.db')
-        self.chroma_path = os.path.join(db_path, 'sentinel_visuals')
-        
-        global db, client
-        db.init(self.sqlite_file) # v2.2: Initialize the proxy with the real file path
         
-        # We use a persistent client that saves to disk
-        client = chromadb.PersistentClient(path=self.chroma_path)
+        global db
+        db.init(self.sqlite_file, pragmas=SQLITE_PRAGMAS) # v2.2: Initialize the proxy with the real file path
         
-        self.visual_collection = None
+        # v2.7: Pluggable vector store, opened in init_db()
+        # v2.8: Backend and crop pack are only created when first needed
+        self.vector_backend = vector_backend
+        self._vectors = None
+        self._crop_pack = None
+        self.sqlite_ready = False
+        self.vectors_ready = False
+
+        # v2.5: (app_name, label) -> VisualFact / reference crop
+        self.fact_cache = TTLCache(cache_ttl, cache_size)
+        self.crop_cache = TTLCache(cache_ttl, cache_size)
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = sentinel_vectors.create_backend(self.vector_backend, self.db_path)
+        return self._vectors
 
-    def init_db(self):
-        """Initializes both databases and creates tables/collections."""
+    @property
+    def crop_pack(self):
+        """v2.3: Reference pixels."""
+        if self._crop_pack is None:
+            self._crop_pack = sentinel_crops.CropPack(self.db_path)
+        return self._crop_pack
+
+    def init_db(self, open_vectors=True):
+        """
+        Initializes both databases and creates tables/collections.
+        v2.8: Pass open_vectors=False for SQLite-only work (fact lookups);
+        the vector store is then opened on first store/search.
+        """
+        if not self.sqlite_ready:
+            try:
+                # v2.2: The database is already bound, just connect and create.
+                db.connect()
+                # v2.9: New databases start at the latest schema; older
+                # ones are migrated first so create_tables() can add
+                # indexes over columns that used to be missing.
+                if db.table_exists(VisualFact._meta.table_name):
+                    migrate_schema()
+                    db.create_tables([AppContext, VisualFact, CropBlob, ReferenceCrop])
+                else:
+                    db.create_tables([AppContext, VisualFact, CropBlob, ReferenceCrop])
+                    db.pragma('user_version', SCHEMA_VERSION)
+                self.sqlite_ready = True
+                print("[Memory] SQLite tables initialized.")
+            except Exception as e:
+                print(f"[Memory] Error initializing SQLite: {e}")
+
+        if open_vectors:
+            self.open_vectors()
+
+    def open_vectors(self):
+        """
+        v2.8: Opens the vector backend (and SQLite, if needed). Idempotent.
+        v2.10: An empty "numpy" store first adopts an existing ChromaDB one.
+        """
+        if self.vectors_ready:
+            return
+        if not self.sqlite_ready:
+            self.init_db(open_vectors=False)
         try:
-            # v2.2: The database is already bound, just connect and create.
-            db.connect()
-            db.create_tables([AppContext, VisualFact])
-            print("[Memory] SQLite tables initialized.")
+            self.vectors.open()
+            self.vectors_ready = True
+            print(f"[Memory] Vector backend '{self.vectors.name}' initialized ({self.vectors.count()} vectors).")
         except Exception as e:
-            print(f"[Memory] Error initializing SQLite: {e}")
-            
+            print(f"[Memory] Error initializing vector backend '{self.vectors.name}': {e}")
+            return
+        self._adopt_chroma_vectors()
+
+    def _adopt_chroma_vectors(self):
+        """
+        v2.10: Switching the config to "numpy" would otherwise orphan every
+        Look learned into ChromaDB, so the first open of an empty numpy
+        store next to a ChromaDB store copies its vectors over.
+        """
+        chroma_path = os.path.join(self.db_path, sentinel_vectors.CHROMA_DIR_NAME)
+        if self.vectors.name != "numpy" or self.vectors.count() or not os.path.isdir(chroma_path):
+            return
+        print("[Memory] Found an existing ChromaDB store. Copying its vectors into the numpy store...")
         try:
-            # Get or create the collection for visual embeddings
-            self.visual_collection = client.get_or_create_collection(
-                name="visual_elements",
-                metadata={"hnsw:space": "cosine"} # Use cosine distance for search
-            )
-            print(f"[Memory] ChromaDB collection 'visual_elements' initialized.")
+            self.migrate_vectors("chroma")
         except Exception as e:
-            print(f"[Memory] Error initializing ChromaDB: {e}")
+            print(f"[Memory] WARNING: Could not copy the ChromaDB vectors: {e}. Until they are copied "
+                  f"(e.g. after `pip install chromadb`, on the next start), known elements are re-learned.")
+
+    def migrate_vectors(self, from_backend="chroma"):
+        """
+        v2.7: Copies every stored vector from another backend into this
+        Memory's backend, e.g. from ChromaDB into the built-in "numpy" one.
+        """
+        self.open_vectors()
+        source = sentinel_vectors.create_backend(from_backend, self.db_path)
+        source.open()
+        copied = sentinel_vectors.copy_vectors(source, self.vectors)
+        print(f"[Memory] Copied {copied} vectors from '{from_backend}' to '{self.vectors.name}'.")
+        return copied
 
-    def store_visual_memory(self, label, embedding, app_name, window_title, x, y, notes=""):
+    def store_visual_memory(self, label, embedding, app_name, window_title, x, y, notes="", crop=None,
+                            window_rect=None):
         """
         Stores a new memory, linking both databases.
         This is the main "learning" function.
+        v2.3: Pass `crop` (the pixels the embedding came from) to keep
+        them for model-free verification and later re-embedding.
+        v2.4: Pass `window_rect` (left, top, right, bottom) of the app window
+        to also store the element's window-relative position.
         """
-        if self.visual_collection is None:
-            self.init_db()
+        self.open_vectors()
             
         try:
             # 1. Store the "Fact" in
             app, _ = AppContext.get_or_create(app_name=app_name, defaults={'window_title': window_title})
+            if window_rect is not None:
+                self._save_window_rect(app, window_rect)
+            window_x, window_y = self._window_relative(x, y, window_rect)
             
             # Use the label as the ID for simplicity
             chroma_id = f"{app_name}_{label}"
@@ -93,6 +339,8 @@ class Memory:
                     'chroma_id': chroma_id,
                     'last_known_x': x,
                     'last_known_y': y,
+                    'window_x': window_x,
+                    'window_y': window_y,
                     'notes': notes
                 }
             )
@@ -101,50 +349,368 @@ class Memory:
                 # If it already exists, update its position
                 fact.last_known_x = x
                 fact.last_known_y = y
+                fact.window_x = window_x
+                fact.window_y = window_y
                 fact.save()
                 
-            # 2. Store the "Look" in ChromaDB
-            self.visual_collection.upsert(
+            # 2. Store the "Look" in the vector backend
+            self.vectors.upsert(
                 ids=[chroma_id],
                 embeddings=[embedding],
                 metadatas=[{"app": app_name, "label": label, "sql_id": fact.id}]
             )
+
+            # 3. Store the "Pixels" in the crop pack
+            if crop is not None:
+                self.store_reference_crop(chroma_id, crop)
+
+            self.invalidate_cache(app_name, label)
             
             print(f"[Memory] Stored/Updated memory for '{label}' in '{app_name}'.")
             
         except Exception as e:
             print(f"[Memory] Error storing memory: {e}")
 
+    def store_visual_memories(self, batch):
+        """
+        v2.6: Bulk version of store_visual_memory for importing or
+        re-teaching many elements. `batch` is a list of dicts with the
+        same keys as store_visual_memory's arguments (label, embedding,
+        app_name, window_title, x, y, and optionally notes, crop,
+        window_rect). All SQLite writes share ONE transaction and ChromaDB
+        gets ONE upsert. Returns the number of memories stored.
+        v2.10: New pixels are packed before the transaction, once per
+        digest, and the vector upsert runs inside it, so a failed upsert
+        rolls the facts back instead of leaving them without vectors.
+        Retrying a failed batch is safe.
+        """
+        if not batch:
+            return 0
+        self.open_vectors()
+
+        try:
+            # 0. Pixels: the pack is append-only and outside SQLite, so it is
+            #    written first; a rollback then only strands unreferenced bytes.
+            crop_digests = {} # chroma_id -> digest
+            crop_pixels = {}  # digest -> pixels
+            for item in batch:
+                if item.get('crop') is not None:
+                    pixels = sentinel_crops.as_rgb_array(item['crop'])
+                    digest = sentinel_crops.crop_digest(pixels)
+                    crop_digests[f"{item['app_name']}_{item['label']}"] = digest
+                    crop_pixels.setdefault(digest, pixels)
+            packed = set()
+            for chunk in chunked(list(crop_pixels), 400):
+                packed.update(digest for digest, in
+                              CropBlob.select(CropBlob.digest).where(CropBlob.digest.in_(chunk)).tuples())
+            new_blobs = [self._pack_pixels(pixels, digest)
+                         for digest, pixels in crop_pixels.items() if digest not in packed]
+
+            with db.atomic():
+                # 1. Apps: create the missing ones in one statement
+                apps = {}
+                for item in batch:
+                    apps.setdefault(item['app_name'], item)
+                (AppContext
+                 .insert_many([{'app_name': name, 'window_title': item['window_title']}
+                               for name, item in apps.items()])
+                 .on_conflict_ignore()
+                 .execute())
+                app_rows = {app.app_name: app for app in
+                            AppContext.select().where(AppContext.app_name.in_(list(apps)))}
+                for item in batch:
+                    if item.get('window_rect') is not None:
+                        self._save_window_rect(app_rows[item['app_name']], item['window_rect'])
+
+                # 2. Facts: update the ones we know, insert the rest in bulk
+                pairs = [(item['app_name'], item['label']) for item in batch]
+                existing = {}
+                for chunk in chunked(pairs, 400):
+                    query = (VisualFact
+                             .select(VisualFact, AppContext)
+                             .join(AppContext)
+                             .where(Tuple(AppContext.app_name, VisualFact.label).in_(chunk)))
+                    for fact in query:
+                        existing[(fact.app_context.app_name, fact.label)] = fact
+
+                new_rows = {}
+                for item in batch:
+                    key = (item['app_name'], item['label'])
+                    window_x, window_y = self._window_relative(item['x'], item['y'], item.get('window_rect'))
+                    if key in existing:
+                        (VisualFact
+                         .update(last_known_x=item['x'], last_known_y=item['y'],
+                                 window_x=window_x, window_y=window_y)
+                         .where(VisualFact.id == existing[key].id)
+                         .execute())
+                    else:
+                        new_rows[key] = {
+                            'app_context': app_rows[item['app_name']].id,
+                            'label': item['label'],
+                            'chroma_id': f"{item['app_name']}_{item['label']}",
+                            'last_known_x': item['x'],
+                            'last_known_y': item['y'],
+                            'window_x': window_x,
+                            'window_y': window_y,
+                            'notes': item.get('notes', "")
+                        }
+                for rows in chunked(list(new_rows.values()), 100):
+                    VisualFact.insert_many(rows).execute()
+
+                fact_ids = dict(
+                    ((name, label), fact_id) for name, label, fact_id in
+                    VisualFact
+                    .select(AppContext.app_name, VisualFact.label, VisualFact.id)
+                    .join(AppContext)
+                    .where(AppContext.app_name.in_(list(apps)))
+                    .tuples()
+                )
+
+                # 3. Pixels: rows for the bytes packed above
+                for rows in chunked(new_blobs, 100):
+                    CropBlob.insert_many(rows).on_conflict_ignore().execute()
+                blob_ids = {}
+                for chunk in chunked(list(crop_pixels), 400):
+                    blob_ids.update(CropBlob.select(CropBlob.digest, CropBlob.id)
+                                    .where(CropBlob.digest.in_(chunk)).tuples())
+                for rows in chunked([{'chroma_id': chroma_id, 'blob': blob_ids[digest]}
+                                     for chroma_id, digest in crop_digests.items()], 100):
+                    (ReferenceCrop
+                     .insert_many(rows)
+                     .on_conflict(conflict_target=[ReferenceCrop.chroma_id], preserve=[ReferenceCrop.blob])
+                     .execute())
+
+                # 4. Looks: one vector upsert for the whole batch (last one wins on duplicate ids).
+                #    v2.10: Last step before COMMIT, so if it raises nothing is committed.
+                looks = {}
+                for item in batch:
+                    key = (item['app_name'], item['label'])
+                    looks[f"{item['app_name']}_{item['label']}"] = (
+                        item['embedding'],
+                        {"app": item['app_name'], "label": item['label'], "sql_id": fact_ids[key]}
+                    )
+                self.vectors.upsert(
+                    ids=list(looks),
+                    embeddings=[embedding for embedding, _ in looks.values()],
+                    metadatas=[metadata for _, metadata in looks.values()]
+                )
+
+            for name, label in pairs:
+                self.invalidate_cache(name, label)
+
+            print(f"[Memory] Stored/Updated {len(looks)} memories in one batch.")
+            return len(looks)
+
+        except Exception as e:
+            print(f"[Memory] Error storing memory batch: {e}")
+            return 0
+
     def retrieve_fact_memory(self, label, app_name):
         """
         Retrieves the "Fact" (where) for a given element.
         "Where was the 'copy_button' in 'chrome.exe'?"
+        v2.5: Served from fact_cache when possible.
+        v2.10: Misses are only cached for CACHE_MISS_TTL_SECONDS, so a fact
+        stored by another process (e.g. the school) shows up promptly.
         """
+        key = (app_name, label)
+        cached = self.fact_cache.get(key)
+        if cached is not _MISSING:
+            return cached
+
         try:
-            app = AppContext.get(AppContext.app_name == app_name)
-            fact = VisualFact.get(VisualFact.app_context == app, VisualFact.label == label)
-            return fact
+            fact = (VisualFact
+                    .select(VisualFact, AppContext)
+                    .join(AppContext)
+                    .where(AppContext.app_name == app_name, VisualFact.label == label)
+                    .get())
         except DoesNotExist:
             print(f"[Memory] No fact memory found for '{label}' in '{app_name}'.")
+            self.fact_cache.put(key, None, ttl=CACHE_MISS_TTL_SECONDS)
             return None
         except Exception as e:
             print(f"[Memory] Error retrieving fact: {e}")
-            return None
+            return None # Don't cache errors
+
+        self.fact_cache.put(key, fact)
+        return fact
+
+    def invalidate_cache(self, app_name=None, label=None):
+        """v2.5: Drops cached lookups for one element, or all of them."""
+        key = None if app_name is None else (app_name, label)
+        self.fact_cache.invalidate(key)
+        self.crop_cache.invalidate(key)
+
+    def cache_stats(self):
+        return {"facts": self.fact_cache.stats(), "crops": self.crop_cache.stats()}
+
+    def store_reference_crop(self, chroma_id, crop):
+        """
+        v2.3: Saves a crop's pixels (plus dHash and a downscaled pyramid)
+        and points `chroma_id` at them. Identical pixels are stored once.
+        """
+        pixels = sentinel_crops.as_rgb_array(crop)
+        digest = sentinel_crops.crop_digest(pixels)
+
+        blob = CropBlob.get_or_none(CropBlob.digest == digest)
+        if blob is None:
+            blob = CropBlob.create(**self._pack_pixels(pixels, digest))
+
+        (ReferenceCrop
+         .insert(chroma_id=chroma_id, blob=blob)
+         .on_conflict(conflict_target=[ReferenceCrop.chroma_id], update={ReferenceCrop.blob: blob})
+         .execute())
+        return digest
+
+    def _pack_pixels(self, pixels, digest):
+        """v2.10: Appends pixels and their pyramid to the pack. Returns the CropBlob fields."""
+        offset = self.crop_pack.append(pixels)
+        pyramid = []
+        for level in sentinel_crops.build_pyramid(pixels):
+            pyramid.append([self.crop_pack.append(level), level.shape[0], level.shape[1]])
+        return {
+            'digest': digest,
+            'offset': offset,
+            'height': pixels.shape[0],
+            'width': pixels.shape[1],
+            'channels': pixels.shape[2],
+            'dhash': sentinel_crops.crop_dhash(pixels),
+            'pyramid': json.dumps(pyramid)
+        }
+
+    def _read_blob(self, blob, level=0):
+        """The blob at `level`, or its smallest level; full size for crops too small to halve."""
+        pyramid = json.loads(blob.pyramid) if level > 0 else []
+        if not pyramid:
+            return self.crop_pack.read(blob.offset, (blob.height, blob.width, blob.channels))
+        offset, height, width = pyramid[min(level, len(pyramid)) - 1]
+        return self.crop_pack.read(offset, (height, width, blob.channels))
+
+    def get_reference_crop(self, label, app_name, level=0):
+        """
+        v2.3: Returns (pixels, dhash_hex) for an element, or (None, None).
+        `level` > 0 returns a halved pyramid level instead of full size.
+        """
+        key = (app_name, label)
+        blob = self.crop_cache.get(key)
+        if blob is not _MISSING:
+            return (None, None) if blob is None else (self._read_blob(blob, level), blob.dhash)
 
-    def find_visual_match(self, query_embedding, num_results=1):
+        try:
+            crop = (ReferenceCrop
+                    .select(ReferenceCrop, CropBlob)
+                    .join(CropBlob)
+                    .where(ReferenceCrop.chroma_id == f"{app_name}_{label}")
+                    .get())
+            self.crop_cache.put(key, crop.blob)
+            return self._read_blob(crop.blob, level), crop.blob.dhash
+        except DoesNotExist:
+            self.crop_cache.put(key, None, ttl=CACHE_MISS_TTL_SECONDS)
+            return None, None
+        except Exception as e:
+            print(f"[Memory] Error reading reference crop: {e}")
+            return None, None
+
+    def iter_reference_crops(self, app_name=None):
+        """
+        v2.3: Yields (VisualFact, pixels) for every fact with stored
+        pixels, e.g. to re-embed everything after a model upgrade.
+        """
+        query = (VisualFact
+                 .select(VisualFact, AppContext, ReferenceCrop, CropBlob)
+                 .join(AppContext)
+                 .switch(VisualFact)
+                 .join(ReferenceCrop, on=(ReferenceCrop.chroma_id == VisualFact.chroma_id))
+                 .join(CropBlob))
+        if app_name:
+            query = query.where(AppContext.app_name == app_name)
+        for fact in query:
+            yield fact, self._read_blob(fact.referencecrop.blob)
+
+    @staticmethod
+    def _window_relative(x, y, window_rect):
+        if window_rect is None:
+            return None, None
+        return x - window_rect[0], y - window_rect[1]
+
+    @staticmethod
+    def _save_window_rect(app, window_rect):
+        left, top, right, bottom = window_rect
+        app.window_left = left
+        app.window_top = top
+        app.window_width = right - left
+        app.window_height = bottom - top
+        app.save()
+
+    def update_fact_position(self, label, app_name, x, y, window_rect=None):
+        """
+        Moves a known element's last-known coordinates without
+        touching its vector. Used when the locator finds it has moved.
+        """
+        try:
+            app = AppContext.get(AppContext.app_name == app_name)
+            changes = {VisualFact.last_known_x: x, VisualFact.last_known_y: y}
+            if window_rect is not None:
+                changes[VisualFact.window_x], changes[VisualFact.window_y] = self._window_relative(x, y, window_rect)
+            updated = (VisualFact
+                       .update(changes)
+                       .where(VisualFact.app_context == app, VisualFact.label == label)
+                       .execute())
+            self.fact_cache.invalidate((app_name, label))
+            return updated > 0
+        except DoesNotExist:
+            return False
+        except Exception as e:
+            print(f"[Memory] Error updating fact position: {e}")
+            return False
+
+    def find_visual_match(self, query_embedding, num_results=1, app_name=None, window_rect=None):
         """
         Finds the closest "Look" (what) in the vector database.
         "What element on screen is closest to this embedding?"
+        v2.10: Pass `app_name` to only search that app's elements, and
+        `window_rect` (left, top, right, bottom) to also drop elements that
+        would fall outside the window as it is now. The result gains a
+        "facts" list holding the joined VisualFact (with app_context) for
+        each id, or None where the fact no longer exists.
         """
-        if self.visual_collection is None:
-            self.init_db()
+        self.open_vectors()
             
         try:
-            results = self.visual_collection.query(
+            results = self.vectors.query(
                 query_embeddings=[query_embedding],
-                n_results=num_results
+                n_results=num_results,
+                app=app_name
             )
-            return results
         except Exception as e:
-            print(f"[Memory] Error querying ChromaDB: {e}")
-            return None
\ No newline at end of file
+            print(f"[Memory] Error querying vector backend: {e}")
+            return None
+
+        try:
+            metadatas = results["metadatas"][0]
+            pairs = [(metadata["app"], metadata["label"]) for metadata in metadatas]
+            facts = {}
+            if pairs:
+                query = (VisualFact
+                         .select(VisualFact, AppContext)
+                         .join(AppContext)
+                         .where(Tuple(AppContext.app_name, VisualFact.label).in_(pairs)))
+                facts = {(fact.app_context.app_name, fact.label): fact for fact in query}
+            matched = [facts.get(pair) for pair in pairs]
+        except Exception as e:
+            print(f"[Memory] Error joining matches to facts: {e}")
+            return None
+
+        keep = list(range(len(matched)))
+        if window_rect is not None:
+            width = window_rect[2] - window_rect[0]
+            height = window_rect[3] - window_rect[1]
+            keep = [i for i in keep if matched[i] is None or matched[i].window_x is None
+                    or (0 <= matched[i].window_x < width and 0 <= matched[i].window_y < height)]
+
+        return {
+            "ids": [[results["ids"][0][i] for i in keep]],
+            "distances": [[results["distances"][0][i] for i in keep]],
+            "metadatas": [[metadatas[i] for i in keep]],
+            "facts": [[matched[i] for i in keep]]
+        }
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import functools
+import concurrent.futures
+import sentinel_capture
+import sentinel_crops
+import sentinel_locator
+
+# --- Sentinel Agent Runtime (v1.0) ---
+# asyncio core for sentinel_agent. Each stage is a coroutine whose
+# blocking work runs on its own executor, so stages overlap instead of
+# queueing behind each other:
+#
+#   perceive  -> "io"      (pygetwindow / psutil)
+#   capture   -> "capture" (mss)
+#   recall    -> "memory"  (SQLite + crop pack; one thread keeps writes ordered)
+#   locate    -> "model"   (one thread: the model is serialized anyway)
+#   embed     -> "model"
+#   pixels    -> "cpu"     (template matching and hashing release the GIL)
+#
+# For a run of steps, the memory recall for step N+1 and the frame it
+# will be searched in are fetched while the model works on step N, and
+# learning (embed + store) finishes in the background. A step that has
+# to ask the model therefore costs about the model call alone.
+#
+# The stages call the agent's own functions (passed in), so the agent
+# keeps a single definition of how to perceive, capture, locate and embed.
+
+CPU_WORKERS = max(2, os.cpu_count() or 2)
+
+# -------------------------------------------
+
+class AgentRuntime:
+    def __init__(self, memory, perceive, capture, locate, embed, scope="window",
+                 cpu_workers=CPU_WORKERS, tag="[RUNTIME]"):
+        """
+        perceive()                  -> (app_name, window_title, window_rect)
+        capture(bbox)               -> sentinel_capture.Frame or None
+        locate(label, desc, frame)  -> (x, y) or (None, None)
+        embed(x, y, frame)          -> (embedding, crop) or (None, None)
+        """
+        self.memory = memory
+        self._perceive = perceive
+        self._capture = capture
+        self._locate = locate
+        self._embed = embed
+        self.scope = scope
+        self.tag = tag
+        self.pools = {
+            "io": concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="sentinel-io"),
+            "capture": concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="sentinel-capture"),
+            "memory": concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="sentinel-memory"),
+            "model": concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="sentinel-model"),
+            "cpu": concurrent.futures.ThreadPoolExecutor(cpu_workers, thread_name_prefix="sentinel-cpu"),
+        }
+
+    async def run_in(self, pool, fn, *args, **kwargs):
+        """Awaits fn(*args, **kwargs) on one of self.pools."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pools[pool], functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+
+    # --- Stages ---
+
+    async def perceive(self):
+        return await self.run_in("io", self._perceive)
+
+    async def capture(self, window_rect, bbox=None):
+        """The capture scope around window_rect, or exactly `bbox` if given."""
+        def work():
+            return self._capture(bbox or sentinel_capture.scope_bbox(window_rect, self.scope))
+        return await self.run_in("capture", work)
+
+    async def recall(self, label, app_name):
+        """Returns (fact, reference_pixels, reference_hash); any may be None."""
+        def work():
+            fact = self.memory.retrieve_fact_memory(label, app_name)
+            if fact is None:
+                return None, None, None
+            reference, reference_hash = self.memory.get_reference_crop(label, app_name)
+            return fact, reference, reference_hash
+        return await self.run_in("memory", work)
+
+    async def verify_pixels(self, fact, reference, reference_hash, window_rect):
+        """Model-free check around the fact's expected position. Returns (x, y, tier)."""
+        expected_x, expected_y = fact.position_in(window_rect)
+        locator = sentinel_locator.TieredLocator(sentinel_capture.grab_region)
+        return await self.run_in("cpu", locator.locate, reference, expected_x, expected_y,
+                                reference_hash=sentinel_crops.dhash_from_hex(reference_hash))
+
+    async def locate(self, label, description, frame):
+        return await self.run_in("model", self._locate, label, description, frame)
+
+    async def learn(self, label, app_name, window_title, window_rect, x, y, frame, notes):
+        embedding, crop = await self.run_in("model", self._embed, x, y, frame)
+        if not embedding:
+            print(f"{self.tag} Could not learn '{label}' (failed to get embedding).")
+            return False
+        await self.run_in("memory", self.memory.store_visual_memory,
+                          label=label, embedding=embedding, app_name=app_name,
+                          window_title=window_title, x=x, y=y, notes=notes,
+                          crop=crop, window_rect=window_rect)
+        return True
+
+    # --- Steps ---
+
+    async def run_steps(self, steps, expected_app=None):
+        """
+        Finds each (label, description) in `steps` in the active window:
+        remembered pixels first, the model only on a miss (and then the
+        element is re-learned in the background).
+        Steps must not change the screen: frames are prefetched.
+        Returns a list of {"label", "x", "y", "source"} dicts, where
+        source is "pixels", "model" or None (not found).
+        """
+        app_name, window_title, window_rect = await self.perceive()
+        if not app_name:
+            print(f"{self.tag} Perception failed. Cannot continue.")
+            return []
+        if expected_app and app_name != expected_app:
+            print(f"{self.tag} Active app is '{app_name}', not '{expected_app}'. Aborting.")
+            return []
+
+        recalls = {}
+        def prefetch_recall(i):
+            if i < len(steps) and i not in recalls:
+                recalls[i] = asyncio.ensure_future(self.recall(steps[i][0], app_name))
+
+        frame_task = None
+        background = []
+        results = []
+        for i, (label, description) in enumerate(steps):
+            start = time.perf_counter()
+            prefetch_recall(i)
+            prefetch_recall(i + 1)
+            if frame_task is None:
+                frame_task = asyncio.ensure_future(self.capture(window_rect))
+
+            fact, reference, reference_hash = await recalls.pop(i)
+            result = {"label": label, "x": None, "y": None, "source": None}
+            model_ms = 0
+
+            if reference is not None:
+                x, y, tier = await self.verify_pixels(fact, reference, reference_hash, window_rect)
+                if x is not None:
+                    if (x, y) != (fact.last_known_x, fact.last_known_y):
+                        background.append(asyncio.ensure_future(self.run_in(
+                            "memory", self.memory.update_fact_position,
+                            label, app_name, x, y, window_rect=window_rect)))
+                    result.update(x=x, y=y, source="pixels")
+
+            if result["source"] is None:
+                frame = await frame_task
+                frame_task = None
+                if frame is not None:
+                    model_start = time.perf_counter()
+                    model_task = asyncio.ensure_future(self.locate(label, description, frame))
+                    # Overlap: the next step's frame is captured while the model works
+                    if i + 1 < len(steps):
+                        frame_task = asyncio.ensure_future(self.capture(window_rect))
+                    x, y = await model_task
+                    model_ms = int((time.perf_counter() - model_start) * 1000)
+                    if x is not None:
+                        result.update(x=x, y=y, source="model")
+                        notes = f"Re-learned {label}" if fact else f"First time learning {label}"
+                        background.append(asyncio.ensure_future(self.learn(
+                            label, app_name, window_title, window_rect, x, y, frame, notes)))
+
+            step_ms = int((time.perf_counter() - start) * 1000)
+            if result["source"]:
+                print(f"{self.tag} '{label}' at ({result['x']}, {result['y']}) via {result['source']} "
+                      f"in {step_ms}ms (model {model_ms}ms).")
+            else:
+                print(f"{self.tag} Could not find '{label}' ({step_ms}ms).")
+            results.append(result)
+
+        if frame_task is not None:
+            background.append(frame_task)
+        for task in recalls.values():
+            background.append(task)
+        if background:
+            await asyncio.gather(*background)
+        return results
@@ -1,20 +1,10 @@
+import time
+STARTUP_START = time.perf_counter() # v3.6.0: Measured against sentinel_lazy.IMPORT_BUDGET_MS
 import sys
 import os
 import json
-import time
-from PIL import Image, ImageDraw
-from llama_cpp import Llama
-import pyautogui
+import sentinel_lazy
 import sentinel_memory
-import pygetwindow as gw
-import psutil
-from pathlib import Path 
-import mss
-import base64
-import io
-import tkinter as tk
-from tkinter import simpledialog, messagebox
-import re 
 import ctypes
 from ctypes import wintypes
 
@@ -32,13 +22,20 @@ except Exception as e:
     except Exception as e2:
         print(f"[INIT] WARNING: Could not set DPI awareness: {e} / {e2}")
 
+# v3.6.0: Heavy modules are executed on first use, not at startup
+pyautogui = sentinel_lazy.lazy_import('pyautogui')
+sentinel_inference = sentinel_lazy.lazy_import('sentinel_inference')
+sentinel_capture = sentinel_lazy.lazy_import('sentinel_capture')
+gw = sentinel_lazy.lazy_import('pygetwindow')
+psutil = sentinel_lazy.lazy_import('psutil')
+tk = sentinel_lazy.lazy_import('tkinter')
+
 # v3.0.1: RE-ADD PYWIN32 CHECK (was accidentally deleted)
-try:
-    import win32process
-    import win32gui
-    PYWIN32_INSTALLED = True
-except ImportError:
-    PYWIN32_INSTALLED = False
+PYWIN32_INSTALLED = sentinel_lazy.is_installed('win32process')
+if PYWIN32_INSTALLED:
+    win32process = sentinel_lazy.lazy_import('win32process')
+    win32gui = sentinel_lazy.lazy_import('win32gui')
+else:
     print("[INIT] WARNING: 'pywin32' not found. App/window perception may fail on Windows.")
     print("[INIT] Please run: pip install pywin32")
 
@@ -69,9 +66,14 @@ try:
     SCREENSHOT_FILE_READ_COORDS = os.path.join(DB_PATH, "_temp_screenshot_read_coords.png") # Not used in v3.0.0
     SCREENSHOT_FILE_FULL = os.path.join(DB_PATH, "_temp_screenshot_full_marked.png")
     SCREENSHOT_FILE_CROP = os.path.join(DB_PATH, "_temp_screenshot_crop.png")
+    # v3.3.0: Screenshots stay in memory. Set "debug_screenshots": true to
+    # also write the two files above (in the background).
+    DEBUG_SCREENSHOTS = config.get('debug_screenshots', False)
+    debug_writer = None # v3.6.0: Created in main()
     
-    memory = sentinel_memory.Memory(DB_PATH)
-    llm = None
+    # v3.5.0: "numpy" (built-in index) or "chroma"
+    memory = sentinel_memory.Memory(DB_PATH, vector_backend=config.get('vector_backend', 'chroma'))
+    eyes = None # v3.1.0: Inference daemon client (or in-process engine)
     
 except FileNotFoundError:
     print("ERROR: sentinel_config.json not found.")
@@ -80,26 +82,8 @@ except KeyError as e:
     print(f"ERROR: Config file is missing a key: {e}")
     sys.exit(1)
 
-# --- 2. PROMPTS (v3.0.0) ---
-VISION_PROMPT_GET_EMBEDDING = (
-    "USER: [Image]Look at this small, cropped image of a user interface element. "
-    "Generate a vector embedding for this image."
-)
-
-# v2.9.9: This prompt is no longer needed as we use get_true_mouse_position()
-# VISION_PROMPT_READ_COORDS = ...
-
-VISION_PROMPT_VERIFY_COORDS = (
-    "USER: [Image]Look at this screenshot of a user's entire desktop. "
-    "A large, red 'X' has been drawn to mark the user's mouse position. "
-    "Your goal is to verify this position. The user is also running a coordinate app. "
-    "1. Find the center of the large red 'X' marker. What are its (x, y) coordinates? "
-    "2. Find the coordinate application window (it has text like 'Physical', 'Scaled'). "
-    "3. Read the 'Physical' X and Y coordinates from that app. "
-    "4. The system reports the marker is at ({x}, {y}). Do the 'X' position and the app's 'Physical' coordinates BOTH closely match this system coordinate? "
-    "Respond ONLY with JSON: "
-    "{{\"marker_x\": <found_marker_x>, \"marker_y\": <found_marker_y>, \"app_x\": <read_app_x>, \"app_y\": <read_app_y>, \"match\": <true_or_false>, \"reason\": \"<your_analysis>\"}}"
-)
+# --- 2. PROMPTS ---
+# v3.1.0: Prompts now live in sentinel_inference.py, shared with the agent.
 
 # -------------------------------------------
 
@@ -118,17 +102,20 @@ def create_topmost_root(x=None, y=None):
     return root
 
 def show_info_popup(title, message, x=None, y=None):
+    from tkinter import messagebox
     root = create_topmost_root(x, y)
     messagebox.showinfo(title, message, parent=root)
     root.destroy()
 
 def ask_text_popup(title, prompt, x=None, y=None):
+    from tkinter import simpledialog
     root = create_topmost_root(x, y)
     result = simpledialog.askstring(title, prompt, parent=root)
     root.destroy()
     return result
 
 def ask_yes_no_popup(title, question, x=None, y=None):
+    from tkinter import messagebox
     root = create_topmost_root(x, y)
     result = messagebox.askyesno(title, question, parent=root)
     root.destroy()
@@ -138,79 +125,59 @@ def ask_yes_no_popup(title, question, x=None, y=None):
 
 def take_and_process_screenshots(x, y, crop_width=64, crop_height=64):
     """
-    v2.9.8: "One Grab, Two Crops"
-    Takes ONE screenshot, draws the 'X', and generates both
-    the full image and the cropped image using PIL.
+    v3.3.0: "One Grab, Zero Copies"
+    Takes ONE screenshot and keeps it as a single in-memory Frame.
+    The crop is copied out (64x64) before the 'X' is drawn into the
+    frame, and nothing is PNG-encoded here: callers encode only what
+    they actually send to the model or show the user.
+    v3.6.1: Always the whole virtual screen, so the MPos app is in the
+    shot whichever monitor it is on. (x, y) are absolute desktop
+    coordinates; the crop and the 'X' are mapped into the frame.
+    Returns (marked_frame, crop_pixels, crop_png_bytes).
     """
     try:
-        with mss.mss() as sct:
-            # 1. Grab the entire virtual screen
-            print("[EYES] Capturing full virtual screen...")
-            monitor_bbox = sct.monitors[0]
-            sct_img = sct.grab(monitor_bbox)
-            
-            # 2. Convert to PIL Image
-            pil_img = Image.frombytes("RGB", sct_img.size, sct_img.rgb)
-            draw = ImageDraw.Draw(pil_img)
-
-            # 3. Draw the "X" marker
-            # Adjust coords from absolute virtual screen to relative PIL image coords
-            draw_x = x - monitor_bbox["left"]
-            draw_y = y - monitor_bbox["top"]
-            
-            size = 30
-            color = (255, 0, 0) # Bright red
-            stroke_width = 5
-            
-            print(f"[EYES] Drawing 'X' at relative image coords ({draw_x}, {draw_y})...")
-            draw.line((draw_x - size, draw_y - size, draw_x + size, draw_y + size), fill=color, width=stroke_width)
-            draw.line((draw_x + size, draw_y - size, draw_x - size, draw_y + size), fill=color, width=stroke_width)
-
-            # 4. Save the FULL marked-up image to bytes
-            print("[EYES] Saving full image to bytes...")
-            full_img_byte_arr = io.BytesIO()
-            pil_img.save(full_img_byte_arr, format='PNG')
-            full_img_bytes = full_img_byte_arr.getvalue()
-            with open(SCREENSHOT_FILE_FULL, "wb") as f:
-                f.write(full_img_bytes)
-            print(f"[EYES] Full screenshot saved to: {SCREENSHOT_FILE_FULL}")
-
-            # 5. CROP the PIL image
-            print(f"[EYES] Cropping image at relative coords ({draw_x}, {draw_y})...")
-            crop_box = (
-                draw_x - (crop_width // 2),
-                draw_y - (crop_height // 2),
-                draw_x + (crop_width // 2),
-                draw_y + (crop_height // 2)
-            )
-            pil_crop = pil_img.crop(crop_box)
+        # 1. Grab the entire virtual screen
+        print("[EYES] Capturing full virtual screen...")
+        frame = sentinel_capture.grab()
+
+        # 2. CROP the clean target (absolute coords; crop_rgb maps them into the frame)
+        print(f"[EYES] Cropping image at ({x}, {y})...")
+        crop_box = (
+            x - (crop_width // 2),
+            y - (crop_height // 2),
+            x + (crop_width // 2),
+            y + (crop_height // 2)
+        )
+        crop_pixels = frame.crop_rgb(crop_box)
+        crop_bytes = frame.encode_png(crop_box) # Tiny, and the embedder needs bytes
 
-            # 6. Save the CROP image to bytes
-            print("[EYES] Saving cropped image to bytes...")
-            crop_img_byte_arr = io.BytesIO()
-            pil_crop.save(crop_img_byte_arr, format='PNG')
-            crop_img_bytes = crop_img_byte_arr.getvalue()
-            with open(SCREENSHOT_FILE_CROP, "wb") as f:
-                f.write(crop_img_bytes)
-            print(f"[EYES] Cropped screenshot saved to: {SCREENSHOT_FILE_CROP}")
+        # 3. Draw the "X" marker straight into the frame buffer
+        print(f"[EYES] Drawing 'X' at ({x}, {y})...")
+        sentinel_capture.draw_x_marker(frame, x, y)
 
-            # 7. Return everything
-            return (full_img_bytes, SCREENSHOT_FILE_FULL, 
-                    crop_img_bytes, SCREENSHOT_FILE_CROP)
+        # 4. Optional debug copies, written off-thread
+        debug_writer.submit(SCREENSHOT_FILE_FULL, frame)
+        debug_writer.submit(SCREENSHOT_FILE_CROP, crop_bytes)
+
+        return frame, crop_pixels, crop_bytes
 
     except Exception as e:
         print(f"[EYES] Error: Could not take/process screenshots: {e}")
-        return None, None, None, None
+        return None, None, None
 
 
 def perceive_environment():
-    """Determines the currently active application and window."""
+    """
+    Determines the currently active application and window.
+    Returns (app_name, title, window_rect), window_rect being the
+    window's (left, top, right, bottom) in absolute screen coords.
+    """
     print("[PERCEIVE] Analyzing active window...")
     try:
         active_window = gw.getActiveWindow()
         if not active_window:
             print("[PERCEIVE] No active window found.")
-            return None, None
+            return None, None, None
         title = active_window.title
         pid = None
         if os.name == 'nt' and PYWIN32_INSTALLED:
@@ -221,44 +188,29 @@ def perceive_environment():
         
         if not pid:
              print(f"[PERCEIVE] Could not determine Process ID for window.")
-             return None, None
+             return None, None, None
         process = psutil.Process(pid)
         app_name = process.name()
+        window_rect = (active_window.left, active_window.top,
+                       active_window.right, active_window.bottom)
         print(f"[PERCEIVE] Identified App: {app_name}, Title: {title}")
-        return app_name, title
+        return app_name, title, window_rect
     except Exception as e:
         print(f"[PERCEIVE] Error: Could not get active window: {e}")
-        return None, None
+        return None, None, None
 
 def load_ai_model():
-    """Loads the Llama model into memory."""
-    global llm
-    if llm:
+    """
+    v3.1.0: Connects to the shared inference daemon (sentinel_inference.py).
+    Falls back to loading the model in-process if the daemon is not running.
+    """
+    global eyes
+    if eyes:
         return
-        
-    print(f"[TEACHER] Loading Gemma 3 model... (This may take a moment)")
-    
-    if not os.path.exists(MODEL_PATH):
-        print(f"ERROR: 'model_path' not found: {MODEL_PATH}")
-        sys.exit(1)
-    if not os.path.exists(MMPROJ_PATH):
-        print(f"ERROR: 'mmproj_path' not found: {MMPROJ_PATH}")
-        print("This file is the 'Eyes' of the model and is required for vision.")
-        sys.exit(1)
 
-    try:
-        llm = Llama(
-            model_path=MODEL_PATH,
-            mmproj_path=MMPROJ_PATH, 
-            n_ctx=2048,
-            n_batch=512,
-            logits_all=True,
-            embedding=True,
-            verbose=False
-        )
-        print("[TEACHER] Model loaded successfully.")
-    except Exception as e:
-        print(f"[TEACHER] CRITICAL ERROR: Failed to load model: {e}")
+    eyes = sentinel_inference.connect(config, tag="[TEACHER]")
+    if eyes is None:
+        print("[TEACHER] CRITICAL ERROR: No inference daemon and model failed to load.")
         sys.exit(1)
 
 
@@ -274,47 +226,12 @@ def verify_coordinates_with_ai(img_bytes, x, y):
     Asks the AI to find the mouse and coord app in a full screenshot.
     """
     print(f"[TEACHER] Asking AI to verify coordinates ({x}, {y})...")
-    try:
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        image_uri = f"data:image/png;base64,{img_base64}"
-        
-        prompt = VISION_PROMPT_VERIFY_COORDS.format(x=x, y=y)
-        
-        messages = [
-            {"role": "user",
-             "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_uri}}
-             ]}
-        ]
-    
-        response = llm.create_chat_completion(
-            messages=messages,
-            max_tokens=256 # Increased for the JSON response
-        )
-        
-        response_text = response['choices'][0]['message']['content'].strip()
-        print(f"[TEACHER] AI Verification Response Text: {response_text}")
-
-        # Extract JSON from the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not json_match:
-            print("[TEACHER] AI did not return valid JSON for verification.")
-            return False, "AI did not return valid JSON."
-
-        data = json.loads(json_match.group(0))
-        print(f"[TEACHER] AI Verification Data: {data}")
-        
-        if data.get("match") == True:
-            print("[TEACHER] AI verification successful!")
-            return True, data.get("reason", "No reason provided.")
-        else:
-            print("[TEACHER] AI verification failed.")
-            return False, data.get("reason", "No reason provided.")
-
-    except Exception as e:
-        print(f"[TEACHER] Error during AI verification: {e}")
-        return False, str(e)
+    is_verified, reason = eyes.verify_coordinates(img_bytes, x, y)
+    if is_verified:
+        print("[TEACHER] AI verification successful!")
+    else:
+        print("[TEACHER] AI verification failed.")
+    return is_verified, reason
 
 
 def get_visual_embedding(img_bytes):
@@ -322,40 +239,17 @@ def get_visual_embedding(img_bytes):
     Gets a visual embedding from a CROPPED image's bytes.
     """
     print(f"[EYES] Generating embedding from cropped image...")
-    try:
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        image_uri = f"data:image/png;base64,{img_base64}"
-        
-        prompt = VISION_PROMPT_GET_EMBEDDING
-        messages = [
-            {"role": "user",
-             "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_uri}} 
-             ]}
-        ]
-    
-        response = llm.create_chat_completion(
-            messages=messages,
-            max_tokens=100
-        )
-        
-        print(f"[EYES] Full Embedding Response: {response}")
-        
-        if 'embedding' in response and response['embedding']:
-            embedding = response['embedding']
-            print(f"[EYES] Successfully generated embedding (Size: {len(embedding)}).")
-            return embedding
-        else:
-            print("[EYES] Error: Model response did not contain an embedding.")
-            return None
-            
-    except Exception as e:
-        print(f"[EYES] Error generating embedding: {e}")
-        return None
+    embedding = eyes.embed_crop(img_bytes)
+    if embedding:
+        print(f"[EYES] Successfully generated embedding (Size: {len(embedding)}).")
+    return embedding
 
 def main():
-    print("--- Sentinel School v3.0.1 (Learning Wizard) ---")
+    global debug_writer
+    print("--- Sentinel School v3.6.1 (Learning Wizard) ---")
+    sentinel_lazy.check_import_budget(STARTUP_START, "[STARTUP]",
+                                      config.get('import_budget_ms', sentinel_lazy.IMPORT_BUDGET_MS))
+    debug_writer = sentinel_capture.DebugWriter(enabled=DEBUG_SCREENSHOTS)
     
     print(f"Initializing memory at: {DB_PATH}")
     memory.init_db()
@@ -384,7 +278,7 @@ def main():
             "Please switch to the application window you want to teach me about.\n\nClick 'OK' *after* you have switched.",
             x=current_x, y=current_y
         )
-        app_name, window_title = perceive_environment()
+        app_name, window_title, window_rect = perceive_environment()
         if not app_name:
             print("Could not identify application. Aborting.")
             return
@@ -410,13 +304,12 @@ def main():
 
 
         # 5. --- AI VERIFICATION STEP ---
-        (full_screen_bytes, full_screen_path, 
-         crop_bytes, crop_path) = take_and_process_screenshots(x=x, y=y)
+        marked_frame, crop_pixels, crop_bytes = take_and_process_screenshots(x=x, y=y)
         
-        if not full_screen_bytes:
+        if marked_frame is None:
             raise Exception("Failed to take screenshots.")
 
-        Image.open(full_screen_path).show()
+        marked_frame.to_image().show()
         is_visible = ask_yes_no_popup(
             "Sentinel Teacher",
             "I've opened the SECOND screenshot.\n\nIs the RED 'X' on the correct target?\nIs the MPos app also visible?",
@@ -427,7 +320,8 @@ def main():
             return
             
         # v3.0.0: Re-enabled verification
-        is_verified, reason = verify_coordinates_with_ai(full_screen_bytes, x, y)
+        # v3.6.1: Absolute coordinates, the same 'Physical' ones MPos shows
+        is_verified, reason = verify_coordinates_with_ai(marked_frame.encode_png(), x, y)
         if not is_verified:
            print(f"[TEACHER] AI coordinate verification failed: {reason}")
            show_info_popup("Sentinel Teacher", f"AI VERIFICATION FAILED:\n\n{reason}\n\nAborting.", x=x, y=y)
@@ -436,7 +330,8 @@ def main():
 
 
         # 6. --- EMBEDDING STEP ---
-        Image.open(crop_path).show()
+        from PIL import Image
+        Image.fromarray(crop_pixels).show()
         is_correct_target = ask_yes_no_popup(
             "Sentinel Teacher",
             "I've opened the CROPPED screenshot.\n\nIs this the correct image of the target?",
@@ -458,7 +353,9 @@ def main():
                 window_title=window_title,
                 x=x,
                 y=y,
-                notes=f"Taught by user in Sentinel School. AI Verified: {reason}"
+                notes=f"Taught by user in Sentinel School. AI Verified: {reason}",
+                crop=crop_pixels, # v3.2.0: Keep the pixels
+                window_rect=window_rect # v3.6.1: Position is also kept window-relative
             )
             print("\n--- ✅ SUCCESS! ---")
             show_info_popup(
@@ -479,14 +376,18 @@ def main():
     except Exception as e:
         print(f"\n[TEACHER] A critical error occurred: {e}")
     finally:
-        # Clean up temp screenshots
-        if os.path.exists(SCREENSHOT_FILE_READ_COORDS):
-            os.remove(SCREENSHOT_FILE_READ_COORDS)
-        if os.path.exists(SCREENSHOT_FILE_FULL):
-            os.remove(SCREENSHOT_FILE_FULL)
-        if os.path.exists(SCREENSHOT_FILE_CROP):
-            os.remove(SCREENSHOT_FILE_CROP)
-        print("Cleanup complete.")
+        debug_writer.flush()
+        if DEBUG_SCREENSHOTS:
+            print(f"Debug screenshots kept in: {DB_PATH}")
+        else:
+            # Clean up temp screenshots (left behind by older versions)
+            if os.path.exists(SCREENSHOT_FILE_READ_COORDS):
+                os.remove(SCREENSHOT_FILE_READ_COORDS)
+            if os.path.exists(SCREENSHOT_FILE_FULL):
+                os.remove(SCREENSHOT_FILE_FULL)
+            if os.path.exists(SCREENSHOT_FILE_CROP):
+                os.remove(SCREENSHOT_FILE_CROP)
+            print("Cleanup complete.")
         
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+import json
+import time
+import asyncio
+import numpy as np
+import sentinel_capture
+
+try:
+    import yaml
+    YAML_INSTALLED = True
+except ImportError:
+    YAML_INSTALLED = False
+
+# --- Sentinel Task Runner (v1.0) ---
+# Runs declarative step lists against Memory. This is the general form
+# of _legacy/sentinel_vision.py's hard-coded "Share & export" ->
+# "Copy contents" sequence (see tasks/gemini_copy_code.json):
+#
+#   {"app": "chrome.exe", "steps": [
+#       {"action": "locate", "label": "...", "description": "...",
+#        "region": {"around": "previous", "left": -100, "top": 0, "right": 200, "bottom": 200}},
+#       {"action": "click"},
+#       {"action": "wait_for_change", "timeout": 3},
+#       {"action": "read_clipboard", "output": "clipboard_content.txt"}
+#   ]}
+#
+# Actions:
+#   locate          Remembered pixels first, the model (within "region") on
+#                   a miss, which is then learned in the background.
+#   click           Clicks the last located element (or "label"), after
+#                   snapshotting the screen for the next wait_for_change.
+#   wait_for_change Polls screen tiles until they change and settle,
+#                   instead of sleeping for the worst case.
+#   read_clipboard  Polls the clipboard until it holds something new.
+#
+# Plans are JSON, or YAML when PyYAML is installed.
+
+POLL_INTERVAL = 0.03    # Seconds between screen / clipboard polls
+DEFAULT_TIMEOUT = 5.0   # Seconds a wait may take before the step fails
+SETTLE_POLLS = 2        # Identical polls in a row after a change = "settled"
+
+# -------------------------------------------
+
+def load_plan(path):
+    """Reads a plan file. Returns the plan dict, or None on failure."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith(('.yaml', '.yml')):
+                if not YAML_INSTALLED:
+                    print("[TASKS] ERROR: YAML plans need PyYAML. Please run: pip install pyyaml")
+                    return None
+                plan = yaml.safe_load(f)
+            else:
+                plan = json.load(f)
+    except FileNotFoundError:
+        print(f"[TASKS] ERROR: Plan not found: {path}")
+        return None
+    except Exception as e:
+        print(f"[TASKS] ERROR: Could not read plan '{path}': {e}")
+        return None
+
+    if not isinstance(plan, dict) or not isinstance(plan.get("steps"), list):
+        print(f"[TASKS] ERROR: Plan '{path}' needs a 'steps' list.")
+        return None
+    for i, step in enumerate(plan["steps"], 1):
+        action = step.get("action") if isinstance(step, dict) else None
+        if action not in TaskRunner.ACTIONS:
+            print(f"[TASKS] ERROR: Step {i} has unknown action '{action}'. "
+                  f"Choose from: {', '.join(TaskRunner.ACTIONS)}")
+            return None
+        if action == "locate" and "label" not in step:
+            print(f"[TASKS] ERROR: Step {i} (locate) needs a 'label'.")
+            return None
+    return plan
+
+
+class TaskRunner:
+    """
+    Executes a plan on a sentinel_runtime.AgentRuntime. `click(x, y)` and
+    `paste()` are the agent's "Hands" (pyautogui / pyperclip).
+    """
+    ACTIONS = ("locate", "click", "wait_for_change", "read_clipboard")
+
+    def __init__(self, runtime, click, paste, tag="[TASKS]"):
+        self.runtime = runtime
+        self.click = click
+        self.paste = paste
+        self.tag = tag
+
+    async def run(self, plan):
+        """Runs every step in order. Returns the final state dict, or None on failure."""
+        rt = self.runtime
+        app_name, window_title, window_rect = await rt.perceive()
+        if not app_name:
+            print(f"{self.tag} Perception failed. Cannot continue.")
+            return None
+        if plan.get("app") and app_name != plan["app"]:
+            print(f"{self.tag} Active app is '{app_name}', not '{plan['app']}'. Aborting.")
+            return None
+
+        state = {
+            "app_name": app_name,
+            "window_title": window_title,
+            "window_rect": window_rect,
+            "position": None,   # Last located (x, y)
+            "positions": {},    # label -> (x, y)
+            "watch": None,      # (bbox, tile hashes) taken before the last click
+            "clipboard": await rt.run_in("io", self.paste),
+            "background": [],
+        }
+        run_start = time.perf_counter()
+        try:
+            for i, step in enumerate(plan["steps"], 1):
+                start = time.perf_counter()
+                ok = await getattr(self, f"_{step['action']}")(step, state)
+                step_ms = int((time.perf_counter() - start) * 1000)
+                if not ok:
+                    print(f"{self.tag} Step {i} ({step['action']}) failed after {step_ms}ms. Stopping.")
+                    return None
+                print(f"{self.tag} Step {i} ({step['action']}) done in {step_ms}ms.")
+        finally:
+            if state["background"]:
+                await asyncio.gather(*state["background"])
+
+        print(f"{self.tag} Plan complete in {int((time.perf_counter() - run_start) * 1000)}ms.")
+        return state
+
+    # --- Regions ---
+
+    def _region(self, spec, state):
+        """
+        Absolute (left, top, right, bottom) for a step's "region", or None
+        for the whole capture scope. {"around": "previous" | <label>, ...}
+        offsets the edges from that element's center; {"bbox": [...]} is
+        taken as-is.
+        """
+        if not spec:
+            return None
+        if "bbox" in spec:
+            return tuple(spec["bbox"])
+        anchor = spec.get("around", "previous")
+        center = state["position"] if anchor == "previous" else state["positions"].get(anchor)
+        if center is None:
+            print(f"{self.tag} WARNING: No position for region anchor '{anchor}'. Using the whole window.")
+            return None
+        x, y = center
+        return (x + spec.get("left", -128), y + spec.get("top", -128),
+                x + spec.get("right", 128), y + spec.get("bottom", 128))
+
+    def _watch_box(self, step, state):
+        return (self._region(step.get("watch"), state)
+                or sentinel_capture.scope_bbox(state["window_rect"], self.runtime.scope))
+
+    async def _snapshot(self, bbox):
+        frame = await self.runtime.run_in("capture", sentinel_capture.grab, bbox)
+        return sentinel_capture.tile_hashes(frame)
+
+    # --- Actions ---
+
+    async def _locate(self, step, state):
+        rt = self.runtime
+        label = step["label"]
+        description = step.get("description", label)
+
+        fact, reference, reference_hash = await rt.recall(label, state["app_name"])
+        x = y = None
+        if reference is not None:
+            x, y, tier = await rt.verify_pixels(fact, reference, reference_hash, state["window_rect"])
+            if x is not None and (x, y) != (fact.last_known_x, fact.last_known_y):
+                state["background"].append(asyncio.ensure_future(rt.run_in(
+                    "memory", rt.memory.update_fact_position,
+                    label, state["app_name"], x, y, window_rect=state["window_rect"])))
+
+        if x is None:
+            frame = await rt.capture(state["window_rect"], bbox=self._region(step.get("region"), state))
+            if frame is None:
+                return False
+            x, y = await rt.locate(label, description, frame)
+            if x is None:
+                return False
+            notes = f"Learned by task step '{label}'"
+            state["background"].append(asyncio.ensure_future(rt.learn(
+                label, state["app_name"], state["window_title"], state["window_rect"], x, y, frame, notes)))
+
+        state["position"] = (x, y)
+        state["positions"][label] = (x, y)
+        return True
+
+    async def _click(self, step, state):
+        target = state["positions"].get(step["label"]) if "label" in step else state["position"]
+        if target is None:
+            print(f"{self.tag} Nothing located to click.")
+            return False
+        x, y = target[0] + step.get("dx", 0), target[1] + step.get("dy", 0)
+
+        # Snapshot first, so wait_for_change sees what the click changed
+        watch_box = await self.runtime.run_in("capture", self._watch_box, step, state)
+        state["watch"] = (watch_box, await self._snapshot(watch_box))
+        state["clipboard"] = await self.runtime.run_in("io", self.paste)
+
+        print(f"[HANDS] Clicking ({x}, {y})...")
+        await self.runtime.run_in("io", self.click, x, y)
+        return True
+
+    async def _wait_for_change(self, step, state):
+        if state["watch"] is not None:
+            watch_box, before = state["watch"]
+        else:
+            watch_box = await self.runtime.run_in("capture", self._watch_box, step, state)
+            before = await self._snapshot(watch_box)
+        state["watch"] = None
+
+        deadline = time.monotonic() + step.get("timeout", DEFAULT_TIMEOUT)
+        changed = False
+        last = None
+        stable = 0
+        while time.monotonic() < deadline:
+            hashes = await self._snapshot(watch_box)
+            if not changed:
+                changed = bool(sentinel_capture.changed_tiles(before, hashes).any())
+            elif np.array_equal(hashes, last):
+                stable += 1
+                if stable >= SETTLE_POLLS:
+                    return True
+            else:
+                stable = 0
+            last = hashes
+            await asyncio.sleep(POLL_INTERVAL)
+
+        if changed:
+            print(f"{self.tag} Screen was still changing at the timeout. Continuing.")
+            return True
+        print(f"{self.tag} Screen did not change within {step.get('timeout', DEFAULT_TIMEOUT)}s.")
+        return False
+
+    async def _read_clipboard(self, step, state):
+        deadline = time.monotonic() + step.get("timeout", DEFAULT_TIMEOUT)
+        while True:
+            content = await self.runtime.run_in("io", self.paste)
+            if content and content != state["clipboard"]:
+                break
+            if time.monotonic() >= deadline:
+                print(f"{self.tag} Clipboard content did not change. Click may have failed.")
+                return False
+            await asyncio.sleep(POLL_INTERVAL)
+
+        print(f"{self.tag} New content detected on clipboard ({len(content)} chars).")
+        state["clipboard"] = content
+        if step.get("output"):
+            with open(step["output"], 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"{self.tag} Clipboard saved to '{step['output']}'.")
+        return True
@@ -0,0 +1,457 @@
+import os
+import json
+import uuid
+import threading
+import numpy as np
+import sentinel_filelock
+
+# --- Sentinel Vector Backends (v1.3) ---
+# Where Memory keeps the "Looks". Every backend answers upsert() and
+# query() with the same shapes ChromaDB uses, so Memory does not care
+# which one it holds:
+#
+#   "numpy"  -> NumpyBackend: a memory-mapped float32 matrix next to
+#               sentinel_facts.db, brute-force cosine search, and an
+#               optional HNSW index (hnswlib) once it grows large.
+#   "chroma" -> ChromaBackend: the original ChromaDB collection.
+#
+# v1.1: query(..., app=name) searches only that app's vectors (the "app"
+# metadata every Look is stored with).
+# v1.2: The numpy index is an append-only journal, and the vector file is
+# cut back to the journal's row count on open, so a crash mid-upsert
+# cannot leave rows that no longer line up with their ids.
+# v1.3: The numpy store is safe to share between processes (agent and
+# school): writes are serialized by a file lock and readers follow the
+# journal.
+
+VECTOR_FILE_NAME = 'sentinel_vectors.f32'
+CHROMA_DIR_NAME = 'sentinel_visuals' # ChromaBackend's PersistentClient directory
+INDEX_FILE_NAME = 'sentinel_vectors.jsonl'       # v1.2: Append-only journal
+LEGACY_INDEX_FILE_NAME = 'sentinel_vectors.json' # v1.0/v1.1 index, migrated on open
+LOCK_FILE_NAME = 'sentinel_vectors.lock'         # v1.3: Held by whichever process is writing
+HNSW_THRESHOLD = 20000 # Rows before an HNSW index is worth building (if hnswlib is installed)
+COMPACT_MIN_LINES = 1024 # Journal lines before compaction is considered...
+COMPACT_RATIO = 2        # ...and then done once there are this many lines per row
+
+# -------------------------------------------
+
+class VectorBackend:
+    """Interface. All embeddings are compared by cosine distance."""
+    name = "base"
+
+    def open(self):
+        raise NotImplementedError
+
+    def upsert(self, ids, embeddings, metadatas):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results=1, app=None):
+        """
+        Returns a ChromaDB-shaped result:
+        {"ids": [[...]], "distances": [[...]], "metadatas": [[...]]}
+        with one inner list per query embedding.
+        v1.1: Pass `app` to only search vectors stored for that app.
+        """
+        raise NotImplementedError
+
+    def export(self):
+        """Returns (ids, embeddings, metadatas) for everything stored."""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    """The original ChromaDB 'visual_elements' collection."""
+    name = "chroma"
+
+    def __init__(self, db_path):
+        self.chroma_path = os.path.join(db_path, CHROMA_DIR_NAME)
+        self.collection = None
+
+    def open(self):
+        import chromadb
+        # We use a persistent client that saves to disk
+        client = chromadb.PersistentClient(path=self.chroma_path)
+        self.collection = client.get_or_create_collection(
+            name="visual_elements",
+            metadata={"hnsw:space": "cosine"} # Use cosine distance for search
+        )
+
+    def upsert(self, ids, embeddings, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results=1, app=None):
+        # v1.1: Chroma prefilters on metadata before the nearest-neighbour search
+        where = {"app": app} if app is not None else None
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def export(self):
+        data = self.collection.get(include=["embeddings", "metadatas"])
+        return data["ids"], data["embeddings"], data["metadatas"]
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Unit-normalized float32 rows in one flat file, memory-mapped for
+    search. Upserts overwrite existing rows in place and write new ones
+    at the offset the index says comes next.
+    v1.1: Rows are also partitioned by app, so an app-scoped query only
+    scores that app's rows.
+    v1.2: Row order and metadata live in a JSON-lines journal: a
+    {"dim": N} header, then one {"id", "metadata"} line per upserted
+    entry (the last line for an id wins). An upsert appends its lines
+    after its vectors are written; the journal is rewritten only when it
+    is compacted.
+    v1.3: Several processes (the agent and the school) may share one
+    store. Writers hold an inter-process file lock and first read the
+    journal lines other processes appended, so new rows go after theirs.
+    Queries pick up those lines too. Every rewritten journal gets a new
+    header, which tells readers to reload it from the start.
+    """
+    name = "numpy"
+
+    def __init__(self, db_path, hnsw_threshold=HNSW_THRESHOLD):
+        self.vector_file = os.path.join(db_path, VECTOR_FILE_NAME)
+        self.index_file = os.path.join(db_path, INDEX_FILE_NAME)
+        self.legacy_index_file = os.path.join(db_path, LEGACY_INDEX_FILE_NAME)
+        self.hnsw_threshold = hnsw_threshold
+        self.dim = None
+        self.ids = []
+        self.metadatas = []
+        self._rows = {} # id -> row number
+        self._partitions = {} # app -> np.array of row numbers
+        self._journal_lines = 0 # Entry lines in the journal (excluding the header)
+        self._journal_bytes = 0 # v1.3: How much of the journal has been read
+        self._journal_header = None # v1.3: Its first line, as read
+        self._journal_stat = None # v1.3: (size, mtime) when last read
+        self._matrix = None
+        self._hnsw = None
+        self._hnsw_rows = 0 # v1.3: Rows already added to the HNSW index
+        self._hnsw_stale = False # v1.3: An indexed row was overwritten, so the index needs a rebuild
+        self._lock = threading.Lock()
+        self._file_lock = sentinel_filelock.FileLock(os.path.join(db_path, LOCK_FILE_NAME))
+
+    def open(self):
+        with self._lock, self._file_lock:
+            if not os.path.exists(self.index_file) and os.path.exists(self.legacy_index_file):
+                self._migrate_legacy_index()
+            self._reload(truncate_torn=True)
+            self._truncate_vectors()
+            self._remap()
+
+    def _migrate_legacy_index(self):
+        """v1.2: Rewrites a v1.0/v1.1 sentinel_vectors.json as the journal."""
+        with open(self.legacy_index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.dim = index["dim"]
+        self.ids = index["ids"]
+        self.metadatas = index["metadatas"]
+        self._write_journal()
+        os.remove(self.legacy_index_file)
+
+    def _reload(self, truncate_torn=False):
+        """v1.3: Forgets the index and reads the whole journal again."""
+        self.dim = None
+        self.ids, self.metadatas, self._rows = [], [], {}
+        self._journal_lines = 0
+        self._journal_bytes = 0
+        self._journal_header = None
+        self._journal_stat = None
+        self._hnsw = None # Row numbers may have changed
+        if os.path.exists(self.index_file):
+            self._read_journal(truncate_torn)
+
+    def _read_journal(self, truncate_torn=False):
+        """
+        Applies the journal lines after the ones already read.
+        v1.3: A partial last line is left for the next read (another
+        process may still be writing it), or cut off if `truncate_torn`:
+        open() holds the file lock, so then it is left from a crash.
+        """
+        signature = self._journal_signature() # Taken first, so a later append always changes it
+        with open(self.index_file, 'rb') as f:
+            f.seek(self._journal_bytes)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if self._journal_bytes == 0:
+                    self._journal_header = line
+                self._journal_bytes += len(line)
+                if "dim" in entry:
+                    self.dim = entry["dim"]
+                    continue
+                self._journal_lines += 1
+                row = self._rows.get(entry["id"])
+                if row is None:
+                    self._rows[entry["id"]] = len(self.ids)
+                    self.ids.append(entry["id"])
+                    self.metadatas.append(entry["metadata"])
+                else:
+                    self.metadatas[row] = entry["metadata"]
+                    self._hnsw_stale = True # Its vector may have been overwritten in place
+        if truncate_torn and self._journal_bytes < os.path.getsize(self.index_file):
+            print(f"[Memory] Vector index had a partial last entry. Dropping it.")
+            with open(self.index_file, 'r+b') as f:
+                f.truncate(self._journal_bytes)
+            signature = self._journal_signature()
+        self._journal_stat = signature
+
+    def _journal_signature(self):
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _refresh(self, truncate_torn=False):
+        """
+        v1.3: Catches up with journal lines written by other processes
+        since the last read. Costs one stat() when nothing changed.
+        Writers pass `truncate_torn` (they hold the file lock, so a
+        partial last line is from a crashed writer and must go before
+        they append).
+        """
+        signature = self._journal_signature()
+        if signature == self._journal_stat and not truncate_torn:
+            return
+        if self._same_journal(signature):
+            self._read_journal(truncate_torn)
+        else:
+            self._reload(truncate_torn) # Compacted, rewritten or removed elsewhere
+        self._remap()
+
+    def _same_journal(self, signature):
+        """True if the journal on disk only grew since it was read."""
+        if signature is None or self._journal_header is None or signature[0] < self._journal_bytes:
+            return False
+        with open(self.index_file, 'rb') as f:
+            return f.readline() == self._journal_header
+
+    def _header_line(self):
+        # v1.3: The token makes every rewritten journal's header unique
+        return (json.dumps({"dim": self.dim, "journal": uuid.uuid4().hex}) + "\n").encode('utf-8')
+
+    def _truncate_vectors(self):
+        """Makes the vector file exactly len(ids) rows long."""
+        row_bytes = (self.dim or 0) * 4
+        expected = len(self.ids) * row_bytes
+        size = os.path.getsize(self.vector_file) if os.path.exists(self.vector_file) else 0
+        if size > expected:
+            # Rows written by an upsert that crashed before its journal lines
+            with open(self.vector_file, 'r+b') as f:
+                f.truncate(expected)
+        elif size < expected:
+            # The journal is ahead of the vectors (e.g. lost writes): keep the rows that exist
+            rows = size // row_bytes
+            print(f"[Memory] WARNING: Vector file holds {rows} of {len(self.ids)} indexed rows. "
+                  f"Dropping the missing ones.")
+            del self.ids[rows:], self.metadatas[rows:]
+            self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+            with open(self.vector_file, 'r+b' if size else 'wb') as f:
+                f.truncate(rows * row_bytes) # Also drops a partial last row
+            self._write_journal()
+
+    def _write_journal(self):
+        """Writes the current index as a fresh journal (one line per row)."""
+        tmp_file = self.index_file + ".tmp"
+        header = self._header_line()
+        with open(tmp_file, 'wb') as f:
+            f.write(header)
+            for vector_id, metadata in zip(self.ids, self.metadatas):
+                f.write((json.dumps({"id": vector_id, "metadata": metadata}) + "\n").encode('utf-8'))
+            journal_bytes = f.tell()
+        os.replace(tmp_file, self.index_file)
+        self._journal_lines = len(self.ids)
+        self._journal_bytes = journal_bytes
+        self._journal_header = header
+        self._journal_stat = self._journal_signature()
+
+    def _remap(self):
+        if self.dim and self.ids:
+            self._matrix = np.memmap(self.vector_file, dtype=np.float32, mode='r+',
+                                     shape=(len(self.ids), self.dim))
+        else:
+            self._matrix = None
+
+        partitions = {}
+        for row, metadata in enumerate(self.metadatas):
+            partitions.setdefault(metadata.get("app"), []).append(row)
+        self._partitions = {app: np.array(rows, dtype=np.int64) for app, rows in partitions.items()}
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, ids, embeddings, metadatas):
+        vectors = self._normalize(embeddings)
+        # v1.2: An id given twice in one call is stored once (the last one wins)
+        batch = {}
+        for vector_id, vector, metadata in zip(ids, vectors, metadatas):
+            batch[vector_id] = (vector, metadata)
+
+        with self._lock, self._file_lock:
+            self._refresh(truncate_torn=True) # v1.3: Rows other processes added since our last look
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dims, store has {self.dim}.")
+            new_journal = not os.path.exists(self.index_file)
+
+            new_ids, new_vectors, new_metadatas = [], [], []
+            try:
+                for vector_id, (vector, metadata) in batch.items():
+                    row = self._rows.get(vector_id)
+                    if row is not None:
+                        self._matrix[row] = vector
+                        self.metadatas[row] = metadata
+                        self._hnsw_stale = True
+                    else:
+                        new_ids.append(vector_id)
+                        new_vectors.append(vector)
+                        new_metadatas.append(metadata)
+
+                if self._matrix is not None:
+                    self._matrix.flush()
+                    self._matrix = None # Unmap before the file grows (Windows will not resize a mapped file)
+                if new_vectors:
+                    # Written at the offset the index expects, over any orphan rows
+                    with open(self.vector_file, 'r+b' if os.path.exists(self.vector_file) else 'wb') as f:
+                        f.seek(len(self.ids) * self.dim * 4)
+                        f.write(np.stack(new_vectors).astype(np.float32).tobytes())
+                        f.truncate()
+
+                # The journal goes last: a crash before this only leaves rows open() cuts off
+                with open(self.index_file, 'ab') as f:
+                    if new_journal:
+                        self._journal_header = self._header_line()
+                        f.write(self._journal_header)
+                    for vector_id, (vector, metadata) in batch.items():
+                        f.write((json.dumps({"id": vector_id, "metadata": metadata}) + "\n").encode('utf-8'))
+                    self._journal_bytes = f.tell()
+                self._journal_stat = self._journal_signature()
+                self._journal_lines += len(batch)
+
+                for vector_id, metadata in zip(new_ids, new_metadatas):
+                    self._rows[vector_id] = len(self.ids)
+                    self.ids.append(vector_id)
+                    self.metadatas.append(metadata)
+
+                if self._journal_lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self.ids)):
+                    self._write_journal()
+            except BaseException:
+                self._reload() # What is on disk is the truth; the in-memory index may be half updated
+                raise
+            finally:
+                self._remap()
+
+    def _hnsw_index(self):
+        """
+        An hnswlib index over the matrix, or None if not worth it / not installed.
+        v1.3: Rows appended since it was built are added to it; it is only
+        rebuilt from scratch after existing rows were overwritten.
+        """
+        if len(self.ids) < self.hnsw_threshold:
+            return None
+        if self._hnsw is not None and not self._hnsw_stale:
+            if self._hnsw_rows < len(self.ids):
+                capacity = self._hnsw.get_max_elements()
+                if capacity < len(self.ids):
+                    self._hnsw.resize_index(max(len(self.ids), 2 * capacity))
+                self._hnsw.add_items(np.asarray(self._matrix[self._hnsw_rows:]),
+                                     np.arange(self._hnsw_rows, len(self.ids)))
+                self._hnsw_rows = len(self.ids)
+            return self._hnsw
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+        index = hnswlib.Index(space='cosine', dim=self.dim)
+        index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+        index.add_items(np.asarray(self._matrix), np.arange(len(self.ids)))
+        index.set_ef(64)
+        self._hnsw = index
+        self._hnsw_rows = len(self.ids)
+        self._hnsw_stale = False
+        return self._hnsw
+
+    def query(self, query_embeddings, n_results=1, app=None):
+        queries = self._normalize(query_embeddings)
+        result = {"ids": [], "distances": [], "metadatas": []}
+        with self._lock:
+            self._refresh() # v1.3: See what other processes stored
+            rows = None
+            if app is not None:
+                rows = self._partitions.get(app)
+            if self._matrix is None or (app is not None and rows is None):
+                for _ in queries:
+                    result["ids"].append([])
+                    result["distances"].append([])
+                    result["metadatas"].append([])
+                return result
+
+            # Scoped queries are brute force over the app's rows only;
+            # HNSW is for searching everything at once.
+            hnsw = self._hnsw_index() if rows is None else None
+            if hnsw is not None:
+                k = min(n_results, len(self.ids))
+                labels, distances = hnsw.knn_query(queries, k=k)
+            else:
+                matrix = np.asarray(self._matrix) if rows is None else self._matrix[rows]
+                k = min(n_results, len(matrix))
+                similarity = queries @ matrix.T # (queries, rows)
+                labels = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+                top = np.take_along_axis(similarity, labels, axis=1)
+                order = np.argsort(-top, axis=1)
+                labels = np.take_along_axis(labels, order, axis=1)
+                distances = 1.0 - np.take_along_axis(top, order, axis=1)
+                if rows is not None:
+                    labels = rows[labels] # Partition positions -> global rows
+
+            for row_labels, row_distances in zip(labels, distances):
+                result["ids"].append([self.ids[i] for i in row_labels])
+                result["distances"].append([float(d) for d in row_distances])
+                result["metadatas"].append([self.metadatas[i] for i in row_labels])
+        return result
+
+    def export(self):
+        with self._lock:
+            self._refresh()
+            embeddings = [] if self._matrix is None else np.asarray(self._matrix).tolist()
+            return list(self.ids), embeddings, list(self.metadatas)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self.ids)
+
+
+BACKENDS = {
+    NumpyBackend.name: NumpyBackend,
+    ChromaBackend.name: ChromaBackend,
+}
+
+def create_backend(name, db_path):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name](db_path)
+
+def copy_vectors(source, target):
+    """Copies every vector from one opened backend into another. Returns the count."""
+    ids, embeddings, metadatas = source.export()
+    if ids:
+        target.upsert(ids, embeddings, metadatas)
+    return len(ids)
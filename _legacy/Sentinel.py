@@ -8,6 +8,13 @@ import ast
 import io
 import json
 import uuid
+import sqlite3
+import hashlib
+import threading
+import concurrent.futures
+import queue
+import zipfile
+import xml.etree.ElementTree as ET
 
 # --- Try to import GUI libraries (for 'register' command) ---
 try:
@@ -36,48 +43,149 @@ try:
     GOOGLE_API_INSTALLED = True
 except ImportError:
     GOOGLE_API_INSTALLED = False
-
-# --- Try to import DOCX library ---
-try:
-    import docx
-    DOCX_INSTALLED = True
-except ImportError:
-    DOCX_INSTALLED = False
+    class HttpError(Exception): # v2.7: Lets the watcher loop run against fake_drive.py
+        def __init__(self, resp, content=b"", uri=None): # Same shape as googleapiclient's
+            super().__init__(f"HTTP {resp.status}")
+            self.resp = resp
+            self.content = content
+            self.uri = uri
 
 # --- Configuration (v2.6) ---
 SENTINEL_HOME_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SENTINEL_HOME_DIR, "sentinel_config.json")
-PROCESSED_FILES_DB = os.path.join(SENTINEL_HOME_DIR, "sentinel_processed.json") # v2.5+ Persistent DB
+PROCESSED_FILES_DB = os.path.join(SENTINEL_HOME_DIR, "sentinel_processed.json") # v2.5+ Persistent DB (v2.7: migrated into the ledger)
+PROCESSED_LEDGER_DB = os.path.join(SENTINEL_HOME_DIR, "sentinel_processed.db") # v2.7 Processed-file ledger
 TEMP_SCRIPT_NAME = "_current_patch.ps1" 
-POLL_INTERVAL_SECONDS = 30 
-TEMP_DOCX_DOWNLOAD = os.path.join(SENTINEL_HOME_DIR, "_temp_patch.docx") # For Drive watcher
+POLL_INTERVAL_SECONDS = 30 # v2.7: Longest wait between Drive polls (when idle)
+DEBOUNCE_SECONDS = 0.3 # v2.7: Quiet time after a local file's last event before checking it
+STABLE_CHECK_SECONDS = 0.3 # v2.7: ...then its size and mtime must hold for this long
+POLL_MIN_SECONDS = 5 # v2.7: Wait after a Drive poll that found new patches
+CHANGES_PAGE_SIZE = 100 # v2.7: Changes / files per Drive API page when syncing
+DOWNLOAD_WORKERS = 4 # v2.7: Drive patches downloaded + parsed at once (in memory, no temp file)
 
 # Google Drive:
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 CREDENTIALS_FILE = os.path.join(SENTINEL_HOME_DIR, "credentials.json")
 TOKEN_FILE = os.path.join(SENTINEL_HOME_DIR, "token.json")
 DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DRIVE_QUERY = f"mimeType='{DOCX_MIME_TYPE}' and name starts with 'SentScript-'"
+DRIVE_TOKEN_STATE = "drive_start_page_token" # v2.7: Ledger state key for the Changes API
+DRIVE_RETRY_STATE = "drive_retry_files" # v2.7: ...and for files to retry, saved with the token
 # ---------------------
 
-# --- DB Helper Functions ---
-def load_processed_files():
-    """Loads the set of processed file IDs/paths from the JSON DB."""
-    if not os.path.exists(PROCESSED_FILES_DB):
-        return set()
-    try:
-        with open(PROCESSED_FILES_DB, 'r', encoding='utf-8') as f:
-            return set(json.load(f)) # Load list and convert to set
-    except Exception:
-        print(f"Warning: Could not read {PROCESSED_FILES_DB}. Starting with empty set.", file=sys.stderr)
-        return set()
-
-def save_processed_files(processed_set):
-    """Saves the set of processed file IDs/paths to the JSON DB."""
-    try:
-        with open(PROCESSED_FILES_DB, 'w', encoding='utf-8') as f:
-            json.dump(list(processed_set), f, indent=4) # Convert set to list for saving
-    except Exception as e:
-        print(f"[Watcher] Error: Could not save processed files list: {e}", file=sys.stderr)
+# --- DB Helper Functions (v2.7: SQLite ledger) ---
+# One row per processed file ID (Drive) or path (local). Each patch is a
+# single-row insert and each "seen before?" check a primary-key lookup,
+# instead of rewriting / re-parsing the whole JSON list every time.
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    key          TEXT PRIMARY KEY, -- Drive file ID or normalized local path
+    source       TEXT NOT NULL,    -- 'drive', 'local' or 'json' (migrated)
+    name         TEXT,
+    project      TEXT,
+    content_hash TEXT,             -- sha256 of the script text, if it was read
+    outcome      TEXT NOT NULL,    -- see OUTCOMES
+    first_seen   REAL NOT NULL,
+    processed_at REAL NOT NULL
+)
+"""
+LEDGER_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watcher_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+)
+"""
+OUTCOMES = ("applied", "failed", "not_sentscript", "invalid_name", "unknown_project", "migrated")
+
+def content_hash(text):
+    """sha256 hex digest of a script's text, for the ledger."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ProcessedLedger:
+    """
+    The processed-file ledger (sentinel_processed.db). `key in ledger` is
+    a primary-key lookup; record() is one INSERT. Safe to share between
+    the watcher threads.
+    """
+    def __init__(self, db_file=PROCESSED_LEDGER_DB, legacy_json=PROCESSED_FILES_DB):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=wal")
+        self.conn.execute("PRAGMA synchronous=1")
+        self.conn.execute(LEDGER_SCHEMA)
+        self.conn.execute(LEDGER_STATE_SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            self._import_json(legacy_json)
+
+    def _import_json(self, legacy_json):
+        """One-time import of the v2.5 sentinel_processed.json list. The JSON file is left as-is."""
+        keys = []
+        if os.path.exists(legacy_json):
+            try:
+                with open(legacy_json, 'r', encoding='utf-8') as f:
+                    keys = json.load(f)
+            except Exception:
+                print(f"Warning: Could not read {legacy_json}. Nothing migrated.", file=sys.stderr)
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed (key, source, name, outcome, first_seen, processed_at) "
+                "VALUES (?, 'json', ?, 'migrated', ?, ?)",
+                [(key, os.path.basename(key), now, now) for key in keys])
+            self.conn.execute("PRAGMA user_version = 1")
+            self.conn.execute("COMMIT")
+        if keys:
+            print(f"[Ledger] Migrated {len(keys)} entries from {os.path.basename(legacy_json)}.")
+
+    def __contains__(self, key):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM processed WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def record(self, key, source, outcome, name=None, project=None, script_content=None):
+        """Marks `key` as processed. Re-recording a key keeps its first_seen."""
+        now = time.time()
+        digest = content_hash(script_content) if script_content is not None else None
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO processed (key, source, name, project, content_hash, outcome, first_seen, processed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET source = excluded.source, name = excluded.name, "
+                    "project = excluded.project, content_hash = excluded.content_hash, "
+                    "outcome = excluded.outcome, processed_at = excluded.processed_at",
+                    (key, source, name, project, digest, outcome, now, now))
+        except sqlite3.Error as e:
+            print(f"[Watcher] Error: Could not record processed file {name or key}: {e}", file=sys.stderr)
+
+    def get_state(self, key, default=None):
+        """Watcher state kept alongside the ledger (e.g. the Drive page token)."""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM watcher_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        self.set_states({key: value})
+
+    def set_states(self, values):
+        """Saves several state keys in one transaction (all or none)."""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO watcher_state (key, value) VALUES (?, ?)",
+                                      list(values.items()))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
 # --- End DB ---
 
 def load_config():
@@ -101,18 +209,67 @@ def save_config(config_data):
         print(f"Error saving config file: {e}", file=sys.stderr)
         return False
 
-def read_docx_text(filepath):
-    """Uses python-docx to read the text from a .docx file."""
-    if not DOCX_INSTALLED:
-        print("Error: 'python-docx' is required to read .docx files.", file=sys.stderr)
-        print("Please run: pip install python-docx", file=sys.stderr)
-        return None
+# --- v2.7: .docx reader (stdlib only, python-docx no longer needed) ---
+# A .docx is a zip; the text is in word/document.xml. That part is
+# streamed through an incremental parser and each body paragraph is
+# dropped once its text has been taken, so memory stays flat however
+# large the patch document is. See bench_docx.py.
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = WORD_NS + "body"
+W_P = WORD_NS + "p"
+W_R = WORD_NS + "r"
+W_HYPERLINK = WORD_NS + "hyperlink"
+W_T = WORD_NS + "t"
+W_BR = WORD_NS + "br"
+RUN_CHARS = { # Run content that stands for a character (as python-docx reads it)
+    WORD_NS + "tab": "\t",
+    WORD_NS + "ptab": "\t",
+    WORD_NS + "cr": "\n",
+    WORD_NS + "noBreakHyphen": "-",
+}
+
+def iter_docx_paragraphs(source):
+    """
+    Yields the text of each top-level paragraph of a .docx path, bytes
+    or file-like object, in order, matching python-docx's
+    `[p.text for p in document.paragraphs]`.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as package, package.open("word/document.xml") as stream:
+        path = []    # Tags from the root down to the current element
+        body = None
+        body_depth = None
+        parts = None # Text of the paragraph being read
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                path.append(elem.tag)
+                if elem.tag == W_BODY and body is None:
+                    body, body_depth = elem, len(path)
+                elif body is not None and elem.tag == W_P and len(path) == body_depth + 1:
+                    parts = []
+                continue
+
+            path.pop()
+            if parts is not None:
+                if elem.tag == W_P and len(path) == body_depth:
+                    yield "".join(parts)
+                    parts = None
+                elif path[body_depth:] in ([W_P, W_R], [W_P, W_HYPERLINK, W_R]):
+                    if elem.tag == W_T:
+                        parts.append(elem.text or "")
+                    elif elem.tag == W_BR:
+                        if elem.get(WORD_NS + "type", "textWrapping") == "textWrapping":
+                            parts.append("\n")
+                    elif elem.tag in RUN_CHARS:
+                        parts.append(RUN_CHARS[elem.tag])
+            if body is not None and len(path) == body_depth:
+                body.clear() # Done with this paragraph / table: free it
+
+def read_docx_text(source):
+    """Reads the text from a .docx path, bytes or file-like object (v2.7: e.g. BytesIO)."""
     try:
-        document = docx.Document(filepath)
-        full_text = []
-        for para in document.paragraphs:
-            full_text.append(para.text)
-        return "\n".join(full_text)
+        return "\n".join(iter_docx_paragraphs(source))
     except Exception as e:
         print(f"[Watcher] Error: Failed to read .docx file: {e}", file=sys.stderr)
         return None
@@ -121,98 +278,188 @@ def read_docx_text(filepath):
 # --- "LOCAL WATCHER" (SERVICE) LOGIC (v2.6 - UPGRADED) ---
 # ==============================================================================
 
+# --- v2.7: Local watcher events ---
+class FileEventCoalescer:
+    """
+    Turns each burst of file events (an editor or sync client saving,
+    renaming, re-saving...) into one dispatch(path) call, once the path
+    has had no events for DEBOUNCE_SECONDS and its size and mtime then
+    hold still for STABLE_CHECK_SECONDS. touch() never blocks, so it can
+    be called from the watchdog observer thread.
+    """
+    def __init__(self, dispatch, debounce=DEBOUNCE_SECONDS, stable_check=STABLE_CHECK_SECONDS):
+        self._dispatch = dispatch
+        self.debounce = debounce
+        self.stable_check = stable_check
+        self._pending = {} # path -> [due (monotonic), last (size, mtime) or None]
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="sentinel-debounce", daemon=True)
+        self._thread.start()
+
+    def touch(self, path):
+        """An event for `path`: (re)start its quiet period."""
+        with self._cond:
+            self._pending[path] = [time.monotonic() + self.debounce, None]
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.monotonic()
+                    due = [(path, entry) for path, entry in self._pending.items() if entry[0] <= now]
+                    if due:
+                        break
+                    next_due = min((entry[0] for entry in self._pending.values()), default=None)
+                    self._cond.wait(None if next_due is None else next_due - now)
+
+            # stat() outside the lock, so touch() stays instant
+            stats = []
+            for path, entry in due:
+                try:
+                    st = os.stat(path)
+                    stats.append((path, entry, (st.st_size, st.st_mtime_ns)))
+                except OSError:
+                    stats.append((path, entry, None))
+
+            ready = []
+            with self._cond:
+                now = time.monotonic()
+                for path, entry, stat in stats:
+                    if self._pending.get(path) is not entry:
+                        continue # New event meanwhile: its quiet period starts over
+                    if stat is None:
+                        del self._pending[path]
+                        print(f"[Watcher Log] File disappeared (likely temp file). Ignoring: {os.path.basename(path)}", flush=True)
+                    elif stat == entry[1] and stat[0] > 0:
+                        del self._pending[path]
+                        ready.append(path)
+                    elif stat == entry[1]:
+                        del self._pending[path] # Still empty: the write that fills it will touch() again
+                    else:
+                        entry[0], entry[1] = now + self.stable_check, stat
+            for path in ready:
+                self._dispatch(path)
+
+def process_local_patch(filepath, config, ledger):
+    """Verifies and runs one settled SentScript .docx from a watched project folder."""
+    filename = os.path.basename(filepath)
+    print(f"\n[Watcher Log] File event detected: {filename}", flush=True)
+
+    if filepath in ledger:
+        print(f"[Watcher Log] Ignoring already processed file: {filename}", flush=True)
+        return
+
+    print(f"[Watcher Log] File is a new .docx patch. Processing...", flush=True)
+    try:
+        # --- FIXED v2.6 PARSER LOGIC ---
+        clean_name = os.path.splitext(filename)[0] # Remove .docx
+        parts = clean_name.split('-')
+        if len(parts) < 4: 
+            print(f"[Watcher] ERROR: Invalid filename format (not enough parts): {filename}. Ignoring.", flush=True)
+            return
+        project_id = f"{parts[1]}-{parts[2]}" # Re-combine 'proj' and 'b6cc'
+        print(f"[Watcher Log] Parsed Project ID: {project_id}", flush=True)
+        # --- END FIXED LOGIC ---
+        
+        if project_id not in config:
+            print(f"[Watcher] ERROR: Detected file for unknown project ID: {project_id}. Ignoring.", flush=True)
+            return
+            
+        target_project_path = config[project_id]
+        print(f"\n\n--- [Local Watcher] New Patch File Detected: {filename} ---")
+        print(f"--- Target Project: {project_id} ({target_project_path}) ---")
+
+        # --- v2.6: Read .docx file ---
+        script_content = read_docx_text(filepath)
+        if script_content is None:
+            raise Exception(f"Failed to read text from .docx file: {filepath}")
+        
+        if not script_content.lstrip().startswith("<#"):
+            print(f"[Watcher] ERROR: File {filename} is not a SentScript (missing '<#'). Ignoring.", flush=True)
+            ledger.record(filepath, "local", "not_sentscript", name=filename, # Add to DB so we don't re-check
+                          project=project_id, script_content=script_content)
+            return
+        
+        # Run the patch
+        if verify_and_run_patch(script_content, filename, target_project_path):
+            print(f"[Watcher] Patch successful for {filename}.", flush=True)
+            outcome = "applied"
+        else:
+            print(f"[Watcher] Patch failed or aborted for {filename}.", flush=True)
+            outcome = "failed"
+        
+        ledger.record(filepath, "local", outcome, name=filename,
+                      project=project_id, script_content=script_content)
+
+    except Exception as e:
+        print(f"[Watcher] CRITICAL ERROR processing file: {e}. Ignoring.", flush=True)
+
 def start_local_watcher():
     if not WATCHDOG_INSTALLED:
         print("Error: 'watchdog' is required. Please run: pip install watchdog", file=sys.stderr)
         sys.exit(1)
         
-    # v2.6: Check for .docx reader
-    if not DOCX_INSTALLED:
-        print("Error: 'python-docx' is required for 'watch local' to read .docx files.", file=sys.stderr)
-        print("Please run: pip install python-docx", file=sys.stderr)
-        sys.exit(1)
-        
+    # v2.7: Loaded once. Only the folders registered now are watched anyway.
     config = load_config()
     if not config:
         print("Error: No projects registered. Run 'python Sentinel.py register' first.", file=sys.stderr)
         sys.exit(1)
         
-    processed_file_paths = load_processed_files() # Using path for local
+    ledger = ProcessedLedger() # v2.7: Keyed by path for local
 
     print("--- [Watcher Boot] Local Watcher scanning for registered projects: ---")
     for proj_id, path in config.items():
         print(f"  - Watching {proj_id}: {path}")
 
-    class LocalPatchHandler(FileSystemEventHandler):
-        def on_created(self, event):
-            if event.is_directory: 
-                print(f"[Watcher Log] Ignoring directory event: {event.src_path}", flush=True)
-                return
-                
-            filepath = os.path.normpath(event.src_path)
-            filename = os.path.basename(filepath)
-            
-            print(f"\n[Watcher Log] File event detected: {filename}", flush=True)
+    # v2.7: One worker runs patches in order (approval reads stdin). A path
+    # is never queued twice while it waits or runs.
+    work = queue.Queue()
+    in_flight = set() # Added only by the coalescer thread, removed by the worker
 
-            # v2.6: Fix for race condition
-            print(f"[Watcher Log] Waiting 1 second for file to save...", flush=True)
-            time.sleep(1)
+    def dispatch(filepath):
+        if filepath not in in_flight:
+            in_flight.add(filepath)
+            work.put(filepath)
 
-            if not os.path.exists(filepath):
-                print(f"[Watcher Log] File disappeared (likely temp file). Ignoring.", flush=True)
-                return
+    def worker():
+        while True:
+            filepath = work.get()
+            try:
+                process_local_patch(filepath, config, ledger)
+            finally:
+                in_flight.discard(filepath)
+
+    coalescer = FileEventCoalescer(dispatch)
+    threading.Thread(target=worker, name="sentinel-patch-worker", daemon=True).start()
 
-            if filepath in processed_file_paths:
-                print(f"[Watcher Log] Ignoring already processed file: {filename}", flush=True)
-                return 
+    class LocalPatchHandler(FileSystemEventHandler):
+        # v2.7: Runs on the observer thread, so it only notes the event
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            if event.event_type in ("created", "modified", "closed"):
+                path = event.src_path
+            elif event.event_type == "moved": # Editors and sync clients save via a rename
+                path = event.dest_path
+            else:
+                return
 
+            filepath = os.path.normpath(path)
+            filename = os.path.basename(filepath)
             # --- v2.6: UPGRADED TO WATCH FOR .docx FILES ---
             if filename.endswith(".docx") and filename.startswith("SentScript-"):
-                print(f"[Watcher Log] File is a new .docx patch. Processing...", flush=True)
-                try:
-                    # --- FIXED v2.6 PARSER LOGIC ---
-                    clean_name = os.path.splitext(filename)[0] # Remove .docx
-                    parts = clean_name.split('-')
-                    if len(parts) < 4: 
-                        print(f"[Watcher] ERROR: Invalid filename format (not enough parts): {filename}. Ignoring.", flush=True)
-                        return
-                    project_id = f"{parts[1]}-{parts[2]}" # Re-combine 'proj' and 'b6cc'
-                    print(f"[Watcher Log] Parsed Project ID: {project_id}", flush=True)
-                    # --- END FIXED LOGIC ---
-                    
-                    config = load_config()
-                    
-                    if project_id not in config:
-                        print(f"[Watcher] ERROR: Detected file for unknown project ID: {project_id}. Ignoring.", flush=True)
-                        return
-                        
-                    target_project_path = config[project_id]
-                    print(f"\n\n--- [Local Watcher] New Patch File Detected: {filename} ---")
-                    print(f"--- Target Project: {project_id} ({target_project_path}) ---")
-
-                    # --- v2.6: Read .docx file ---
-                    script_content = read_docx_text(filepath)
-                    if script_content is None:
-                        raise Exception(f"Failed to read text from .docx file: {filepath}")
-                    
-                    if not script_content.lstrip().startswith("<#"):
-                        print(f"[Watcher] ERROR: File {filename} is not a SentScript (missing '<#'). Ignoring.", flush=True)
-                        processed_file_paths.add(filepath) # Add to DB so we don't re-check
-                        save_processed_files(processed_file_paths)
-                        return
-                    
-                    # Run the patch
-                    if verify_and_run_patch(script_content, filename, target_project_path):
-                        print(f"[Watcher] Patch successful for {filename}.", flush=True)
-                    else:
-                        print(f"[Watcher] Patch failed or aborted for {filename}.", flush=True)
-                    
-                    processed_file_paths.add(filepath)
-                    save_processed_files(processed_file_paths)
-
-                except Exception as e:
-                    print(f"[Watcher] CRITICAL ERROR processing file: {e}. Ignoring.", flush=True)
-            else:
+                coalescer.touch(filepath)
+            elif event.event_type == "created":
                 print(f"[Watcher Log] Ignoring file (not a SentScript .docx): {filename}", flush=True)
 
     observer = Observer()
@@ -223,8 +470,8 @@ def start_local_watcher():
             print(f"[Watcher] Warning: Path not found for project. Not watching: {path}", file=sys.stderr)
 
     print("==================================================")
-    print("✅ Sentinel 'Local Watcher' Service Started (v2.6)")
-    print(f"Loaded {len(processed_file_paths)} already-processed file paths.")
+    print("✅ Sentinel 'Local Watcher' Service Started (v2.7)")
+    print(f"Loaded {len(ledger)} already-processed files from the ledger.")
     print(f"Watching for new 'SentScript-ID-*.docx' files in all registered project folders.")
     print("Press CTRL+C to stop the watcher.")
     print("==================================================")
@@ -237,11 +484,17 @@ def start_local_watcher():
         observer.stop()
         print("\n[Local Watcher] Service stopped by user.")
     observer.join()
+    coalescer.stop()
+    ledger.close()
 
 # ==============================================================================
 # --- "GOOGLE DRIVE WATCHER" (SERVICE) LOGIC (v2.6 - All Fixes) ---
 # ==============================================================================
-def get_drive_service():
+def get_drive_credentials():
+    """
+    v2.7: Loads (refreshing or re-authorizing if needed) the Drive
+    credentials and saves them to TOKEN_FILE. Call from one thread only.
+    """
     creds = None
     if os.path.exists(TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
@@ -256,54 +509,214 @@ def get_drive_service():
             creds = flow.run_local_server(port=0)
         with open(TOKEN_FILE, 'w') as token:
             token.write(creds.to_json())
-    return build('drive', 'v3', credentials=creds)
+    return creds
+
+def get_drive_service(creds=None):
+    """A Drive v3 client. v2.7: Pass `creds` to reuse already loaded credentials."""
+    return build('drive', 'v3', credentials=creds or get_drive_credentials())
+
+# --- v2.7: Drive sync ---
+# "list" is the v2.6 poll: the 20 newest matching files, every time.
+# "changes" follows the Drive Changes API from a start page token kept in
+# the ledger, so a poll only fetches what changed since the last one and
+# pages through all of it. See fake_drive.py to measure both offline.
+CHANGES_FIELDS = "nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, createdTime, trashed))"
+
+def is_patch_file(item):
+    """True for Drive metadata of a live 'SentScript-*' .docx."""
+    return (item.get('mimeType') == DOCX_MIME_TYPE
+            and item.get('name', '').startswith('SentScript-')
+            and not item.get('trashed', False))
+
+def list_drive_files(service, page_size=20, all_pages=False):
+    """The v2.6 query: newest 'SentScript-*' .docx files, returned oldest first."""
+    items = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=DRIVE_QUERY,
+            pageSize=page_size,
+            orderBy="createdTime desc",
+            fields="nextPageToken, files(id, name, createdTime)",
+            pageToken=page_token
+        ).execute()
+        items.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not all_pages or not page_token:
+            break
+    return list(reversed(items))
+
+def next_poll_interval(current, new_files_found):
+    """Poll again soon while patches are arriving, back off towards POLL_INTERVAL_SECONDS when idle."""
+    if new_files_found:
+        return POLL_MIN_SECONDS
+    return min(current * 2, POLL_INTERVAL_SECONDS)
+
+class DriveChangeFeed:
+    """
+    Incremental Drive sync. poll() returns the patch files that changed
+    since the last commit() and are not in the ledger yet; commit() then
+    saves the new start page token with the watcher state. Files that
+    fail to process are handed back with retry(); commit() saves them in
+    the same transaction as the token, and poll() returns them again
+    (also after a restart) until they make it into the ledger.
+    """
+    def __init__(self, service, ledger, page_size=CHANGES_PAGE_SIZE):
+        self.service = service
+        self.ledger = ledger
+        self.page_size = page_size
+        self.token = ledger.get_state(DRIVE_TOKEN_STATE)
+        self._pending_token = None
+        self._retry = {item['id']: item for item in json.loads(ledger.get_state(DRIVE_RETRY_STATE, "[]"))}
+
+    def poll(self):
+        found = dict(self._retry) # Kept in _retry until the pages are read, in case a request fails
+        if self.token is None:
+            # First run: note "now" first, then catch up on everything already there
+            self._pending_token = self.service.changes().getStartPageToken().execute()['startPageToken']
+            for item in list_drive_files(self.service, page_size=self.page_size, all_pages=True):
+                found[item['id']] = item
+        else:
+            page_token = self.token
+            while page_token is not None:
+                try:
+                    response = self.service.changes().list(
+                        pageToken=page_token,
+                        pageSize=self.page_size,
+                        spaces='drive',
+                        fields=CHANGES_FIELDS
+                    ).execute()
+                except HttpError as e:
+                    if e.resp.status in (404, 410): # Token expired / invalid: start over
+                        print(f"\n[Drive Watcher] Page token rejected ({e.resp.status}). Re-syncing...", flush=True)
+                        self.token = None
+                        return self.poll()
+                    raise
+                for change in response.get('changes', []):
+                    item = change.get('file')
+                    if change.get('removed') or not item or not is_patch_file(item):
+                        found.pop(change.get('fileId'), None)
+                        continue
+                    found[item['id']] = item
+                if 'newStartPageToken' in response:
+                    self._pending_token = response['newStartPageToken']
+                page_token = response.get('nextPageToken')
+
+        self._retry = {} # Now in `found`; retry() puts back the ones that fail again
+        items = [item for item in found.values() if item['id'] not in self.ledger]
+        return sorted(items, key=lambda item: item.get('createdTime', ''))
 
-def start_drive_watcher():
-    if not GOOGLE_API_INSTALLED or not DOCX_INSTALLED:
+    def retry(self, item):
+        self._retry[item['id']] = item
+
+    def commit(self):
+        """
+        Persists the token the last poll() reached, together with the
+        files retry() was called for. Call once its files are handled.
+        """
+        token = self._pending_token if self._pending_token is not None else self.token
+        state = {DRIVE_RETRY_STATE: json.dumps(list(self._retry.values()))}
+        if token is not None:
+            state[DRIVE_TOKEN_STATE] = token
+        self.ledger.set_states(state)
+        self.token = token
+        self._pending_token = None
+
+# --- v2.7: Drive downloads ---
+def download_drive_file(service, file_id):
+    """Downloads a Drive file into memory. Returns a BytesIO positioned at the start."""
+    buffer = io.BytesIO()
+    request = service.files().get_media(fileId=file_id)
+    downloader = MediaIoBaseDownload(buffer, request)
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
+    buffer.seek(0)
+    return buffer
+
+class DrivePrefetcher:
+    """
+    Downloads and parses Drive patches on a thread pool while earlier
+    ones wait for approval. submit() returns a Future of the script text
+    (None if the .docx could not be read). Each worker builds its own
+    service from `service_factory`, since a Drive client (httplib2) must
+    not be shared between threads. The factory must not touch
+    TOKEN_FILE: build clients from credentials loaded once up front.
+    """
+    def __init__(self, service_factory, workers=DOWNLOAD_WORKERS, download=download_drive_file):
+        self._service_factory = service_factory
+        self._download = download
+        self._local = threading.local()
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="sentinel-drive")
+
+    def _fetch(self, file_id):
+        if not hasattr(self._local, 'service'):
+            self._local.service = self._service_factory()
+        return read_docx_text(self._download(self._local.service, file_id))
+
+    def submit(self, file_id):
+        return self._pool.submit(self._fetch, file_id)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+def start_drive_watcher(sync="changes"):
+    if not GOOGLE_API_INSTALLED:
         print("Error: Missing required libraries for Drive Watcher.", file=sys.stderr)
-        if not GOOGLE_API_INSTALLED:
-            print("Please run: pip install google-api-python-client google-auth-httplib2 google-auth-oauthlib", file=sys.stderr)
-        if not DOCX_INSTALLED:
-            print("Please run: pip install python-docx", file=sys.stderr)
+        print("Please run: pip install google-api-python-client google-auth-httplib2 google-auth-oauthlib", file=sys.stderr)
         sys.exit(1)
 
     print("Authenticating with Google Drive...")
     try:
-        service = get_drive_service()
+        # v2.7: Loaded once here; the download workers only build clients from them
+        creds = get_drive_credentials()
+        service = get_drive_service(creds)
         print("Authentication successful.")
     except Exception as e:
         print(f"Failed to authenticate with Google Drive: {e}", file=sys.stderr)
         sys.exit(1)
 
-    processed_file_ids = load_processed_files() # Using file ID for drive
+    ledger = ProcessedLedger() # v2.7: Keyed by file ID for drive
 
     print("==================================================")
-    print("✅ Sentinel 'Google Drive Watcher' Service Started (v2.6)")
-    print(f"Loaded {len(processed_file_ids)} already-processed file IDs.")
-    print(f"Polling for new 'SentScript-ID-*.docx' files every {POLL_INTERVAL_SECONDS} seconds.")
+    print("✅ Sentinel 'Google Drive Watcher' Service Started (v2.7)")
+    print(f"Loaded {len(ledger)} already-processed files from the ledger.")
+    print(f"Polling for new 'SentScript-ID-*.docx' files ({sync} sync) every {POLL_MIN_SECONDS}-{POLL_INTERVAL_SECONDS} seconds.")
     print("Press CTRL+C to stop the watcher.")
     print("==================================================")
-    
+
+    try:
+        run_drive_watcher(service, ledger, sync, DrivePrefetcher(lambda: get_drive_service(creds)))
+    except KeyboardInterrupt:
+        print("\n[Drive Watcher] Service stopped by user.")
+    finally:
+        ledger.close()
+
+def run_drive_watcher(service, ledger, sync, prefetcher, sleep=time.sleep, run_patch=None, get_config=None):
+    """
+    v2.7: The Drive watcher's poll loop. Runs until `sleep` raises (CTRL+C).
+    Everything it touches is passed in, so fake_drive.py can run this
+    exact loop offline against a FakeDriveService. `run_patch` and
+    `get_config` default to verify_and_run_patch and load_config.
+    """
+    run_patch = run_patch or verify_and_run_patch
+    get_config = get_config or load_config
+    feed = DriveChangeFeed(service, ledger) if sync == "changes" else None
+    poll_interval = POLL_MIN_SECONDS
     try:
         while True:
+            new_files_found = 0
             try:
-                results = service.files().list(
-                    q=f"mimeType='{DOCX_MIME_TYPE}' and name starts with 'SentScript-'",
-                    pageSize=20,
-                    orderBy="createdTime desc",
-                    fields="files(id, name, createdTime)"
-                ).execute()
-                
-                items = results.get('files', [])
-                new_files_found = 0
+                items = feed.poll() if feed else list_drive_files(service)
 
                 if items:
-                    config = load_config()
-                    for item in reversed(items):
+                    config = get_config()
+                    pending = [] # v2.7: (item, project_id, target_project_path, future), in Drive order
+                    for item in items:
                         file_id = item['id']
                         filename = item['name']
                         
-                        if file_id in processed_file_ids:
+                        if file_id in ledger:
                             continue
 
                         new_files_found += 1
@@ -315,63 +728,66 @@ def start_drive_watcher():
                             parts = clean_name.split('-')
                             if len(parts) < 4: 
                                 print(f"[Drive Watcher] ERROR: Invalid filename format (not enough parts): {filename}. Ignoring.", flush=True)
-                                processed_file_ids.add(file_id) 
-                                save_processed_files(processed_file_ids)
+                                ledger.record(file_id, "drive", "invalid_name", name=filename)
                                 continue
                             project_id = f"{parts[1]}-{parts[2]}" # Re-combine 'proj' and 'b6cc'
                             print(f"[Watcher Log] Parsed Project ID: {project_id}", flush=True)
                             # --- END FIXED LOGIC ---
                         except IndexError:
                             print(f"[Drive Watcher] ERROR: Invalid filename format (no ID): {filename}. Ignoring.", flush=True)
-                            processed_file_ids.add(file_id)
+                            ledger.record(file_id, "drive", "invalid_name", name=filename)
                             continue
                         
                         if project_id not in config:
                             print(f"[Drive Watcher] ERROR: Detected file for unknown project ID: {project_id}. Ignoring.", flush=True)
-                            processed_file_ids.add(file_id)
-                            save_processed_files(processed_file_ids)
+                            ledger.record(file_id, "drive", "unknown_project", name=filename, project=project_id)
                             continue
                         
-                        target_project_path = config[project_id]
+                        # v2.7: Start the download now; approval below takes them in order
+                        pending.append((item, project_id, config[project_id], prefetcher.submit(file_id)))
+
+                    if pending:
+                        print(f"[Watcher Log] Downloading {len(pending)} patch file(s)...", flush=True)
+
+                    for item, project_id, target_project_path, future in pending:
+                        file_id = item['id']
+                        filename = item['name']
                         print(f"\n--- [Drive Watcher] New Patch File Detected: {filename} (ID: {file_id}) ---")
                         print(f"--- Target Project: {project_id} ({target_project_path}) ---")
                         
                         try:
-                            request = service.files().get_media(fileId=file_id)
-                            fh = io.FileIO(TEMP_DOCX_DOWNLOAD, 'wb')
-                            downloader = MediaIoBaseDownload(fh, request)
-                            done = False
-                            while done is False:
-                                status, done = downloader.next_chunk()
-                            fh.close()
-                            
-                            print(f"[Watcher Log] Download complete. Parsing .docx file...", flush=True)
-                            script_content = read_docx_text(TEMP_DOCX_DOWNLOAD)
-                            
-                            if os.path.exists(TEMP_DOCX_DOWNLOAD):
-                                os.remove(TEMP_DOCX_DOWNLOAD) 
+                            script_content = future.result()
 
                             if script_content is None:
                                 raise Exception("Failed to read text from .docx file.")
                             
                             if not script_content.lstrip().startswith("<#"):
                                 print(f"[Watcher] ERROR: File {filename} is not a SentScript (missing '<#'). Ignoring.", flush=True)
-                                processed_file_ids.add(file_id) 
-                                save_processed_files(processed_file_ids)
+                                ledger.record(file_id, "drive", "not_sentscript", name=filename,
+                                              project=project_id, script_content=script_content)
                                 continue
 
-                            if verify_and_run_patch(script_content, filename, target_project_path):
+                            if run_patch(script_content, filename, target_project_path):
                                 print(f"[Watcher] Patch script ran successfully for {filename}.", flush=True)
+                                outcome = "applied"
                             else:
                                 print(f"[Watcher] Patch failed or aborted for {filename}.", flush=True)
+                                outcome = "failed"
 
-                            processed_file_ids.add(file_id)
-                            save_processed_files(processed_file_ids)
+                            ledger.record(file_id, "drive", outcome, name=filename,
+                                          project=project_id, script_content=script_content)
 
                         except HttpError as e:
                             print(f"[Drive Watcher] Error processing file {filename}: {e}", flush=True)
+                            if feed:
+                                feed.retry(item)
                         except Exception as e:
                             print(f"[Drive Watcher] A critical error occurred processing {filename}: {e}", flush=True)
+                            if feed:
+                                feed.retry(item)
+
+                if feed:
+                    feed.commit()
                 
                 if new_files_found == 0:
                     print(f"[{time.ctime()}] No new .docx files found. Sleeping...", end="\r", flush=True)
@@ -383,10 +799,10 @@ def start_drive_watcher():
             except Exception as e:
                 print(f"\n[Drive Watcher] An unexpected error occurred: {e}", flush=True)
             
-            time.sleep(POLL_INTERVAL_SECONDS)
-            
-    except KeyboardInterrupt:
-        print("\n[Drive Watcher] Service stopped by user.")
+            poll_interval = next_poll_interval(poll_interval, new_files_found)
+            sleep(poll_interval)
+    finally:
+        prefetcher.shutdown()
 
 # ==============================================================================
 # --- "ROBOT SURGEON" (TOOL) & SHARED LOGIC ---
@@ -618,6 +1034,8 @@ def main():
     
     watch_parser = subparsers.add_parser("watch", help="Start the watcher service.")
     watch_parser.add_argument("mode", choices=["local", "drive"], help="The type of watcher to run.")
+    watch_parser.add_argument("--sync", choices=["changes", "list"], default="changes",
+                              help="Drive only: follow the Changes API (default) or re-list the 20 newest files each poll (v2.6).")
 
     patch_parser = subparsers.add_parser("patch", help="Patch a block in a file. (Called by patch scripts)")
     patch_parser.add_argument("filepath", help="The file to patch (e.g., 'main.py')")
@@ -637,7 +1055,7 @@ def main():
         if args.mode == "local":
             start_local_watcher()
         elif args.mode == "drive":
-            start_drive_watcher()
+            start_drive_watcher(args.sync)
             
     elif args.command == "patch":
         # This command reads from stdin
@@ -0,0 +1,112 @@
+import io
+import time
+import argparse
+import zipfile
+import tracemalloc
+import Sentinel
+
+# --- Try to import DOCX library (only to compare against) ---
+try:
+    import docx
+    DOCX_INSTALLED = True
+except ImportError:
+    DOCX_INSTALLED = False
+
+# --- .docx Reader Benchmark (v1.0) ---
+# Compares Sentinel's streaming reader (read_docx_text / iter_docx_paragraphs)
+# with the python-docx reader it replaced, on generated patch documents:
+#
+#   python bench_docx.py                          # 1k, 10k, 100k paragraphs
+#   python bench_docx.py --paragraphs 500000
+#
+# Reports the best of --repeat runs and the peak Python heap (tracemalloc).
+# python-docx keeps its tree in lxml's C heap, which tracemalloc does not
+# see, so its peak is a lower bound.
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+DOCUMENT_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+ xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><w:body>"""
+DOCUMENT_END = """<w:sectPr/></w:body></w:document>"""
+
+# A SentScript line, split over runs the way Word saves edited text
+PARAGRAPH = ('<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+             '<w:r><w:t xml:space="preserve">    python Sentinel.py patch main.py </w:t></w:r>'
+             '<w:r><w:rPr><w:b/></w:rPr><w:t>block_{i}</w:t></w:r><w:r><w:tab/><w:t>-</w:t>'
+             '<w:noBreakHyphen/><w:br/><w:t># line {i}</w:t></w:r>'
+             '<w:hyperlink r:id="rId9"><w:r><w:t> (link)</w:t></w:r></w:hyperlink></w:p>')
+TABLE = '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>cell text is not a body paragraph</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+
+# -------------------------------------------
+
+def make_docx(paragraphs):
+    """A .docx (bytes) with `paragraphs` body paragraphs, written without holding the XML in memory."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", CONTENT_TYPES)
+        package.writestr("_rels/.rels", PACKAGE_RELS)
+        with package.open("word/document.xml", 'w') as part:
+            part.write(DOCUMENT_START.encode('utf-8'))
+            part.write('<w:p><w:r><w:t>&lt;# SentScript</w:t></w:r></w:p>'.encode('utf-8'))
+            for i in range(paragraphs):
+                part.write(PARAGRAPH.format(i=i).encode('utf-8'))
+                if i % 1000 == 0:
+                    part.write(TABLE.encode('utf-8'))
+            part.write(DOCUMENT_END.encode('utf-8'))
+    return buffer.getvalue()
+
+def python_docx_text(data):
+    """The v2.6 reader."""
+    document = docx.Document(io.BytesIO(data))
+    return "\n".join(para.text for para in document.paragraphs)
+
+def streamed_length(data):
+    """Consumes paragraphs one at a time, never holding the whole text."""
+    return sum(len(text) + 1 for text in Sentinel.iter_docx_paragraphs(data))
+
+def measure(fn, data, repeat):
+    """Returns (result, best seconds, peak traced bytes)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Sentinel's .docx reader against python-docx.")
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not DOCX_INSTALLED:
+        print("python-docx is not installed: only the streaming reader is measured. (pip install python-docx)")
+
+    for paragraphs in args.paragraphs:
+        data = make_docx(paragraphs)
+        print(f"\n{paragraphs} paragraphs ({len(data) / 1e6:.1f} MB .docx):")
+        text, seconds, peak = measure(Sentinel.read_docx_text, data, args.repeat)
+        print(f"  read_docx_text       {seconds * 1000:8.1f} ms  peak {peak / 1e6:7.1f} MB")
+        _, seconds, peak = measure(streamed_length, data, args.repeat)
+        print(f"  iter_docx_paragraphs {seconds * 1000:8.1f} ms  peak {peak / 1e6:7.1f} MB  (streamed)")
+        if DOCX_INSTALLED:
+            expected, seconds, peak = measure(python_docx_text, data, args.repeat)
+            print(f"  python-docx          {seconds * 1000:8.1f} ms  peak {peak / 1e6:7.1f} MB+ (lxml not counted)")
+            print(f"  Same text: {'yes' if text == expected else 'NO'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import io
+import re
+import argparse
+import datetime
+import zipfile
+import contextlib
+from xml.sax.saxutils import escape
+import Sentinel
+
+# --- Fake Google Drive (v1.0) ---
+# An in-memory stand-in for the googleapiclient Drive v3 service, covering
+# only what Sentinel's Drive watcher calls:
+#
+#   files().list(q, pageSize, orderBy, pageToken)  files().get_media(fileId)
+#   changes().getStartPageToken()                  changes().list(pageToken, pageSize)
+#
+# Every call returns a request object with .execute(), like the real
+# client. Time is a virtual clock (`service.now`, in seconds), so the
+# watcher's real poll loop (Sentinel.run_drive_watcher) can run offline
+# and instantly, in either sync mode:
+#
+#   python fake_drive.py                 # default scenario
+#   python fake_drive.py --burst 200     # 200 patches land at once
+#
+# measures, for "list" and "changes" sync, how long each patch took to be
+# run, how many never were, and how many API requests (polls and
+# downloads) it cost. changes().list can also be made to fail, to run
+# the watcher's expired-token re-sync (410) and error-retry (503) paths:
+#
+#   python fake_drive.py --token-resets 3 --outages 3
+
+# -------------------------------------------
+
+class FakeResponse(dict):
+    """Stands in for the httplib2.Response an HttpError carries (a dict of headers)."""
+    def __init__(self, status, reason=""):
+        super().__init__({"status": str(status)})
+        self.status = status
+        self.reason = reason
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn = fn
+
+    def execute(self):
+        self._service.calls += 1
+        return self._fn()
+
+
+class FakeFiles:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, q="", pageSize=100, orderBy=None, fields=None, pageToken=None):
+        def run():
+            items = [item for item in self._service.metadata.values() if self._service.matches(item, q)]
+            if orderBy:
+                key, _, direction = orderBy.partition(" ")
+                items.sort(key=lambda item: item[key], reverse=(direction == "desc"))
+            start = int(pageToken or 0)
+            page = items[start:start + pageSize]
+            response = {"files": [dict(item) for item in page]}
+            if start + pageSize < len(items):
+                response["nextPageToken"] = str(start + pageSize)
+            return response
+        return FakeRequest(self._service, run)
+
+    def get_media(self, fileId):
+        return FakeRequest(self._service, lambda: self._service.contents[fileId])
+
+
+class FakeChanges:
+    def __init__(self, service):
+        self._service = service
+
+    def getStartPageToken(self):
+        return FakeRequest(self._service, lambda: {"startPageToken": str(len(self._service.log))})
+
+    def list(self, pageToken, pageSize=100, spaces=None, fields=None):
+        def run():
+            if self._service.failures:
+                status = self._service.failures.pop(0)
+                raise Sentinel.HttpError(FakeResponse(status, "Simulated"), b"")
+            start = int(pageToken)
+            log = self._service.log[start:start + pageSize]
+            changes = []
+            for file_id in log:
+                item = self._service.metadata.get(file_id)
+                if item is None:
+                    changes.append({"fileId": file_id, "removed": True})
+                else:
+                    changes.append({"fileId": file_id, "removed": False, "file": dict(item)})
+            response = {"changes": changes}
+            if start + pageSize < len(self._service.log):
+                response["nextPageToken"] = str(start + pageSize)
+            else:
+                response["newStartPageToken"] = str(len(self._service.log))
+            return response
+        return FakeRequest(self._service, run)
+
+
+class FakeDriveService:
+    """
+    Drive files and a change log. Add files with add_file(); advance `now`
+    yourself. fail_changes(410, 503) makes the next changes().list calls
+    raise HttpError with those statuses.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.calls = 0
+        self.metadata = {}  # id -> file metadata
+        self.contents = {}  # id -> bytes
+        self.log = []       # file ids, one entry per change
+        self.failures = []  # HTTP statuses for the next changes().list calls
+
+    def fail_changes(self, *statuses):
+        self.failures.extend(statuses)
+
+    def files(self):
+        return FakeFiles(self)
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def add_file(self, name, content=b"", mime_type=Sentinel.DOCX_MIME_TYPE):
+        file_id = f"fake-{len(self.metadata) + 1:06d}"
+        created = datetime.datetime.fromtimestamp(self.now, datetime.timezone.utc)
+        self.metadata[file_id] = {
+            "id": file_id,
+            "name": name,
+            "mimeType": mime_type,
+            "createdTime": created.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "trashed": False,
+        }
+        self.contents[file_id] = content
+        self.log.append(file_id)
+        return file_id
+
+    def trash_file(self, file_id):
+        self.metadata[file_id]["trashed"] = True
+        self.log.append(file_id)
+
+    @staticmethod
+    def matches(item, q):
+        """Understands the clauses Sentinel's DRIVE_QUERY uses."""
+        for value in re.findall(r"mimeType='([^']*)'", q):
+            if item["mimeType"] != value:
+                return False
+        for value in re.findall(r"name starts with '([^']*)'", q):
+            if not item["name"].startswith(value):
+                return False
+        return not item["trashed"]
+
+# -------------------------------------------
+
+class SimulationEnd(Exception):
+    """Raised by the virtual clock to stop the watcher loop."""
+
+def make_patch_docx(text):
+    """A minimal .docx (bytes) holding `text`, one paragraph per line."""
+    paragraphs = "".join(f'<w:p><w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>'
+                         for line in text.split("\n"))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as package:
+        package.writestr("word/document.xml",
+                         '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                         f'<w:body>{paragraphs}</w:body></w:document>')
+    return buffer.getvalue()
+
+def fake_download(service, file_id):
+    return io.BytesIO(service.files().get_media(fileId=file_id).execute())
+
+def simulate(sync, arrivals, duration, failures=()):
+    """
+    Runs Sentinel.run_drive_watcher (the real poll loop) in virtual time
+    against a fake service: the loop's sleep() advances the clock and
+    delivers the patches due by then, and "approving" a patch records
+    when it was seen. `arrivals` is a list of (time, filename);
+    `failures` a list of (time, HTTP status) for changes().list to fail
+    with from then on. Returns a dict of measurements.
+    """
+    service = FakeDriveService()
+    ledger = Sentinel.ProcessedLedger(":memory:", legacy_json="")
+    arrivals = sorted(arrivals)
+    failures = sorted(failures)
+    arrived = {} # filename -> arrival time
+    seen = {}    # filename -> time its patch was run
+    state = {"next_arrival": 0, "next_failure": 0, "polls": 0}
+
+    def deliver():
+        while state["next_arrival"] < len(arrivals) and arrivals[state["next_arrival"]][0] <= service.now:
+            arrival_time, filename = arrivals[state["next_arrival"]]
+            service.add_file(filename, make_patch_docx(f"<# {filename} #>\nWrite-Host 'patched'"))
+            arrived[filename] = arrival_time
+            state["next_arrival"] += 1
+        while state["next_failure"] < len(failures) and failures[state["next_failure"]][0] <= service.now:
+            service.fail_changes(failures[state["next_failure"]][1])
+            state["next_failure"] += 1
+
+    def sleep(seconds):
+        state["polls"] += 1
+        service.now += seconds
+        if service.now > duration:
+            raise SimulationEnd()
+        deliver()
+
+    def run_patch(script_content, filename, target_project_path):
+        seen[filename] = service.now
+        return True
+
+    deliver()
+    prefetcher = Sentinel.DrivePrefetcher(lambda: service, download=fake_download)
+    with contextlib.redirect_stdout(io.StringIO()): # The loop's console output
+        try:
+            Sentinel.run_drive_watcher(service, ledger, sync, prefetcher, sleep=sleep, run_patch=run_patch,
+                                       get_config=lambda: {"proj-b6cc": "."})
+        except SimulationEnd:
+            pass
+
+    latencies = [seen[filename] - arrived[filename] for filename in seen]
+    ledger.close()
+    return {
+        "sync": sync,
+        "arrived": len(arrived),
+        "missed": len(arrived) - len(seen),
+        "mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+        "max_latency": max(latencies) if latencies else 0.0,
+        "polls": state["polls"],
+        "api_calls": service.calls,
+        "failures": state["next_failure"] - len(service.failures), # The ones that were hit
+    }
+
+def scenario(burst, trickle, duration):
+    """A steady trickle of patches plus one burst a third of the way in."""
+    arrivals = []
+    for i in range(trickle):
+        arrivals.append((duration * i / max(trickle, 1), f"SentScript-proj-b6cc-Trickle{i}.docx"))
+    for i in range(burst):
+        arrivals.append((duration / 3, f"SentScript-proj-b6cc-Burst{i}.docx"))
+    return arrivals
+
+def failure_plan(token_resets, outages, duration):
+    """Evenly spaced 410s (expired page token) and 503s (Drive unavailable)."""
+    failures = [(duration * (i + 1) / (token_resets + 1), 410) for i in range(token_resets)]
+    failures += [(duration * (i + 0.5) / (outages + 1), 503) for i in range(outages)]
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Sentinel's Drive sync modes against a fake Drive.")
+    parser.add_argument("--burst", type=int, default=50, help="Patches that land at the same moment.")
+    parser.add_argument("--trickle", type=int, default=20, help="Patches spread over the run.")
+    parser.add_argument("--duration", type=float, default=3600, help="Virtual seconds to simulate.")
+    parser.add_argument("--token-resets", type=int, default=1, help="Times changes().list rejects the page token (410).")
+    parser.add_argument("--outages", type=int, default=1, help="Times changes().list fails with a 503.")
+    args = parser.parse_args()
+
+    arrivals = scenario(args.burst, args.trickle, args.duration)
+    failures = failure_plan(args.token_resets, args.outages, args.duration)
+    print(f"{len(arrivals)} patches over {args.duration:.0f}s (burst of {args.burst}), "
+          f"{args.token_resets} token reset(s) and {args.outages} outage(s) in changes sync:")
+    for sync in ("list", "changes"):
+        result = simulate(sync, arrivals, args.duration, failures)
+        print(f"  {result['sync']:>7}: missed {result['missed']:>4}, "
+              f"latency mean {result['mean_latency']:5.1f}s max {result['max_latency']:5.1f}s, "
+              f"{result['polls']} polls, {result['api_calls']} API calls, {result['failures']} failed polls")
+
+if __name__ == "__main__":
+    main()